@@ -31,12 +31,19 @@ setup(
         "pint",
         "pysmt",
         "sbol3",
-        "z3-solver",
+        "z3-solver>=4.13.1",  # Solver.set_initial_value
         # "plotly>=5.3.1",
         "pandas",
+        "numpy",
         "graphviz",
     ],
     tests_require=["pytest"],
+    entry_points={
+        "console_scripts": [
+            "labop-check = labop_check.cli:main",
+            "labop-check-server = labop_check.server:main",
+        ],
+    },
     zip_safe=False,
 )
 
@@ -3,10 +3,15 @@ import paml_time as pamlt  # May be unused but is required to access paml_time v
 import pysmt
 import pysmt.shortcuts
 import sbol3
-from paml_check.minimize_duration import MinimizeDuration
+import uml
 from paml_check.protocol import Protocol, TimeConstraints
+from paml_check.schedule import Schedule
+from paml_check.solver import ProblemSolver
+from paml_check.stats import timed
+from paml_check.temporal_problem import TemporalProblem
 import graphviz
 
+import hashlib
 import logging
 
 l = logging.getLogger(__file__)
@@ -15,14 +20,22 @@ l.setLevel(logging.ERROR)
 
 class ActivityGraph:
 
-    def __init__(self, doc: sbol3.Document, epsilon=0.0001, infinity=10e10, destructive=False):
-        if destructive:
-            self.doc = doc
-        else:
-            # TODO there may be a more efficient way to clone a sbol3 Document
-            # write the original doc to a string and then read it in as a new doc
-            self.doc = sbol3.Document()
-            self.doc.read_string(doc.write_string('ttl'), 'ttl')
+    def __init__(self, doc: sbol3.Document, epsilon=0.0001, infinity=10e10, destructive=False, stats=None,
+                 roots=None):
+        """
+        :param doc: document containing the protocols and time constraints
+        :param epsilon:
+        :param infinity:
+        :param destructive: build the graph from doc directly rather than a copy
+        :param stats: CheckStats to record phase timings and counts in
+        :param roots: protocols (or their identities) to build.  Only these,
+            the sub-protocols they call, and the TimeConstraints that refer
+            to no other protocols are included.  None includes everything.
+        """
+        self.stats = stats
+        self.roots = roots
+        self.destructive = destructive
+        self.doc = self._copy_doc(doc)
 
         self.name = f"Protcol Document: {doc.graph().identifier}"
         self.epsilon = epsilon
@@ -30,18 +43,35 @@ class ActivityGraph:
         self.variables = {}
         self.protocols = {}
         self.time_constraints = {}
-        self._process_doc()
+        self._problem = None
+        self._assignment = None
+        with timed(stats, "build"):
+            self._process_doc()
+            # Hash the content now, since with destructive=True the document
+            # is edited in place and update() cannot see the old version
+            self._hashes = self._content_hashes(list(self.protocols) + list(self.time_constraints))
+        if stats is not None:
+            self._count(stats)
 
-    def _process_doc(self):
-        sbol3.set_namespace('https://bbn.com/scratch/')
+    def _copy_doc(self, doc):
+        if self.destructive:
+            return doc
+        # TODO there may be a more efficient way to clone a sbol3 Document
+        # write the original doc to a string and then read it in as a new doc
+        with timed(self.stats, "clone"):
+            copy = sbol3.Document()
+            copy.read_string(doc.write_string('ttl'), 'ttl')
+        return copy
 
-        protocols = self.doc.find_all(lambda obj: isinstance(obj, paml.Protocol))
+    def _find_time_constraints(self, protocols):
         time_constraints = self.doc.find_all(lambda obj: isinstance(obj, pamlt.TimeConstraints))
-        # FIXME find_all seems to return duplicates
-        p_count = len(protocols)
-        protocols = list(set(protocols))
-        if p_count != len(protocols):
-            l.warning(("Removed duplicate protocols returned from find_all"))
+        if self.roots is not None:
+            time_constraints = [tc for tc in time_constraints if self._in_slice(tc, protocols)]
+        return time_constraints
+
+    def _process_doc(self):
+        protocols = self._find_protocols()
+        time_constraints = self._find_time_constraints(protocols)
         for protocol in protocols:
             l.info(f"Initializing protocol: {protocol.identity}")
             self.protocols[protocol.identity] = Protocol(protocol, self.epsilon, self.infinity)
@@ -54,6 +84,152 @@ class ActivityGraph:
             l.info(f"Initializing time constraints: {time_constraint.identity}")
             self.time_constraints[time_constraint.identity] = TimeConstraints(time_constraint, self)
 
+    def update(self, doc):
+        """
+        Bring the graph up to date with a new version of its document.
+        Protocols and TimeConstraints are compared by a hash of their
+        content, and only those that were added or changed are rebuilt.
+        :param doc: new version of the document
+        :return: dict of the "added", "removed" and "changed" protocol and
+            time constraint identities
+        """
+        self.doc = self._copy_doc(doc)
+        protocols = self._find_protocols()
+        time_constraints = self._find_time_constraints(protocols)
+        hashes = self._content_hashes([p.identity for p in protocols] + [tc.identity for tc in time_constraints])
+        changes = {"added": [], "removed": [], "changed": []}
+        for identity, content_hash in hashes.items():
+            if identity not in self._hashes:
+                changes["added"].append(identity)
+            elif content_hash != self._hashes[identity]:
+                changes["changed"].append(identity)
+        changes["removed"] = [identity for identity in self._hashes if identity not in hashes]
+        with timed(self.stats, "build"):
+            self.refresh(changes["added"] + changes["changed"] + changes["removed"])
+        self._hashes = hashes
+        return changes
+
+    def refresh(self, identities):
+        """
+        Rebuild the given protocols and TimeConstraints from the graph's
+        document, after they were added, edited or removed there.  Protocols
+        are relinked, and TimeConstraints that refer to a rebuilt protocol are
+        extracted again.  Everything else is kept.
+        :param identities: identities of protocols and TimeConstraints
+        :return:
+        """
+        identities = {str(identity) for identity in identities}
+        protocols = {p.identity: p for p in self._find_protocols()}
+        time_constraints = {tc.identity: tc for tc in self._find_time_constraints(list(protocols.values()))}
+
+        rebuilt = set()
+        for identity in identities:
+            self.protocols.pop(identity, None)
+            if identity in protocols:
+                l.info(f"Rebuilding protocol: {identity}")
+                self.protocols[identity] = Protocol(protocols[identity], self.epsilon, self.infinity)
+                rebuilt.add(identity)
+        # Drop protocols that are no longer reachable from the roots
+        for identity in [p for p in self.protocols if p not in protocols]:
+            del self.protocols[identity]
+            rebuilt.add(identity)
+        self.link_protocols()
+
+        for identity in list(self.time_constraints):
+            if identity not in time_constraints:
+                del self.time_constraints[identity]
+        for identity, time_constraint in time_constraints.items():
+            referenced = {str(p) for p in time_constraint.protocols}
+            if identity in identities or identity not in self.time_constraints or referenced & (rebuilt | identities):
+                self.time_constraints[identity] = TimeConstraints(time_constraint, self)
+        self._problem = None
+
+    def recheck(self, limits=None):
+        """
+        Check the graph, giving the solver the values of the previous
+        recheck as a starting point.  After a small edit most of the
+        previous schedule still holds, so the solver has less to search.
+        :param limits: SolverLimits for the check
+        :return: Schedule or None
+        """
+        problem = self.compile()
+        with ProblemSolver(problem, limits=limits, stats=self.stats) as solver:
+            if self._assignment:
+                solver.set_initial_values(self._assignment)
+            if not solver.check():
+                return None
+            self._assignment = solver.get_assignment()
+        with timed(self.stats, "schedule"):
+            return Schedule(self._assignment, problem)
+
+    def _content_hashes(self, identities):
+        """
+        Hash the triples of each object and its children in the document
+        :param identities: identities of top level objects
+        :return: dict from identity to hex digest
+        """
+        identities = set(identities)
+        triples = {identity: [] for identity in identities}
+        for s, p, o in self.doc.graph():
+            # Child objects have identities under their parent's
+            owner = str(s)
+            while owner not in identities and "/" in owner:
+                owner = owner.rsplit("/", 1)[0]
+            if owner in identities:
+                triples[owner].append(f"{s.n3()} {p.n3()} {o.n3()}")
+        return {identity: hashlib.sha256("\n".join(sorted(lines)).encode("utf-8")).hexdigest()
+                for identity, lines in triples.items()}
+
+    def _count(self, stats):
+        protocols = self.protocols.values()
+        stats.set_count("protocols", len(self.protocols))
+        stats.set_count("nodes", sum(len(p.ref.nodes) for p in protocols))
+        stats.set_count("edges", sum(len(p.ref.edges) for p in protocols))
+        stats.set_count("time_variables", sum(len(grp) for p in protocols for grp in p.time_variable_groups.values()))
+        stats.set_count("time_edges", sum(len(p.time_edges) for p in protocols))
+        stats.set_count("time_constraints", len(self.time_constraints))
+
+    def _find_protocols(self):
+        if self.roots is None:
+            protocols = self.doc.find_all(lambda obj: isinstance(obj, paml.Protocol))
+            # FIXME find_all seems to return duplicates
+            p_count = len(protocols)
+            protocols = list(set(protocols))
+            if p_count != len(protocols):
+                l.warning(("Removed duplicate protocols returned from find_all"))
+            return protocols
+
+        # The roots and the sub-protocols reachable through their calls
+        protocols = {}
+        pending = [self._find_protocol(root) for root in self.roots]
+        while pending:
+            protocol = pending.pop()
+            if protocol.identity in protocols:
+                continue
+            protocols[protocol.identity] = protocol
+            for node in protocol.nodes:
+                if isinstance(node, uml.CallBehaviorAction) and node.behavior is not None:
+                    behavior = self.doc.find(str(node.behavior))
+                    if isinstance(behavior, paml.Protocol):
+                        pending.append(behavior)
+        return list(protocols.values())
+
+    def _find_protocol(self, root):
+        identity = str(getattr(root, "identity", root))
+        protocol = self.doc.find(identity)
+        if not isinstance(protocol, paml.Protocol):
+            raise ValueError(f"Document has no protocol with identity '{identity}'")
+        return protocol
+
+    def _in_slice(self, time_constraint, protocols):
+        sliced = {protocol.identity for protocol in protocols}
+        referenced = {str(protocol) for protocol in time_constraint.protocols}
+        if referenced <= sliced:
+            return True
+        if referenced & sliced:
+            l.warning(f"Skipping time constraints '{time_constraint.identity}' that also refer to protocols outside of the slice")
+        return False
+
     def print_debug(self):
         try:
             for _, protocol in self.protocols.items():
@@ -88,18 +264,27 @@ class ActivityGraph:
         for protocol_id, protocol in self.protocols.items():
             protocol.link_protocols(self.protocols)
 
-    def generate_constraints(self):
-        protocol_constraints = []
-        for _, protocol in self.protocols.items():
-            protocol_constraints.append(protocol.generate_constraints())
-        #if len(protocol_constraints) == 1:
-        #    return protocol_constraints[0]
-
-        custom_constraints = []
-        for _, time_constraint in self.time_constraints.items():
-            custom_constraints.append(time_constraint.extract_time_constraints())
+    def compile(self):
+        """
+        Compile the graph into a self-contained TemporalProblem.  The problem
+        does not reference the document, so the graph and document can be
+        released once it is built.
+        :return: TemporalProblem
+        """
+        if self._problem is None:
+            with timed(self.stats, "compile"):
+                self._problem = TemporalProblem.from_activity_graph(self)
+            if self.stats is not None:
+                self._problem.count(self.stats)
+        return self._problem
 
-        return pysmt.shortcuts.And(protocol_constraints + custom_constraints)
+    def generate_constraints(self, mgr=None):
+        """
+        Build the formula for all protocols and time constraints
+        :param mgr: formula manager to build with (default: global environment)
+        :return: formula
+        """
+        return self.compile().to_formula(mgr)
 
 
     # def add_result(self, doc, result):
@@ -113,7 +298,7 @@ class ActivityGraph:
     #     return doc
 
     def get_end_time_var(self, protocol):
-        return self.protocols[protocol.identity].final_time_variables.end.symbol
+        return self.protocols[protocol.identity].final_time_variables.end.to_symbol()
 
     def get_duration(self, model, protocol):
         """
@@ -155,24 +340,71 @@ class ActivityGraph:
     #             activity.duration.value = calculate_duration(activity)
     #     return doc
 
-    def get_minimum_duration(self):
+    def get_minimum_duration(self, limits=None, deadline=None, callback=None, processes=None, hint=None):
         """
         Find the minimum duration for the protocol.
         Solver is SMT, so do a binary search on the duration bound.
-        :return: minimum duration
+        The search runs in a private solver environment, so it is safe to
+        call from several threads.
+        :param limits: SolverLimits for the whole search
+        :param deadline: time.monotonic() value at which to stop searching and
+            report the best durations found so far
+        :param callback: called with (protocol id, supremum, infimum, incumbent)
+            after each solver call of the search
+        :param processes: if the graph has disjunctive constraints, probe
+            this many bounds at once in worker processes
+        :param hint: model to start the search from (default: the model of
+            the last recheck)
+        :return: dict of "duration", "lower_bound", "converged" and "result"
+            (the model), indexed by protocol id
         """
 
-        base_formula = self.generate_constraints()
-        result = pysmt.shortcuts.get_model(base_formula)
-        min_duration = {protocol: None for protocol in self.protocols}
-        if result:
-            for protocol_id, protocol in self.protocols.items():
-                # TODO push Protocol object through
-                supremum_duration = self.get_duration(result, protocol.ref)
-                minimum_duration, minimum_result = \
-                    MinimizeDuration(base_formula, self, protocol.ref) \
-                        .minimize(supremum_duration, incumbent_result=result)
-                min_duration[protocol_id] = { "duration" : minimum_duration, "result" : minimum_result }
+        return self.compile().get_minimum_duration(limits=limits, deadline=deadline, callback=callback,
+                                                   stats=self.stats, processes=processes,
+                                                   hint=hint if hint is not None else self._assignment)
 
+    def get_joint_minimum_duration(self, weights=None, order=None, makespan=False, limits=None):
+        """
+        Minimize the end times of all protocols together.  Unlike
+        get_minimum_duration, which minimizes each protocol while leaving
+        the others free, this finds one schedule for all protocols, which
+        matters when constraints link them.
+        :param weights: dict from protocol id to the weight of its end time
+            in a weighted sum (default: 1.0 for every protocol)
+        :param order: protocol ids whose end times are minimized
+            lexicographically, in order, before the weighted sum of the others
+        :param makespan: first minimize the latest end time of any protocol
+        :param limits: SolverLimits for the optimization
+        :return: (Schedule, dict from protocol id to its duration), or
+            (None, None) if the graph is infeasible
+        """
+        problem = self.compile()
+        assignment, durations = problem.get_joint_minimum_duration(weights=weights, order=order, makespan=makespan,
+                                                                   limits=limits, stats=self.stats)
+        if assignment is None:
+            return None, None
+        return Schedule(assignment, problem), durations
 
-        return min_duration
\ No newline at end of file
+    def explain(self, limits=None, minimal=True):
+        """
+        Find the edges, joins and custom constraints that make the graph
+        infeasible, and the activities they relate
+        :param limits: SolverLimits for the solver calls
+        :param minimal: shrink the explanation until no part can be dropped,
+            at the cost of one solver call per part
+        :return: Explanation, or None if the graph is feasible
+        """
+        return self.compile().explain(limits=limits, minimal=minimal, stats=self.stats)
+
+    def get_time_windows(self, horizon=None, limits=None):
+        """
+        Find the earliest and latest start and end of each activity, its
+        slack, and the critical path of each protocol.  The windows come
+        from shortest paths over the temporal network, after a single
+        solver call for a schedule.
+        :param horizon: latest end time of the protocols, a number or a dict
+            indexed by protocol id (default: their earliest end times)
+        :param limits: SolverLimits for the solver call
+        :return: TimeWindows, or None if the graph is infeasible
+        """
+        return self.compile().get_time_windows(horizon=horizon, limits=limits, stats=self.stats)
@@ -0,0 +1,123 @@
+"""
+Earliest and latest times, slack and critical paths of the activities of a
+problem, from shortest paths in its simple temporal network
+"""
+import pandas as pd
+
+from paml_check.solver import ProblemSolver
+from paml_check.stn import SimpleTemporalNetwork
+
+
+class TimeWindows:
+    """
+    The window in which each activity can start and end, and the critical
+    path of each protocol.  Times are in seconds from the start of the
+    schedule.
+    """
+
+    def __init__(self, problem, earliest, latest, epsilon):
+        """
+        :param problem: TemporalProblem
+        :param earliest: dict from timepoint name to earliest time
+        :param latest: dict from timepoint name to latest time
+        :param epsilon: slack at or below which an activity is critical
+        """
+        self.problem = problem
+        self.earliest = earliest
+        self.latest = latest
+        self.epsilon = epsilon
+
+    def window(self, activity):
+        """
+        :param activity: activity identity
+        :return: dict of earliest_start, latest_start, earliest_end,
+            latest_end and slack (latest_start - earliest_start)
+        """
+        start, end = f"start_{activity}", f"end_{activity}"
+        return dict(earliest_start=self.earliest[start],
+                    latest_start=self.latest[start],
+                    earliest_end=self.earliest[end],
+                    latest_end=self.latest[end],
+                    slack=self.latest[start] - self.earliest[start])
+
+    def activities(self, protocol_id=None):
+        """
+        :param protocol_id: a protocol identity (default: all protocols)
+        :return: identities of the activities with timepoints
+        """
+        protocol_ids = [protocol_id] if protocol_id is not None else list(self.problem.protocol_nodes)
+        return [node for p in protocol_ids for node in self.problem.protocol_nodes[p]
+                if f"start_{node}" in self.earliest and f"end_{node}" in self.earliest]
+
+    def critical_path(self, protocol_id, only_activities=True):
+        """
+        The activities of a protocol that cannot slip without delaying it
+        :param protocol_id: protocol identity
+        :param only_activities: only include CallBehaviorAction activities
+        :return: list of activity identities, ordered by earliest start
+        """
+        critical = [activity for activity in self.activities(protocol_id)
+                    if self.window(activity)["slack"] <= self.epsilon and
+                    (not only_activities or self.problem.node_kinds.get(activity) == "CallBehaviorAction")]
+        return sorted(critical, key=lambda activity: self.earliest[f"start_{activity}"])
+
+    def critical_paths(self, only_activities=True):
+        """
+        :return: dict from protocol identity to its critical path
+        """
+        return {protocol_id: self.critical_path(protocol_id, only_activities=only_activities)
+                for protocol_id in self.problem.protocols}
+
+    def to_df(self, only_activities=True):
+        """
+        :param only_activities: only include CallBehaviorAction activities
+        :return: DataFrame with a row per activity, ordered by earliest start
+        """
+        df = pd.DataFrame([
+            dict(Activity=activity, **self.window(activity))
+            for activity in self.activities()
+            if not only_activities or self.problem.node_kinds.get(activity) == "CallBehaviorAction"
+        ], columns=["Activity", "earliest_start", "latest_start", "earliest_end", "latest_end", "slack"])
+        return df.sort_values(by="earliest_start")
+
+
+def time_windows(problem, assignment=None, horizon=None, limits=None, stats=None):
+    """
+    Compute the earliest and latest times of every timepoint in two
+    shortest path passes over the problem's simple temporal network, rather
+    than solving for the bounds of each timepoint.  Disjunctive edges and
+    constraints keep the choices made by assignment, so with disjunctions
+    the windows are those of the schedules that make the same choices.
+    :param problem: TemporalProblem
+    :param assignment: a model of the problem (default: solve for one)
+    :param horizon: latest end time of each protocol, as a number for all
+        protocols or a dict indexed by protocol identity (default: the
+        earliest end of each protocol, so that activities on the critical
+        path have no slack)
+    :param limits: SolverLimits for solving for a model
+    :param stats: CheckStats to record the solver call in
+    :return: TimeWindows, or None if the problem is infeasible
+    """
+    if assignment is None:
+        with ProblemSolver(problem, limits=limits, stats=stats) as solver:
+            if not solver.check():
+                return None
+            assignment = solver.get_assignment()
+    network = SimpleTemporalNetwork.from_problem(problem, assignment)
+    if network.initialize([assignment.get(name) for name in problem.timepoints]):
+        return None
+    earliest = network.earliest()
+
+    ends = []
+    for protocol_id, (_, end) in problem.protocols.items():
+        if isinstance(horizon, dict):
+            latest_end = horizon.get(protocol_id, network.lower[end])
+        elif horizon is not None:
+            latest_end = horizon
+        else:
+            latest_end = network.lower[end]
+        network.add_bound(end, 0.0, latest_end, ("horizon", protocol_id))
+        ends.append(end)
+    if network.propagate(ends):
+        return None
+    return TimeWindows(problem, earliest, network.latest(), problem.epsilon)
@@ -0,0 +1,6 @@
+"""
+Benchmarks of the checker on synthetic protocols
+"""
+from .generator import generate_document
+from .runner import (DEFAULT_CASES, PHASES, compare_results, load_results, measure, run_benchmark,
+                     run_case, save_results)
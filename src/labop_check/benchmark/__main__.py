@@ -0,0 +1,51 @@
+"""
+Run the benchmarks, or compare stored results:
+
+    python -m labop_check.benchmark run --output results.json
+    python -m labop_check.benchmark compare baseline.json results.json
+"""
+import argparse
+import sys
+
+from .runner import BACKENDS, compare_results, format_result, load_results, run_benchmark, save_results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the checker on synthetic protocols")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="measure the default cases")
+    run.add_argument("--output", default=None, help="save results to this file")
+    run.add_argument("--repeat", type=int, default=3, help="measurements per case")
+    run.add_argument("--no-minimize", dest="minimize", action="store_false",
+                     help="skip the minimum duration search")
+    run.add_argument("--backend", dest="backends", action="append", choices=BACKENDS, default=None,
+                     help="also time the solve with this backend (z3 is always timed)")
+    run.add_argument("--baseline", default=None, help="compare with results in this file")
+    run.add_argument("--tolerance", type=float, default=0.25, help="allowed fractional slowdown")
+
+    compare = commands.add_parser("compare", help="compare two result files")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--tolerance", type=float, default=0.25, help="allowed fractional slowdown")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        results = run_benchmark(repeat=args.repeat, minimize=args.minimize, backends=["z3"] + (args.backends or []),
+                                callback=lambda result: print(format_result(result), flush=True))
+        if args.output:
+            save_results(results, args.output)
+        if not args.baseline:
+            return 0
+        baseline = load_results(args.baseline)
+    else:
+        baseline, results = load_results(args.baseline), load_results(args.current)
+
+    regressions = compare_results(baseline, results, tolerance=args.tolerance)
+    for case, phase, before, after in regressions:
+        print(f"Regression in {phase} for {case}: {before:.4f}s -> {after:.4f}s")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
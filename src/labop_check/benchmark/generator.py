@@ -0,0 +1,142 @@
+"""
+Generate synthetic labop protocols of configurable size and shape
+"""
+import random
+
+import labop
+import labop_time as labopt
+import sbol3
+import tyto
+import uml
+
+NAMESPACE = "https://bbn.com/benchmark/"
+
+
+def generate_document(steps=10, width=1, depth=0, duration_constraints=0, time_constraints=0,
+                      disjunctive_constraints=0, alternatives=2, exclusive_constraints=0, seed=0,
+                      namespace=NAMESPACE):
+    """
+    Generate a document with a top level protocol and a chain of nested
+    sub-protocols.  Each protocol has the given number of primitive steps,
+    arranged in stages of up to width steps that run in parallel between a
+    fork and a join.  Each protocol but the innermost calls the next one as
+    its first step.
+    Note: sets the global sbol3 namespace.
+    :param steps: primitive steps in each protocol
+    :param width: steps in each fork/join stage
+    :param depth: levels of sub-protocol nesting below the top level protocol
+    :param duration_constraints: number of step DurationConstraints
+    :param time_constraints: number of precedence TimeConstraints between
+        steps in different stages, plus one start time constraint
+    :param disjunctive_constraints: number of pairs of steps in the same
+        stage that may run in either order, but not at the same time, as
+        an Or of two precedence constraints
+    :param alternatives: precedence constraints in each Or of the
+        disjunctive constraints.  Beyond the first two, they alternate
+        between the orders with gaps in later, separate windows.
+    :param exclusive_constraints: number of pairs of steps in different
+        stages whose gap is in exactly one of `alternatives` separate
+        windows, as an Xor of precedence constraints
+    :param seed: random seed for choosing constrained steps and bounds
+    :param namespace: sbol3 namespace of the generated objects
+    :return: sbol3.Document
+    """
+    rng = random.Random(seed)
+    sbol3.set_namespace(namespace)
+    doc = sbol3.Document()
+
+    primitives = []
+    for i in range(max(1, width)):
+        primitive = labop.Primitive(f"SyntheticStep{i}")
+        doc.add(primitive)
+        primitives.append(primitive)
+
+    # Build innermost first so that each protocol can call the next
+    protocols = []
+    stages = []
+    callee = None
+    for level in reversed(range(depth + 1)):
+        protocol = labop.Protocol(f"synthetic_protocol_{level}")
+        protocol.name = f"Synthetic protocol at depth {level}"
+        doc.add(protocol)
+        protocol_stages = _add_steps(protocol, primitives, steps, width, callee)
+        protocols.insert(0, protocol)
+        stages.insert(0, protocol_stages)
+        callee = protocol
+
+    constraints = [labopt.startTime(protocols[0], 0, units=tyto.OM.second)]
+    all_steps = [step for protocol_stages in stages for stage in protocol_stages for step in stage]
+    for step in rng.sample(all_steps, min(duration_constraints, len(all_steps))):
+        constraints.append(labopt.duration(step, rng.randint(1, 60), units=tyto.OM.second))
+    for _ in range(time_constraints):
+        protocol_stages = rng.choice(stages)
+        if len(protocol_stages) < 2:
+            continue
+        first, second = sorted(rng.sample(range(len(protocol_stages)), 2))
+        constraints.append(labopt.precedes(rng.choice(protocol_stages[first]),
+                                           [0, rng.randint(60, 3600)],
+                                           rng.choice(protocol_stages[second]),
+                                           units=tyto.OM.second))
+    for _ in range(disjunctive_constraints):
+        protocol_stages = rng.choice(stages)
+        wide = [stage for stage in protocol_stages if len(stage) > 1]
+        if not wide:
+            continue
+        first, second = rng.sample(rng.choice(wide), 2)
+        gap = rng.randint(60, 3600)
+        options = []
+        for i in range(alternatives):
+            before, after = (first, second) if i % 2 == 0 else (second, first)
+            start = 2 * (i // 2) * gap
+            options.append(labopt.precedes(before, [start, start + gap], after, units=tyto.OM.second))
+        constraints.append(labopt.Or(options))
+    for _ in range(exclusive_constraints):
+        protocol_stages = rng.choice(stages)
+        if len(protocol_stages) < 2:
+            continue
+        first, second = sorted(rng.sample(range(len(protocol_stages)), 2))
+        before, after = rng.choice(protocol_stages[first]), rng.choice(protocol_stages[second])
+        gap = rng.randint(60, 3600)
+        constraints.append(labopt.Xor([labopt.precedes(before, [2 * i * gap, (2 * i + 1) * gap], after,
+                                                       units=tyto.OM.second)
+                                       for i in range(alternatives)]))
+
+    doc.add(labopt.TimeConstraints("synthetic_constraints",
+                                   constraints=[labopt.And(constraints)],
+                                   protocols=protocols))
+    return doc
+
+
+def _add_steps(protocol, primitives, steps, width, callee=None):
+    """
+    Add the steps of a protocol in stages.  Stages of one step are ordered
+    directly, wider stages are wrapped in a fork and a join.
+    :return: list of stages, each a list of CallBehaviorActions
+    """
+    width = max(1, width)
+    previous = protocol.initial()
+    if callee is not None:
+        call = protocol.execute_primitive(callee)
+        protocol.order(previous, call)
+        previous = call
+
+    stages = []
+    for first in range(0, steps, width):
+        stage = [protocol.execute_primitive(primitives[i % len(primitives)])
+                 for i in range(first, min(first + width, steps))]
+        stages.append(stage)
+        if len(stage) == 1:
+            protocol.order(previous, stage[0])
+            previous = stage[0]
+            continue
+        fork = uml.ForkNode()
+        join = uml.JoinNode()
+        protocol.nodes.append(fork)
+        protocol.nodes.append(join)
+        protocol.order(previous, fork)
+        for step in stage:
+            protocol.order(fork, step)
+            protocol.order(step, join)
+        previous = join
+    protocol.order(previous, protocol.final())
+    return stages
@@ -0,0 +1,238 @@
+"""
+Measure each phase of checking synthetic protocols, and compare the
+measurements with a stored baseline
+"""
+import json
+import math
+import platform
+import sys
+import time
+
+import pysmt.environment
+
+from paml_check.activity_graph import ActivityGraph
+from paml_check.benchmark.generator import generate_document
+from paml_check.constraints import EXACTLY_ONE_THRESHOLD, Conjunction, Disjunction, ExactlyOne, Negation
+from paml_check.dtp import DisjunctiveTemporalSolver
+from paml_check.schedule import Schedule
+from paml_check.solver import ProblemSolver, SolverLimits, SolverTimeout
+
+PHASES = ("build", "compile", "generate_constraints", "solve", "solve_pairwise", "solve_dtp", "resolve", "minimize",
+          "reminimize", "schedule")
+
+# Cases from small to large along each dimension of the generator
+DEFAULT_CASES = [
+    dict(steps=10, width=1, depth=0, duration_constraints=5, time_constraints=2),
+    dict(steps=50, width=1, depth=0, duration_constraints=25, time_constraints=10),
+    dict(steps=100, width=1, depth=0, duration_constraints=50, time_constraints=20),
+    dict(steps=50, width=5, depth=0, duration_constraints=25, time_constraints=10),
+    dict(steps=100, width=10, depth=0, duration_constraints=50, time_constraints=20),
+    dict(steps=10, width=2, depth=3, duration_constraints=10, time_constraints=5),
+    dict(steps=20, width=4, depth=5, duration_constraints=40, time_constraints=20),
+    dict(steps=20, width=5, depth=0, duration_constraints=20, time_constraints=5, disjunctive_constraints=10),
+    dict(steps=40, width=8, depth=0, duration_constraints=40, time_constraints=10, disjunctive_constraints=40,
+         alternatives=6),
+    dict(steps=40, width=4, depth=0, duration_constraints=20, time_constraints=5, exclusive_constraints=10,
+         alternatives=48),
+]
+
+BACKENDS = ("z3", "dtp")
+
+
+def measure(doc, minimize=True, backends=("z3",), timeout=60.0):
+    """
+    Time each phase of checking a document.  "resolve" and "reminimize"
+    repeat "solve" and "minimize" in new solvers, warm-started from their
+    models, as re-runs of a cached document are.  With "dtp" in backends,
+    "solve_dtp" repeats "solve" with the DisjunctiveTemporalSolver backend,
+    and the sizes record whether it agrees with z3 in "dtp_agrees" (None
+    if it timed out).  For problems with exactly-one constraints large
+    enough for the sequential counter encoding, "solve_pairwise" repeats
+    "solve" with pysmt's quadratic encoding.
+    :param doc: sbol3.Document
+    :param minimize: also time the minimum duration search
+    :param backends: backends to time the solve with.  z3 is always
+        timed, since the other phases use it.
+    :param timeout: seconds the DTP solve may take
+    :return: dict of seconds per phase, and dict of problem sizes
+    """
+    for backend in backends:
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend: {backend}")
+    timings = {}
+
+    start = time.perf_counter()
+    graph = ActivityGraph(doc)
+    timings["build"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    problem = graph.compile()
+    timings["compile"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    problem.to_formula(pysmt.environment.Environment().formula_manager)
+    timings["generate_constraints"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ProblemSolver(problem) as solver:
+        satisfiable = solver.check()
+        assignment = solver.get_assignment() if satisfiable else None
+    timings["solve"] = time.perf_counter() - start
+
+    if _largest_exactly_one(problem) > EXACTLY_ONE_THRESHOLD:
+        start = time.perf_counter()
+        with ProblemSolver(problem, threshold=math.inf) as solver:
+            solver.check()
+        timings["solve_pairwise"] = time.perf_counter() - start
+
+    dtp_agrees = None
+    if "dtp" in backends:
+        start = time.perf_counter()
+        try:
+            with DisjunctiveTemporalSolver(problem, limits=SolverLimits(timeout=timeout)) as solver:
+                dtp_agrees = solver.check() == satisfiable
+            timings["solve_dtp"] = time.perf_counter() - start
+        except SolverTimeout:
+            pass
+
+    if satisfiable:
+        start = time.perf_counter()
+        with ProblemSolver(problem) as solver:
+            solver.set_initial_values(assignment)
+            solver.check()
+        timings["resolve"] = time.perf_counter() - start
+
+    if satisfiable and minimize:
+        start = time.perf_counter()
+        durations = problem.get_minimum_duration()
+        timings["minimize"] = time.perf_counter() - start
+
+        top = list(problem.protocols)[0]
+        start = time.perf_counter()
+        problem.get_minimum_duration(hint=durations[top]["result"])
+        timings["reminimize"] = time.perf_counter() - start
+
+    if satisfiable:
+        start = time.perf_counter()
+        Schedule(assignment, problem)
+        timings["schedule"] = time.perf_counter() - start
+
+    sizes = {
+        "protocols": len(problem.protocols),
+        "timepoints": len(problem.timepoints),
+        "edges": len(problem.edges),
+        "joins": len(problem.joins),
+        "constraints": len(problem.constraints),
+        "satisfiable": satisfiable,
+    }
+    if "dtp" in backends:
+        sizes["dtp_agrees"] = dtp_agrees
+    return timings, sizes
+
+
+def _largest_exactly_one(problem):
+    """
+    :return: the most clauses of any ExactlyOne in the custom constraints
+    """
+    def largest(clause):
+        if isinstance(clause, Negation):
+            return largest(clause.clause)
+        if isinstance(clause, (Conjunction, Disjunction, ExactlyOne)):
+            own = len(clause.clauses) if isinstance(clause, ExactlyOne) else 0
+            return max([own] + [largest(c) for c in clause.clauses])
+        return 0
+    return max([0] + [largest(clause) for _, clause in problem.constraints])
+
+
+def run_case(case, repeat=3, minimize=True, backends=("z3",)):
+    """
+    Generate the document for a case and measure it, keeping the fastest
+    time of each phase over the repeats
+    :param case: generate_document keyword arguments
+    :param repeat: number of measurements
+    :param minimize: also time the minimum duration search
+    :param backends: backends to time the solve with, as in measure
+    :return: result dict with the case, phase timings and problem sizes
+    """
+    doc = generate_document(**case)
+    timings = {}
+    sizes = None
+    for _ in range(repeat):
+        run, sizes = measure(doc, minimize=minimize, backends=backends)
+        for phase, seconds in run.items():
+            timings[phase] = min(seconds, timings.get(phase, seconds))
+    return {"case": case, "timings": timings, "sizes": sizes}
+
+
+def run_benchmark(cases=None, repeat=3, minimize=True, callback=None, backends=("z3",)):
+    """
+    Measure every case
+    :param cases: list of generate_document keyword arguments (default: DEFAULT_CASES)
+    :param repeat: number of measurements per case
+    :param minimize: also time the minimum duration search
+    :param callback: called with each case result as it completes
+    :param backends: backends to time the solve with, as in measure
+    :return: results dict, suitable for save_results
+    """
+    results = []
+    for case in cases if cases is not None else DEFAULT_CASES:
+        result = run_case(case, repeat=repeat, minimize=minimize, backends=backends)
+        if callback:
+            callback(result)
+        results.append(result)
+    return {
+        "environment": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+        },
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def save_results(results, filename):
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load_results(filename):
+    with open(filename, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _case_key(case):
+    return json.dumps(case, sort_keys=True)
+
+
+def compare_results(baseline, current, tolerance=0.25, minimum=0.001):
+    """
+    Find phases that got slower than the baseline
+    :param baseline: results dict
+    :param current: results dict
+    :param tolerance: allowed fractional slowdown
+    :param minimum: seconds below which a phase is too fast to compare
+    :return: list of (case, phase, baseline seconds, current seconds)
+    """
+    baseline_timings = {_case_key(r["case"]): r["timings"] for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        before = baseline_timings.get(_case_key(result["case"]))
+        if before is None:
+            continue
+        for phase, seconds in result["timings"].items():
+            if phase not in before or max(seconds, before[phase]) < minimum:
+                continue
+            if seconds > before[phase] * (1.0 + tolerance):
+                regressions.append((result["case"], phase, before[phase], seconds))
+    return regressions
+
+
+def format_result(result):
+    case = result["case"]
+    name = " ".join(f"{key}={value}" for key, value in case.items())
+    phases = " ".join(f"{phase}={result['timings'][phase]:.4f}s"
+                      for phase in PHASES if phase in result["timings"])
+    note = " (DTP disagrees with z3)" if result["sizes"].get("dtp_agrees") is False else ""
+    return f"{name}: {phases} ({result['sizes']['timepoints']} timepoints){note}"
@@ -0,0 +1,169 @@
+"""
+Batch command-line checker.  Checks many documents across a pool of worker
+processes and writes one JSON line per document.
+"""
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import sys
+import time
+
+l = logging.getLogger(__file__)
+l.setLevel(logging.INFO)
+
+EXTENSIONS = (".ttl",)
+
+
+def find_documents(paths, extensions=EXTENSIONS):
+    """
+    Expand files and directories into a sorted list of absolute document paths
+    :param paths: files, or directories searched recursively
+    :param extensions: file extensions of documents in directories
+    :return: list of paths
+    """
+    documents = []
+    for path in map(os.path.abspath, paths):
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                documents += [os.path.join(root, f) for f in files if f.endswith(extensions)]
+        else:
+            documents.append(path)
+    return sorted(set(documents))
+
+
+def read_checkpoint(checkpoint):
+    """
+    :param checkpoint: path of a checkpoint file, or None
+    :return: set of document paths already checked
+    """
+    if checkpoint is None or not os.path.exists(checkpoint):
+        return set()
+    with open(checkpoint, "r", encoding="utf-8") as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+def check_file(path, format="turtle", minimize=True, timeout=None, rlimit=None, stats=False, protocol=None,
+               explain=False, backend="z3"):
+    """
+    Check one document
+    :param path: document file
+    :param format: rdflib serialization format
+    :param minimize: also find the minimum duration of each protocol
+    :param timeout: wall clock seconds allowed for the document, or None
+    :param rlimit: z3 resource limit for each solver call, or None
+    :param stats: include CheckStats counts and solver statistics in the record
+    :param protocol: list of protocol identities to check (default: all)
+    :param explain: explain infeasible documents by a minimal set of
+        conflicting edges, joins and constraints
+    :param backend: solver for the consistency check, "z3" or "dtp"
+    :return: JSON serializable result record
+    """
+    import sbol3
+    from paml_check.labop_check import CheckResult, CheckStats, check_problem, compile_doc
+    from paml_check.solver import SolverLimits, SolverTimeout
+
+    check_stats = CheckStats() if stats else None
+    # The timeout covers reading and compiling too, so start its clock first
+    limits = SolverLimits(timeout=timeout, rlimit=rlimit)
+    record = {"path": path}
+    timings = record["timings"] = {}
+    start = time.monotonic()
+    try:
+        doc = sbol3.Document()
+        doc.read(path, format)
+        timings["read"] = time.monotonic() - start
+
+        phase = time.monotonic()
+        problem = compile_doc(doc, destructive=True, stats=check_stats, protocol=protocol)
+        timings["compile"] = time.monotonic() - phase
+
+        phase = time.monotonic()
+        try:
+            schedule = check_problem(problem, limits=limits, stats=check_stats, backend=backend)
+            record["status"] = CheckResult.SATISFIABLE if schedule else CheckResult.UNSATISFIABLE
+            timings["check"] = time.monotonic() - phase
+
+            if not schedule and explain:
+                phase = time.monotonic()
+                record["explanation"] = problem.explain(limits=limits, stats=check_stats).to_dict()
+                timings["explain"] = time.monotonic() - phase
+
+            if schedule and minimize:
+                phase = time.monotonic()
+                durations = problem.get_minimum_duration(limits=limits, deadline=limits.deadline,
+                                                         stats=check_stats)
+                timings["minimize"] = time.monotonic() - phase
+                record["durations"] = {protocol: d["duration"] for protocol, d in durations.items()}
+                if not all(d["converged"] for d in durations.values()):
+                    record["status"] = CheckResult.TIMEOUT
+                    record["lower_bounds"] = {protocol: d["lower_bound"] for protocol, d in durations.items()}
+        except SolverTimeout:
+            record["status"] = CheckResult.TIMEOUT
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = f"{type(e).__name__}: {e}"
+    timings["total"] = time.monotonic() - start
+    if check_stats is not None:
+        record["stats"] = check_stats.to_dict()
+    return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check LabOP documents for temporal consistency")
+    parser.add_argument("paths", nargs="+", help="documents, or directories of .ttl documents")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="number of worker processes")
+    parser.add_argument("-o", "--output", default=None, help="append results to this file (default: stdout)")
+    parser.add_argument("--checkpoint", default=None,
+                        help="file of checked documents; documents listed there are skipped")
+    parser.add_argument("--format", default="turtle", help="rdflib serialization format of the documents")
+    parser.add_argument("--no-minimize", dest="minimize", action="store_false",
+                        help="only check consistency, do not find minimum durations")
+    parser.add_argument("--timeout", type=float, default=None, help="seconds allowed for each document")
+    parser.add_argument("--rlimit", type=int, default=None, help="z3 resource limit for each solver call")
+    parser.add_argument("--protocol", action="append", default=None,
+                        help="identity of a protocol to check, with its sub-protocols (repeatable; default: all)")
+    parser.add_argument("--stats", action="store_true",
+                        help="include phase timings, problem sizes and solver statistics")
+    parser.add_argument("--explain", action="store_true",
+                        help="report the conflicting constraints and activities of infeasible documents")
+    parser.add_argument("--backend", choices=["z3", "dtp"], default="z3",
+                        help="solver for the consistency check (dtp: disjunctive temporal problem search)")
+    args = parser.parse_args(argv)
+
+    from paml_check.labop_check import CheckResult
+
+    done = read_checkpoint(args.checkpoint)
+    documents = [d for d in find_documents(args.paths) if d not in done]
+    if done:
+        l.info(f"Skipping {len(done)} documents listed in {args.checkpoint}")
+
+    output = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+    checkpoint = open(args.checkpoint, "a", encoding="utf-8") if args.checkpoint else None
+    failed = 0
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            futures = [pool.submit(check_file, document, args.format, args.minimize, args.timeout, args.rlimit,
+                                   args.stats, args.protocol, args.explain, args.backend)
+                       for document in documents]
+            for future in concurrent.futures.as_completed(futures):
+                record = future.result()
+                if record["status"] != CheckResult.SATISFIABLE:
+                    failed += 1
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+                # Only checkpoint a document once its result is written
+                if checkpoint is not None:
+                    checkpoint.write(record["path"] + "\n")
+                    checkpoint.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if checkpoint is not None:
+            checkpoint.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
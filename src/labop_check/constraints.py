@@ -3,54 +3,99 @@ Definitions of constraints
 """
 
 import pysmt
+import pysmt.shortcuts
 
+# Exactly-one constraints over more formulas than this use the linear
+# sequential counter encoding of exactly_one_constraint
+EXACTLY_ONE_THRESHOLD = 16
 
-def binary_temporal_constraint(t_1, disjunctive_distance, t_2):
+
+def _formula_manager(mgr):
+    """
+    Use the given formula manager, or the one of the global pysmt environment
+    """
+    return mgr if mgr is not None else pysmt.shortcuts.get_env().formula_manager
+
+
+def binary_temporal_constraint(t_1, disjunctive_distance, t_2, mgr=None):
     """
     Difference between t_2 and t_1 is within one of the disjunctive intervals
     :param t_1:
     :param disjunctive_distance:
     :param t_2:
+    :param mgr: formula manager to build with (default: global environment)
     :return:
     """
-    difference = pysmt.shortcuts.Minus(t_2, t_1)
-    constraint = pysmt.shortcuts.Or([
-        pysmt.shortcuts.And(pysmt.shortcuts.GE(difference, pysmt.shortcuts.Real(dd[0])),
-                            pysmt.shortcuts.LE(difference, pysmt.shortcuts.Real(dd[1])))
+    mgr = _formula_manager(mgr)
+    difference = mgr.Minus(t_2, t_1)
+    constraint = mgr.Or([
+        mgr.And(mgr.GE(difference, mgr.Real(dd[0])),
+                mgr.LE(difference, mgr.Real(dd[1])))
         for dd in disjunctive_distance
     ])
     return constraint
 
 
-def unary_temporal_constaint(t_p, disjunctive_distance):
+def unary_temporal_constaint(t_p, disjunctive_distance, mgr=None):
     """
     The abolute time of tp is within one of the disjunctive intervals
     :param t_p:
     :param disjunctive_distance:
+    :param mgr: formula manager to build with (default: global environment)
     :return:
     """
-    constraint = pysmt.shortcuts.Or([
-        pysmt.shortcuts.And(pysmt.shortcuts.GE(t_p, pysmt.shortcuts.Real(dd[0])),
-                            pysmt.shortcuts.LE(t_p, pysmt.shortcuts.Real(dd[1])))
+    mgr = _formula_manager(mgr)
+    constraint = mgr.Or([
+        mgr.And(mgr.GE(t_p, mgr.Real(dd[0])),
+                mgr.LE(t_p, mgr.Real(dd[1])))
         for dd in disjunctive_distance
     ])
     return constraint
 
 
-def join_constraint(t_join, joined_times):
+def join_constraint(t_join, joined_times, mgr=None):
     """
     A join step must be after all of the preceding timepoints
     :param t_join:
     :param joined_times:
+    :param mgr: formula manager to build with (default: global environment)
     :return:
     """
-    constraint = pysmt.shortcuts.Or([
-        pysmt.shortcuts.Equals(t_join, t_j)
+    mgr = _formula_manager(mgr)
+    constraint = mgr.Or([
+        mgr.Equals(t_join, t_j)
         for t_j in joined_times
     ])
     return constraint
 
 
+def exactly_one_constraint(formulas, mgr=None, threshold=None):
+    """
+    Exactly one of the formulas holds.  pysmt's ExactlyOne excludes each
+    formula together with the disjunction of the formulas after it, which is
+    quadratic in the number of formulas.  Above the threshold, a sequential
+    counter is used instead: register i, the disjunction of the first i
+    formulas, is built from register i - 1, and no formula may hold with
+    the register before it.  Registers are shared subformulas rather than
+    new symbols, so the encoding stays exact under negation.
+    :param formulas: list of Boolean formulas
+    :param mgr: formula manager to build with (default: global environment)
+    :param threshold: largest number of formulas to encode pairwise
+        (default: EXACTLY_ONE_THRESHOLD)
+    :return:
+    """
+    mgr = _formula_manager(mgr)
+    threshold = EXACTLY_ONE_THRESHOLD if threshold is None else threshold
+    if len(formulas) <= threshold:
+        return mgr.ExactlyOne(formulas)
+    register = formulas[0]
+    exclusions = []
+    for formula in formulas[1:]:
+        exclusions.append(mgr.Not(mgr.And(register, formula)))
+        register = mgr.Or(register, formula)
+    return mgr.And([register] + exclusions)
+
+
 def time_points_happen_once_constraint(timepoint_vars, happenings):
     """
     Each time point is equal to at least one happening
@@ -78,3 +123,204 @@ def duration_constraint(start, end, duration):
     return constraint
 
 
+class Clause:
+    """
+    Solver independent representation of a custom time constraint.  Clauses
+    refer to timepoints by name, so they can be compiled into a formula in
+    any pysmt environment.
+    """
+    __slots__ = ("identity",)
+
+    def __init__(self, identity=None):
+        self.identity = identity
+
+    def timepoints(self):
+        """
+        Names of the timepoints the clause refers to
+        :return: generator of names
+        """
+        for clause in self.clauses:
+            yield from clause.timepoints()
+
+    def parts(self, identity=None):
+        """
+        Split the clause into the parts that must all hold, each with the
+        identity of the innermost constraint it belongs to
+        :param identity: identity to give parts that have none
+        :return: list of (identity, clause)
+        """
+        return [(str(self.identity) if self.identity is not None else identity, self)]
+
+    def renamed(self, names):
+        """
+        Copy the clause, renaming its timepoints
+        :param names: mapping from timepoint name to new name, for the names to change
+        :return: clause
+        """
+        return type(self)([clause.renamed(names) for clause in self.clauses], identity=self.identity)
+
+    def holds(self, values, epsilon=0.0):
+        """
+        Evaluate the clause on timepoint values
+        :param values: mapping from timepoint name to value
+        :param epsilon: tolerance on the interval bounds
+        :return: bool
+        """
+        raise NotImplementedError()
+
+    def to_formula(self, symbols, mgr=None, threshold=None):
+        """
+        Build the pysmt formula for the clause
+        :param symbols: mapping from timepoint name to symbol
+        :param mgr: formula manager to build with (default: global environment)
+        :param threshold: largest ExactlyOne to encode pairwise, as in
+            exactly_one_constraint (default: EXACTLY_ONE_THRESHOLD)
+        :return: formula
+        """
+        raise NotImplementedError()
+
+
+class Difference(Clause):
+    """
+    The difference target - source is within one of the disjunctive intervals.
+    When source is None the clause constrains the absolute time of target.
+    """
+    __slots__ = ("source", "target", "intervals")
+
+    def __init__(self, source, target, intervals, identity=None):
+        super().__init__(identity)
+        self.source = source
+        self.target = target
+        self.intervals = intervals
+
+    def timepoints(self):
+        if self.source is not None:
+            yield self.source
+        yield self.target
+
+    def renamed(self, names):
+        return Difference(names.get(self.source, self.source), names.get(self.target, self.target),
+                          self.intervals, identity=self.identity)
+
+    def holds(self, values, epsilon=0.0):
+        difference = values[self.target] - (values[self.source] if self.source is not None else 0.0)
+        return any(low - epsilon <= difference <= high + epsilon for low, high in self.intervals)
+
+    def to_formula(self, symbols, mgr=None, threshold=None):
+        if self.source is None:
+            return unary_temporal_constaint(symbols[self.target], self.intervals, mgr=mgr)
+        return binary_temporal_constraint(symbols[self.source], self.intervals, symbols[self.target], mgr=mgr)
+
+
+class ParameterDifference(Clause):
+    """
+    The difference target - source is within [low, high], where low and high
+    are real symbols named "<parameter>_low" and "<parameter>_high" whose
+    values are given as solver assumptions.  One formula then serves every
+    value of the parameter.
+    """
+    __slots__ = ("source", "target", "parameter")
+
+    def __init__(self, source, target, parameter, identity=None):
+        super().__init__(identity)
+        self.source = source
+        self.target = target
+        self.parameter = parameter
+
+    def timepoints(self):
+        if self.source is not None:
+            yield self.source
+        yield self.target
+
+    def renamed(self, names):
+        return ParameterDifference(names.get(self.source, self.source), names.get(self.target, self.target),
+                                   self.parameter, identity=self.identity)
+
+    def bounds(self, mgr=None):
+        """
+        :param mgr: formula manager to build with (default: global environment)
+        :return: the low and high symbols of the parameter
+        """
+        mgr = _formula_manager(mgr)
+        return (mgr.Symbol(f"{self.parameter}_low", pysmt.shortcuts.REAL),
+                mgr.Symbol(f"{self.parameter}_high", pysmt.shortcuts.REAL))
+
+    def holds(self, values, epsilon=0.0):
+        difference = values[self.target] - (values[self.source] if self.source is not None else 0.0)
+        return values[f"{self.parameter}_low"] - epsilon <= difference <= values[f"{self.parameter}_high"] + epsilon
+
+    def to_formula(self, symbols, mgr=None, threshold=None):
+        mgr = _formula_manager(mgr)
+        low, high = self.bounds(mgr)
+        difference = symbols[self.target]
+        if self.source is not None:
+            difference = mgr.Minus(difference, symbols[self.source])
+        return mgr.And(mgr.GE(difference, low), mgr.LE(difference, high))
+
+
+class Conjunction(Clause):
+    __slots__ = ("clauses",)
+
+    def __init__(self, clauses, identity=None):
+        super().__init__(identity)
+        self.clauses = clauses
+
+    def holds(self, values, epsilon=0.0):
+        return all(c.holds(values, epsilon) for c in self.clauses)
+
+    def parts(self, identity=None):
+        identity = str(self.identity) if self.identity is not None else identity
+        return [part for clause in self.clauses for part in clause.parts(identity)]
+
+    def to_formula(self, symbols, mgr=None, threshold=None):
+        return _formula_manager(mgr).And([c.to_formula(symbols, mgr=mgr, threshold=threshold) for c in self.clauses])
+
+
+class Disjunction(Clause):
+    __slots__ = ("clauses",)
+
+    def __init__(self, clauses, identity=None):
+        super().__init__(identity)
+        self.clauses = clauses
+
+    def holds(self, values, epsilon=0.0):
+        return any(c.holds(values, epsilon) for c in self.clauses)
+
+    def to_formula(self, symbols, mgr=None, threshold=None):
+        return _formula_manager(mgr).Or([c.to_formula(symbols, mgr=mgr, threshold=threshold) for c in self.clauses])
+
+
+class ExactlyOne(Clause):
+    __slots__ = ("clauses",)
+
+    def __init__(self, clauses, identity=None):
+        super().__init__(identity)
+        self.clauses = clauses
+
+    def holds(self, values, epsilon=0.0):
+        return sum(1 for c in self.clauses if c.holds(values, epsilon)) == 1
+
+    def to_formula(self, symbols, mgr=None, threshold=None):
+        return exactly_one_constraint([c.to_formula(symbols, mgr=mgr, threshold=threshold) for c in self.clauses],
+                                      mgr=mgr, threshold=threshold)
+
+
+class Negation(Clause):
+    __slots__ = ("clause",)
+
+    def __init__(self, clause, identity=None):
+        super().__init__(identity)
+        self.clause = clause
+
+    @property
+    def clauses(self):
+        return [self.clause]
+
+    def renamed(self, names):
+        return Negation(self.clause.renamed(names), identity=self.identity)
+
+    def holds(self, values, epsilon=0.0):
+        return not self.clause.holds(values, -epsilon)
+
+    def to_formula(self, symbols, mgr=None, threshold=None):
+        return _formula_manager(mgr).Not(self.clause.to_formula(symbols, mgr=mgr, threshold=threshold))
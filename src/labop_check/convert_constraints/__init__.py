@@ -1,6 +1,5 @@
 import uml
 import paml_time as pamlt
-import pysmt
 import tyto
 import sbol3
 
@@ -18,6 +17,7 @@ l.setLevel(logging.ERROR)
 #     duration_constraint
 # from paml_check.utils import Interval
 
+from paml_check.constraints import Conjunction
 from paml_check.units import om_convert
 from . import \
     comparison, \
@@ -75,7 +75,7 @@ class ConstraintConverter:
                         + "\n  This is not recommended.")
                 clauses = [self._convert_constraint_by_type(c)
                            for c in constraint]
-                return pysmt.shortcuts.And(clauses)
+                return Conjunction(clauses)
             else:
                 # FIXME this may just be fine to leave as real functionality but for now print a warning
                 constraint = constraint[0]
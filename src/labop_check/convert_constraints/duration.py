@@ -1,7 +1,5 @@
 import paml_check.convert_constraints as pcc
-from paml_check.constraints import binary_temporal_constraint
-import pysmt
-import pysmt.shortcuts
+from paml_check.constraints import Difference
 import uml
 
 class DurationConstraintException(Exception):
@@ -10,7 +8,7 @@ class DurationConstraintException(Exception):
 def convert_duration_constraint(converter: 'pcc.ConstraintConverter',
                                 constraint: uml.DurationConstraint):
     """
-    Convert a uml.DurationConstraint into the pysmt equivalent
+    Convert a uml.DurationConstraint into a Difference clause
 
     If one constraint element is provided:
         Ignore firstEventValue and assume the duration is from the
@@ -38,10 +36,10 @@ def convert_duration_constraint(converter: 'pcc.ConstraintConverter',
     min_duration = converter.time_measure_to_seconds(get_min_duration(duration_interval))
     max_duration = converter.time_measure_to_seconds(get_max_duration(duration_interval))
 
-    clause = binary_temporal_constraint(
-        pysmt.shortcuts.Symbol(start.name, pysmt.shortcuts.REAL),
-        [[min_duration, max_duration]],
-        pysmt.shortcuts.Symbol(end.name, pysmt.shortcuts.REAL))
+    clause = Difference(start.name,
+                        end.name,
+                        [[min_duration, max_duration]],
+                        identity=constraint.identity)
     return clause
 
 def get_min_duration(duration_interval: uml.DurationInterval):
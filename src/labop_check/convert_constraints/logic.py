@@ -1,42 +1,45 @@
 import paml_check.convert_constraints as pcc
 import paml_time as pamlt
-import pysmt
-import pysmt.shortcuts
 import uml
+from paml_check.constraints import \
+    Conjunction, \
+    Disjunction, \
+    ExactlyOne, \
+    Negation
 
 def convert_and_constraint(converter: 'pcc.ConstraintConverter',
                            constraint: pamlt.AndConstraint):
     """
-    Convert a paml_time.AndConstraint into the pysmt equivalent
+    Convert a paml_time.AndConstraint into the equivalent clause
     """
     elements = [ ce.property_value if isinstance(ce, uml.OrderedPropertyValue) else ce
                 for ce in constraint.constrained_elements ]
     clauses = [ converter.convert_constraint(ce)
                 for ce in elements ]
-    return pysmt.shortcuts.And(clauses)
+    return Conjunction(clauses, identity=constraint.identity)
 
 def convert_or_constraint(converter: 'pcc.ConstraintConverter',
                           constraint: pamlt.OrConstraint):
     """
-    Convert a paml_time.OrConstraint into the pysmt equivalent
+    Convert a paml_time.OrConstraint into the equivalent clause
     """
     clauses = [ converter.convert_constraint(ce)
                 for ce in constraint.constrained_elements ]
-    return pysmt.shortcuts.Or(clauses)
+    return Disjunction(clauses, identity=constraint.identity)
 
 def convert_xor_constraint(converter: 'pcc.ConstraintConverter',
                            constraint: pamlt.XorConstraint):
     """
-    Convert a paml_time.XorConstraint into the pysmt equivalent
+    Convert a paml_time.XorConstraint into the equivalent clause
     """
     clauses = [ converter.convert_constraint(ce)
                 for ce in constraint.constrained_elements ]
-    return pysmt.shortcuts.ExactlyOne(clauses)
+    return ExactlyOne(clauses, identity=constraint.identity)
 
 def convert_not_constraint(converter: 'pcc.ConstraintConverter',
                            constraint: pamlt.Not):
     """
-    Convert a paml_time.NotConstraint into the pysmt equivalent
+    Convert a paml_time.NotConstraint into the equivalent clause
     """
     clause = converter.convert_constraint(constraint.constrained_elements)
-    return pysmt.shortcuts.Not(clause)
\ No newline at end of file
+    return Negation(clause, identity=constraint.identity)
\ No newline at end of file
@@ -1,8 +1,6 @@
 import paml_check.convert_constraints as pcc
-import pysmt
-import pysmt.shortcuts
 import uml
-from paml_check.constraints import unary_temporal_constaint
+from paml_check.constraints import Difference
 
 class TimeConstraintException(Exception):
     pass
@@ -10,7 +8,7 @@ class TimeConstraintException(Exception):
 def convert_time_constraint(converter: 'pcc.ConstraintConverter',
                             constraint: uml.TimeConstraint):
     """
-    Convert a uml.TimeConstraint into the pysmt equivalent
+    Convert a uml.TimeConstraint into a Difference clause on an absolute time
     """
     tp = get_timepoint(converter, constraint)
 
@@ -19,9 +17,10 @@ def convert_time_constraint(converter: 'pcc.ConstraintConverter',
     min_duration = converter.time_measure_to_seconds(get_min_duration(time_interval))
     max_duration = converter.time_measure_to_seconds(get_max_duration(time_interval))
 
-    clause = unary_temporal_constaint(
-        pysmt.shortcuts.Symbol(tp.name, pysmt.shortcuts.REAL),
-        [[min_duration, max_duration]])
+    clause = Difference(None,
+                        tp.name,
+                        [[min_duration, max_duration]],
+                        identity=constraint.identity)
     return clause
 
 def get_min_duration(time_interval: uml.TimeInterval):
@@ -0,0 +1,524 @@
+"""
+Disjunctive temporal problem (DTP) solver for a TemporalProblem.  Edges with
+several intervals, joins and disjunctive custom constraints are variables of
+a meta-CSP whose values are the alternatives (conjunctions of difference
+constraints) that can make them hold.  The search keeps a simple temporal
+network of the chosen alternatives, with a feasible potential that is
+repaired incrementally as edges are added (Cotton and Maler, "Fast and
+flexible difference constraint propagation for DPLL(T)"), so a negative
+cycle is found as soon as it is closed, together with the choices it came
+from.  Choices are only made for variables that the current potential does
+not already satisfy; conflicts backjump to the latest choice on the cycle
+and are recorded as no-goods.
+"""
+import heapq
+
+from paml_check.constraints import Conjunction, Difference, Disjunction, ExactlyOne, Negation
+from paml_check.solver import SolverTimeout
+from paml_check.stats import timed
+
+# Longest no-good to record, in choices
+_MAX_NOGOOD = 16
+
+# Search nodes between checks of the limits
+_LIMIT_CHECK_INTERVAL = 64
+
+
+class _Variable:
+    """
+    A disjunction of alternatives, each a list of edges (u, v, w), meaning
+    x_v - x_u <= w, and a list of variables that must hold when the
+    alternative is chosen
+    """
+    __slots__ = ("index", "alternatives")
+
+    def __init__(self, alternatives):
+        self.index = None
+        self.alternatives = alternatives
+
+
+class _Frame:
+    """
+    A choice in the search: the variable, the alternative chosen, and the
+    choices (by level) that rule out each alternative already tried
+    """
+    __slots__ = ("variable", "activation", "value", "mark", "eliminated")
+
+    def __init__(self, variable, activation, mark):
+        self.variable = variable
+        self.activation = activation
+        self.value = None
+        self.mark = mark
+        self.eliminated = {}
+
+
+class DisjunctiveTemporalSolver:
+    """
+    Solver for a TemporalProblem with the interface of ProblemSolver that
+    check_problem uses.  Custom constraints may combine Difference clauses
+    with Conjunction, Disjunction, ExactlyOne and Negation.  The negation of
+    an interval is the pair of intervals epsilon outside of it, so negated
+    differences are strict by problem.epsilon rather than by an infinitesimal.
+    """
+
+    def __init__(self, problem, limits=None, stats=None):
+        """
+        Build the network and variables of a problem
+        :param problem: TemporalProblem
+        :param limits: SolverLimits applied to every check
+        :param stats: CheckStats to record solver calls and search counts in
+        :raises ValueError: if a custom constraint has a ParameterDifference
+        """
+        self.problem = problem
+        self.limits = limits
+        self.stats = stats
+        self.tolerance = problem.epsilon * 1e-3
+        n = len(problem.timepoints)
+        # Timepoint n is the origin, at time 0
+        self.origin = n
+        self.potential = [0.0] * (n + 1)
+        self.edges = []                     # (u, v, w, level of the choice, or -1)
+        self.out_edges = [[] for _ in range(n + 1)]
+        self.in_edges = [[] for _ in range(n + 1)]
+        self.variables = []
+        self._assigned = {}                 # variable index -> (alternative, level)
+        self._nogoods = {}                  # (variable index, alternative) -> [no-good]
+        self._assignment = None
+        self._interrupted = False
+
+        with timed(stats, "generate_constraints"):
+            base = []
+            for t in range(n):
+                base.append((t, self.origin, 0.0))
+            for source, target, intervals in problem.edges:
+                self._add_intervals(source, target, intervals, base, self.variables)
+            for j, members in problem.joins:
+                alternatives = [(self._differences(m, j, 0.0, 0.0), []) for m in members]
+                self._add_variable(alternatives, base, self.variables)
+            for _, clause in problem.constraints:
+                edges, variables = self._compile(clause, negated=False)
+                base += edges
+                self.variables += variables
+            self._base = base
+            self._count = self._index(self.variables, 0)
+        if stats is not None:
+            stats.set_count("dtp_variables", self._count)
+        if limits is not None:
+            limits.register(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.limits is not None:
+            self.limits.unregister(self)
+
+    def interrupt(self):
+        """
+        Ask a check running in another thread to stop
+        :return:
+        """
+        self._interrupted = True
+
+    def _differences(self, source, target, low, high):
+        """
+        Edges for target - source in [low, high], leaving out bounds that
+        the domain [0, infinity] of every timepoint implies
+        """
+        edges = []
+        if high < self.problem.infinity:
+            edges.append((source, target, float(high)))
+        if low > -self.problem.infinity:
+            edges.append((target, source, -float(low)))
+        return edges
+
+    def _add_variable(self, alternatives, edges, variables):
+        """
+        Add the disjunction of alternatives to edges, if it has only one
+        alternative, or else as a new variable
+        """
+        if len(alternatives) == 1:
+            edges += alternatives[0][0]
+            variables += alternatives[0][1]
+        elif not alternatives:
+            # Nothing can hold: a negative self loop
+            edges.append((self.origin, self.origin, -1.0))
+        else:
+            variables.append(_Variable(alternatives))
+
+    def _add_intervals(self, source, target, intervals, edges, variables):
+        alternatives = [(self._differences(source, target, low, high), []) for low, high in intervals]
+        self._add_variable(alternatives, edges, variables)
+
+    def _complement(self, intervals):
+        """
+        Intervals, epsilon apart from the given ones, that cover the rest of
+        the real line
+        """
+        infinity = self.problem.infinity
+        epsilon = self.problem.epsilon
+        gaps = []
+        low = -infinity
+        for a, b in sorted(intervals):
+            if a - epsilon >= low:
+                gaps.append([low, a - epsilon])
+            low = max(low, b + epsilon)
+        if low <= infinity:
+            gaps.append([low, infinity])
+        return gaps
+
+    def _compile(self, clause, negated):
+        """
+        Compile a clause, or its negation, into edges that must hold and
+        variables for its disjunctions
+        :return: (list of edges, list of _Variable)
+        """
+        edges, variables = [], []
+        if isinstance(clause, Negation):
+            return self._compile(clause.clause, not negated)
+        if isinstance(clause, Difference):
+            index = self.problem.timepoint_index
+            source = index[clause.source] if clause.source is not None else self.origin
+            intervals = self._complement(clause.intervals) if negated else clause.intervals
+            self._add_intervals(source, index[clause.target], intervals, edges, variables)
+        elif isinstance(clause, Conjunction) and not negated or isinstance(clause, Disjunction) and negated:
+            for c in clause.clauses:
+                e, v = self._compile(c, negated)
+                edges += e
+                variables += v
+        elif isinstance(clause, (Conjunction, Disjunction)):
+            alternatives = [self._compile(c, negated) for c in clause.clauses]
+            self._add_variable(alternatives, edges, variables)
+        elif isinstance(clause, ExactlyOne):
+            holds = [self._compile(c, False) for c in clause.clauses]
+            fails = [self._compile(c, True) for c in clause.clauses]
+            if not negated:
+                # One holds and the others do not
+                alternatives = [self._merge([holds[i]] + fails[:i] + fails[i + 1:])
+                                for i in range(len(clause.clauses))]
+            else:
+                # None holds, or two do
+                alternatives = [self._merge(fails)] + [self._merge([holds[i], holds[j]])
+                                                       for i in range(len(holds)) for j in range(i + 1, len(holds))]
+            self._add_variable(alternatives, edges, variables)
+        else:
+            raise ValueError(f"{type(clause).__name__} constraints are not supported by the DTP solver")
+        return edges, variables
+
+    @staticmethod
+    def _merge(compiled):
+        return [e for edges, _ in compiled for e in edges], [v for _, variables in compiled for v in variables]
+
+    def _index(self, variables, count):
+        """
+        Number the variables and the variables of their alternatives, which
+        alternatives may share
+        :return: count plus the number of variables numbered
+        """
+        for variable in variables:
+            if variable.index is None:
+                variable.index = count
+                count += 1
+                for _, subvariables in variable.alternatives:
+                    count = self._index(subvariables, count)
+        return count
+
+    def _add_edge(self, u, v, w, level):
+        """
+        Add the edge x_v - x_u <= w and repair the potential, decreasing the
+        potential of v and of the timepoints it reaches in order of how much
+        they decrease.  The edge closes a negative cycle if the potential of
+        u would have to decrease.
+        :return: None, or the levels of the edges on a negative cycle, in
+            which case the edge is left out of the network
+        """
+        potential = self.potential
+        tolerance = self.tolerance
+        k = len(self.edges)
+        self.edges.append((u, v, w, level))
+        self.out_edges[u].append(k)
+        self.in_edges[v].append(k)
+        if potential[v] - potential[u] <= w + tolerance:
+            return None
+        if u == v:
+            self._remove_edges(k)
+            return {level}
+        gamma = {v: potential[u] + w - potential[v]}
+        parent = {v: k}
+        repaired = {}
+        heap = [(gamma[v], v)]
+        while heap:
+            g, s = heapq.heappop(heap)
+            if s in repaired or g > gamma[s]:
+                continue
+            repaired[s] = potential[s] + g
+            for e in self.out_edges[s]:
+                _, t, c, _ = self.edges[e]
+                if t in repaired:
+                    continue
+                decrease = repaired[s] + c - potential[t]
+                if decrease < gamma.get(t, 0.0) - tolerance:
+                    if t == u:
+                        levels = {level, self.edges[e][3]}
+                        while s != v:
+                            e = parent[s]
+                            levels.add(self.edges[e][3])
+                            s = self.edges[e][0]
+                        self._remove_edges(k)
+                        return levels
+                    gamma[t] = decrease
+                    parent[t] = e
+                    heapq.heappush(heap, (decrease, t))
+        for s, value in repaired.items():
+            potential[s] = value
+        return None
+
+    def _remove_edges(self, mark):
+        """
+        Remove the edges added since there were mark edges.  The potential
+        stays feasible, as it only has fewer edges to satisfy.
+        """
+        while len(self.edges) > mark:
+            u, v, _, _ = self.edges.pop()
+            self.out_edges[u].pop()
+            self.in_edges[v].pop()
+
+    def _add_edges(self, edges, level):
+        """
+        :return: None, or the levels of the edges on a negative cycle,
+            after removing the edges added
+        """
+        mark = len(self.edges)
+        for u, v, w in edges:
+            levels = self._add_edge(u, v, w, level)
+            if levels is not None:
+                self._remove_edges(mark)
+                return levels
+        return None
+
+    def _violations(self, alternative):
+        """
+        Number of edges of an alternative, and of its variables, that the
+        potential does not satisfy
+        """
+        potential = self.potential
+        edges, variables = alternative
+        count = sum(1 for u, v, w in edges if potential[v] - potential[u] > w + self.tolerance)
+        return count + sum(1 for variable in variables if not self._satisfied(variable))
+
+    def _satisfied(self, variable):
+        return any(self._violations(alternative) == 0 for alternative in variable.alternatives)
+
+    def _active(self, stack):
+        """
+        Unassigned variables that must hold, with the level of the choice
+        that made them active (-1 for the variables of the problem)
+        """
+        for variable in self.variables:
+            yield variable, -1
+        for level, frame in enumerate(stack):
+            for variable in frame.variable.alternatives[frame.value][1]:
+                yield variable, level
+
+    def _select(self, stack):
+        """
+        :return: the active variable that the potential does not satisfy
+            with the fewest alternatives, and its activation level, or
+            (None, None) if the potential satisfies every active variable
+        """
+        best, activation = None, None
+        for variable, level in self._active(stack):
+            if self._assigned.get(variable.index) is None and not self._satisfied(variable):
+                if best is None or len(variable.alternatives) < len(best.alternatives):
+                    best, activation = variable, level
+        return best, activation
+
+    def _nogood(self, variable, value):
+        """
+        :return: levels of the choices that, with variable = value, complete
+            a recorded no-good, or None
+        """
+        for nogood in self._nogoods.get((variable.index, value), ()):
+            levels = set()
+            for index, other in nogood:
+                if index == variable.index:
+                    continue
+                choice = self._assigned.get(index)
+                if choice is None or choice[0] != other:
+                    break
+                levels.add(choice[1])
+            else:
+                return levels
+        return None
+
+    def _learn(self, stack, levels):
+        if len(levels) > _MAX_NOGOOD:
+            return
+        nogood = frozenset((stack[level].variable.index, stack[level].value) for level in levels)
+        for choice in nogood:
+            self._nogoods.setdefault(choice, []).append(nogood)
+        if self.stats is not None:
+            self.stats.count("dtp_nogoods")
+
+    def _assign(self, stack, frame):
+        """
+        Choose the next alternative of the variable of the top frame that is
+        not ruled out, trying first those that the potential violates least
+        :return: True if an alternative was added without a conflict
+        """
+        level = len(stack) - 1
+        variable = frame.variable
+        order = sorted((self._violations(alternative), value)
+                       for value, alternative in enumerate(variable.alternatives)
+                       if value not in frame.eliminated)
+        for _, value in order:
+            levels = self._nogood(variable, value)
+            if levels is not None:
+                frame.eliminated[value] = levels
+                continue
+            levels = self._add_edges(variable.alternatives[value][0], level)
+            if levels is None:
+                frame.value = value
+                self._assigned[variable.index] = (value, level)
+                if self.stats is not None:
+                    self.stats.count("dtp_decisions")
+                return True
+            frame.eliminated[value] = {other for other in levels if 0 <= other < level}
+            if self.stats is not None:
+                self.stats.count("dtp_conflicts")
+        return False
+
+    def _unassign(self, frame):
+        self._remove_edges(frame.mark)
+        self._assigned.pop(frame.variable.index, None)
+        frame.value = None
+
+    def _check_limits(self):
+        if self._interrupted or self.limits is not None and self.limits.expired():
+            raise SolverTimeout("DTP search did not finish within its limits")
+
+    def _search(self):
+        """
+        Choose alternatives until the potential satisfies every active
+        variable, backjumping to the latest choice involved in each
+        conflict
+        :return: the frames of the choices, or None if the problem is
+            unsatisfiable
+        """
+        if self._add_edges(self._base, -1) is not None:
+            return None
+        stack = []
+        nodes = 0
+        while True:
+            nodes += 1
+            if nodes % _LIMIT_CHECK_INTERVAL == 0:
+                self._check_limits()
+            variable, activation = self._select(stack)
+            if variable is None:
+                return stack
+            frame = _Frame(variable, activation, len(self.edges))
+            stack.append(frame)
+            while not self._assign(stack, frame):
+                # Every alternative is ruled out by earlier choices
+                levels = set().union(*frame.eliminated.values())
+                if frame.activation >= 0:
+                    levels.add(frame.activation)
+                stack.pop()
+                self._unassign(frame)
+                if not levels:
+                    return None
+                self._learn(stack, levels)
+                target = max(levels)
+                while len(stack) > target + 1:
+                    self._unassign(stack.pop())
+                frame = stack[-1]
+                value = frame.value
+                self._unassign(frame)
+                frame.eliminated[value] = levels - {target}
+                if self.stats is not None:
+                    self.stats.count("dtp_backjumps")
+
+    def _earliest(self, stack):
+        """
+        Add the alternatives that the potential satisfies for the unassigned
+        active variables, then find the earliest time of each timepoint,
+        minus the shortest distance from it to the origin, by Dijkstra's
+        algorithm on edge lengths reweighted by the potential
+        :return: dict from timepoint name to value
+        """
+        pending = [variable for variable, _ in self._active(stack) if self._assigned.get(variable.index) is None]
+        while pending:
+            variable = pending.pop()
+            for edges, variables in variable.alternatives:
+                if self._violations((edges, variables)) == 0:
+                    self._add_edges(edges, -1)
+                    pending += variables
+                    break
+
+        potential = self.potential
+        distance = [float("inf")] * len(potential)
+        distance[self.origin] = 0.0
+        heap = [(0.0, self.origin)]
+        while heap:
+            d, t = heapq.heappop(heap)
+            if d > distance[t]:
+                continue
+            for e in self.in_edges[t]:
+                s, _, w, _ = self.edges[e]
+                value = d + max(0.0, w + potential[s] - potential[t])
+                if value < distance[s]:
+                    distance[s] = value
+                    heapq.heappush(heap, (value, s))
+        origin = potential[self.origin]
+        return {name: max(0.0, -(distance[t] - potential[t] + origin))
+                for t, name in enumerate(self.problem.timepoints)}
+
+    def check(self, assumptions=None, timeout=None):
+        """
+        Search for alternatives of the disjunctions that are consistent
+        :param assumptions: not supported, must be None
+        :param timeout: not supported, must be None; use limits
+        :return: True if satisfiable
+        :raises SolverTimeout: if the limits expire before the search ends
+        """
+        if assumptions or timeout is not None:
+            raise ValueError("The DTP solver does not support assumptions or timeouts; use limits")
+        if self.limits is not None and self.limits.expired():
+            raise SolverTimeout("Solver limits expired before check")
+        self._remove_edges(0)
+        self._assigned = {}
+        self._assignment = None
+        try:
+            with timed(self.stats, "solve"):
+                stack = self._search()
+                if stack is not None:
+                    self._assignment = self._earliest(stack)
+        finally:
+            if self.stats is not None:
+                self.stats.count("solver_calls")
+        return stack is not None
+
+    def get_assignment(self):
+        """
+        Earliest time of each timepoint given the alternatives found by the
+        last check
+        :return: dict from timepoint name to float
+        """
+        return self._assignment
+
+    def set_initial_values(self, assignment):
+        """
+        Start the potential from a previous model, so that disjunctions it
+        satisfies need no choice
+        :param assignment: dict from timepoint name to value
+        :return:
+        """
+        index = self.problem.timepoint_index
+        for name, value in assignment.items():
+            t = index.get(name)
+            if t is not None:
+                self.potential[t] = float(value)
+        self.potential[self.origin] = 0.0
@@ -0,0 +1,117 @@
+"""
+Explain why a problem is infeasible.  Each edge, join and custom constraint
+is asserted under a selector, so one solver call finds an unsat core of the
+selectors, which is mapped back to the activities and constraints involved.
+"""
+from paml_check.solver import ProblemSolver
+from paml_check.stn import SimpleTemporalNetwork
+
+
+class Explanation:
+    """
+    Edges, joins and custom constraints of a problem that cannot all hold
+    """
+
+    def __init__(self, problem, labels):
+        """
+        :param problem: TemporalProblem
+        :param labels: labels of the parts in the core, as in
+            TemporalProblem.labeled_formulas
+        """
+        self.labels = labels
+        self.constraints = [identity for kind, identity in labels if kind == "constraint"]
+        self.edges = []
+        self.joins = []
+        names = set()
+        for kind, detail in labels:
+            if kind == "edge":
+                source, target, intervals = problem.edges[detail]
+                self.edges.append((problem.timepoints[source], problem.timepoints[target], intervals))
+                names |= {problem.timepoints[source], problem.timepoints[target]}
+            elif kind == "join":
+                j, members = problem.joins[detail]
+                self.joins.append((problem.timepoints[j], [problem.timepoints[m] for m in members]))
+                names |= {problem.timepoints[i] for i in [j] + members}
+        constraints = set(self.constraints)
+        for identity, clause in problem.constraints:
+            for part_identity, part in clause.parts(str(identity)):
+                if part_identity in constraints:
+                    names |= set(part.timepoints())
+        # Timepoint names are "<start|end|duration>_<activity identity>"
+        self.activities = sorted({name.split("_", 1)[1] for name in names})
+
+    def to_dict(self):
+        return {"constraints": self.constraints, "activities": self.activities,
+                "edges": [[source, target, intervals] for source, target, intervals in self.edges],
+                "joins": [[j, members] for j, members in self.joins]}
+
+    def __repr__(self):
+        return f"Explanation(constraints={self.constraints}, activities={self.activities})"
+
+
+def _network_conflict(problem):
+    """
+    Look for a conflict in the simple temporal network of the problem.  The
+    network relaxes disjunctive edges to the hull of their intervals and
+    leaves out disjunctive constraints, so the parts on a negative cycle are
+    infeasible in the problem too.
+    :return: labels of the parts in the conflict, or None
+    """
+    network = SimpleTemporalNetwork.from_problem(problem)
+    conflicts = network.initialize()
+    if not conflicts:
+        return None
+    # The network labels custom constraints by their TimeConstraints
+    parts = {str(identity): [("constraint", part_identity) for part_identity, _ in clause.parts(str(identity))]
+             for identity, clause in problem.constraints}
+    labels = []
+    for kind, detail in conflicts[0].reasons:
+        labels += parts[str(detail)] if kind == "constraint" else [(kind, detail)]
+    return list(dict.fromkeys(labels))
+
+
+def _shrink(solver, core):
+    """
+    Drop parts from an unsat core while it stays unsatisfiable
+    :return: minimal unsat core, in which every part is needed
+    """
+    core = list(core)
+    k = 0
+    while k < len(core):
+        rest = core[:k] + core[k + 1:]
+        if solver.check(solver.assume(rest)):
+            # The part is needed, as are the parts before it
+            k += 1
+        else:
+            smaller = set(solver.get_unsat_core())
+            core = [label for label in rest if label in smaller]
+    return core
+
+
+def explain(graph, limits=None, minimal=True, stats=None):
+    """
+    Find a set of edges, joins and custom constraints that cannot all hold.
+    A conflict in the simple temporal network of the problem, found without
+    the solver, is tried first; otherwise all parts are assumed and z3
+    reports the core.
+    :param graph: ActivityGraph or compiled TemporalProblem
+    :param limits: SolverLimits for the solver calls
+    :param minimal: shrink the core, one solver call per part, until no
+        part can be dropped
+    :param stats: CheckStats to record the solver calls in
+    :return: Explanation, or None if the problem is feasible
+    :raises SolverTimeout: if limits expire before the core is found
+    """
+    problem = graph.compile()
+    candidate = _network_conflict(problem)
+    with ProblemSolver(problem, limits=limits, stats=stats, selectors=True) as solver:
+        core = None
+        if candidate is not None and not solver.check(solver.assume(candidate)):
+            core = solver.get_unsat_core()
+        if core is None:
+            if solver.check(solver.assume()):
+                return None
+            core = solver.get_unsat_core()
+        if minimal:
+            core = _shrink(solver, core)
+    return Explanation(problem, core)
@@ -0,0 +1,184 @@
+"""
+Bottom-up summarization of sub-protocols.  Each sub-protocol is solved once
+for the interval of durations it can take, and each call to it is replaced
+by a single edge across the calling node, so callers are solved without the
+detail of the protocols they call.
+"""
+import hashlib
+import logging
+
+from paml_check.constraints import Conjunction, Difference
+from paml_check.solver import ProblemSolver
+from paml_check.temporal_problem import TemporalProblem
+
+l = logging.getLogger(__file__)
+l.setLevel(logging.ERROR)
+
+
+def duration_interval(problem, protocol_id, threshold=0.1, limits=None, stats=None):
+    """
+    Find the least and greatest duration (end - start) of a protocol by
+    bisection.  Both bounds are durations of feasible schedules, within
+    threshold of the true bounds.  A greatest duration of half of
+    problem.infinity or more is reported as problem.infinity.
+    :param problem: TemporalProblem
+    :param protocol_id:
+    :param threshold: precision of the bounds
+    :param limits: SolverLimits for the search
+    :param stats: CheckStats to record solver calls in
+    :return: (minimum, maximum), or None if the problem is infeasible
+    """
+    start_name, end_name = (problem.timepoints[i] for i in problem.protocols[protocol_id])
+    with ProblemSolver(problem, limits=limits, stats=stats) as solver:
+        if not solver.check():
+            return None
+        mgr = solver.mgr
+        duration = mgr.Minus(solver.symbol(end_name), solver.symbol(start_name))
+
+        def solved_duration():
+            assignment = solver.get_assignment()
+            return assignment[end_name] - assignment[start_name]
+
+        first = solved_duration()
+
+        infimum, minimum = 0.0, first
+        while minimum - infimum > threshold:
+            mid = (infimum + minimum) / 2.0
+            if solver.check([mgr.LT(duration, mgr.Real(mid))]):
+                minimum = solved_duration()
+            else:
+                infimum = mid
+
+        unbounded = problem.infinity / 2.0
+        if solver.check([mgr.GE(duration, mgr.Real(unbounded))]):
+            return minimum, problem.infinity
+        maximum, supremum = first, unbounded
+        while supremum - maximum > threshold:
+            mid = (maximum + supremum) / 2.0
+            if solver.check([mgr.GT(duration, mgr.Real(mid))]):
+                maximum = solved_duration()
+            else:
+                supremum = mid
+        return minimum, maximum
+
+
+class SummarizedProblem(TemporalProblem):
+    """
+    A TemporalProblem in which calls to sub-protocols are replaced by edges
+    bounding the duration of the calling node.  Each call is treated as an
+    independent invocation of the sub-protocol.  The summary of a
+    sub-protocol is the hull of its feasible durations, which is exact
+    unless it has disjunctive constraints.
+    """
+
+    def __init__(self, source, name, epsilon=0.0001, infinity=10e10):
+        super().__init__(name, epsilon=epsilon, infinity=infinity)
+        self.source = source
+        self.summarized_calls = []  # (calling node identity, called protocol identity)
+
+    def expand_assignment(self, assignment, limits=None):
+        """
+        Solve each summarized call for a detailed schedule of the called
+        protocol, pinned to the start and end of the calling node
+        :param assignment: solution of the summarized problem
+        :param limits: SolverLimits for the expansion
+        :return: assignment of the timepoints of the source problem
+        :raises ValueError: if a call cannot be expanded, which can only
+            happen when a summary includes durations that its disjunctive
+            constraints exclude
+        """
+        expanded = dict(assignment)
+        called = set()
+        for node, protocol_id in self.summarized_calls:
+            if protocol_id in called:
+                l.warning(f"{protocol_id} is called more than once, the expanded schedule shows its call by {node}")
+            called.add(protocol_id)
+            sub = self.source.sub_problem(self.source.closure([protocol_id]))
+            start_name, end_name = (sub.timepoints[i] for i in sub.protocols[protocol_id])
+            start, end = expanded[f"start_{node}"], expanded[f"end_{node}"]
+            sub.constraints.append(("expand", Conjunction([Difference(None, start_name, [[start, start]]),
+                                                           Difference(None, end_name, [[end, end]])])))
+            with ProblemSolver(sub, limits=limits) as solver:
+                if not solver.check():
+                    raise ValueError(f"Cannot expand the call of {protocol_id} by {node}")
+                expanded.update(solver.get_assignment())
+        return expanded
+
+
+def summarize(problem, summaries=None, expand=(), threshold=0.1, limits=None, stats=None):
+    """
+    Replace the calls to sub-protocols by duration edges, solving each
+    sub-protocol bottom-up.  A sub-protocol is not summarized if it is listed
+    in expand, or if a custom constraint refers to it or to a protocol it
+    calls.
+    :param problem: TemporalProblem
+    :param summaries: dict from (protocol identity, content hash) to
+        (minimum, maximum) duration, or None if infeasible.  The hash covers
+        the protocol and the protocols it calls (see
+        TemporalProblem.content_hashes).  Summaries found are added to it,
+        and summaries already in it are reused while their protocols are
+        unchanged.
+    :param expand: identities of sub-protocols to keep in detail
+    :param threshold: precision of the duration bounds
+    :param limits: SolverLimits for solving the sub-protocols
+    :param stats: CheckStats to record solver calls in
+    :return: SummarizedProblem
+    """
+    summaries = {} if summaries is None else summaries
+    calls = problem.calls()
+    hashes = problem.content_hashes(calls)
+
+    # Protocols whose timepoints appear in custom constraints
+    owner = {problem.timepoints[i]: protocol_id
+             for protocol_id, indices in problem.protocol_timepoints.items() for i in indices}
+    constrained = {owner[name] for (_, clause) in problem.constraints
+                   for name in clause.timepoints() if name in owner}
+
+    def summarizable(protocol_id):
+        if protocol_id in expand:
+            return False
+        closure = problem.closure([protocol_id])
+        callees = problem.closure([called for _, called in calls[protocol_id]])
+        # Recursive protocols cannot be solved bottom-up
+        return protocol_id not in callees and not (closure & constrained)
+
+    def summary(protocol_id):
+        closure = problem.closure([protocol_id])
+        content = hashlib.sha256(" ".join(sorted(hashes[p] for p in closure)).encode("utf-8")).hexdigest()
+        key = (protocol_id, content)
+        if key not in summaries:
+            sub = problem.sub_problem(closure)
+            inner = summarize(sub, summaries, expand, threshold, limits, stats)
+            summaries[key] = duration_interval(inner, protocol_id, threshold, limits, stats)
+        return summaries[key]
+
+    # Keep the protocols that are reachable from the top level protocols
+    # without passing through a summarized call
+    called = {called for protocol_calls in calls.values() for _, called in protocol_calls}
+    kept = set()
+    pending = [protocol_id for protocol_id in problem.protocols if protocol_id not in called]
+    edges = []
+    summarized_calls = []
+    while pending:
+        protocol_id = pending.pop()
+        if protocol_id in kept:
+            continue
+        kept.add(protocol_id)
+        for node, called_id in calls[protocol_id]:
+            if summarizable(called_id):
+                bounds = summary(called_id)
+                intervals = [list(bounds)] if bounds is not None else []
+                edges.append((f"start_{node}", f"end_{node}", intervals))
+                summarized_calls.append((node, called_id))
+            else:
+                pending.append(called_id)
+
+    summarized = problem.sub_problem(kept, SummarizedProblem(problem, problem.name,
+                                                             epsilon=problem.epsilon,
+                                                             infinity=problem.infinity))
+    summarized.summarized_calls = summarized_calls
+    # The calls to kept protocols stay linked to them, but the link edges of
+    # summarized calls were dropped with the summarized protocols
+    summarized.edges += [(summarized.timepoint_index[source], summarized.timepoint_index[target], intervals)
+                         for (source, target, intervals) in edges]
+    return summarized
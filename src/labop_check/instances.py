@@ -0,0 +1,130 @@
+"""
+Per-invocation instances of sub-protocols.  In a compiled TemporalProblem
+every call to a sub-protocol is linked to the same timepoints, so all calls
+share one time window.  instantiate() gives each call its own copy of the
+sub-protocol, made by offsetting the arrays of a ProtocolTemplate that is
+compiled once per protocol.
+"""
+import sys
+
+from paml_check.temporal_problem import TemporalProblem
+
+# Joins the identity of a calling node to the identities in its instance
+INSTANCE_SEPARATOR = "|"
+
+
+class ProtocolTemplate:
+    """
+    The timepoints, edges and joins of one protocol, indexed from zero, and
+    the calls it makes to other protocols
+    """
+    __slots__ = ("identity", "prefixes", "suffixes", "edges", "joins", "start", "end",
+                 "nodes", "node_kinds", "behaviors", "calls")
+
+    def __init__(self, problem, protocol_id, calls=None):
+        """
+        :param problem: compiled TemporalProblem
+        :param protocol_id: identity of the protocol in problem
+        :param calls: problem.calls(), if already computed
+        """
+        calls = problem.calls() if calls is None else calls
+        indices = problem.protocol_timepoints[protocol_id]
+        local = {index: i for i, index in enumerate(indices)}
+        self.identity = protocol_id
+        # Timepoint names are "<start|end|duration>_<identity>"
+        split = [problem.timepoints[index].split("_", 1) for index in indices]
+        self.prefixes = [prefix for prefix, _ in split]
+        self.suffixes = [suffix for _, suffix in split]
+        self.edges = [(local[source], local[target], intervals)
+                      for (source, target, intervals) in problem.edges
+                      if source in local and target in local]
+        self.joins = [(local[j], [local[v] for v in grp])
+                      for (j, grp) in problem.joins
+                      if j in local and all(v in local for v in grp)]
+        start, end = problem.protocols[protocol_id]
+        self.start, self.end = local[start], local[end]
+        self.nodes = list(problem.protocol_nodes[protocol_id])
+        self.node_kinds = [problem.node_kinds[node] for node in self.nodes]
+        self.behaviors = [problem.behaviors.get(node) for node in self.nodes]
+        self.calls = [(local[problem.timepoint_index[f"start_{node}"]],
+                       local[problem.timepoint_index[f"end_{node}"]],
+                       node, called)
+                      for node, called in calls[protocol_id]]
+
+
+def instantiate(problem, templates=None):
+    """
+    Give each call to a sub-protocol its own instance of the sub-protocol's
+    timepoints.  Instance identities are the calling node's identity (itself
+    an instance identity for nested calls), INSTANCE_SEPARATOR, and the
+    original identity.  Top level protocols keep their identities.
+
+    A custom constraint on a sub-protocol applies to each of its instances.
+    Constraints that refer to more than one sub-protocol are not supported.
+    :param problem: compiled TemporalProblem
+    :param templates: dict from (protocol identity, content hash) to
+        ProtocolTemplate.  Templates are compiled into it on first use, and
+        reused by later calls while their protocol's timepoints, edges,
+        joins, nodes and calls are unchanged.
+    :return: TemporalProblem
+    :raises ValueError: if a constraint refers to more than one sub-protocol,
+        or a protocol calls itself
+    """
+    templates = {} if templates is None else templates
+    calls = problem.calls()
+    hashes = problem.content_hashes(calls)
+    called = {called for protocol_calls in calls.values() for _, called in protocol_calls}
+    instances = TemporalProblem(problem.name, epsilon=problem.epsilon, infinity=problem.infinity)
+    instance_names = {protocol_id: [] for protocol_id in called}
+
+    def template(protocol_id):
+        key = (protocol_id, hashes[protocol_id])
+        if key not in templates:
+            templates[key] = ProtocolTemplate(problem, protocol_id, calls)
+        return templates[key]
+
+    def add_instance(protocol_id, prefix, path):
+        if protocol_id in path:
+            raise ValueError(f"Protocol {protocol_id} calls itself")
+        t = template(protocol_id)
+        base = len(instances.timepoints)
+        names = [sys.intern(f"{kind}_{prefix}{suffix}") for kind, suffix in zip(t.prefixes, t.suffixes)]
+        instances.timepoints += names
+        instances.timepoint_index.update(zip(names, range(base, base + len(names))))
+        instances.edges += [(base + source, base + target, intervals) for (source, target, intervals) in t.edges]
+        instances.joins += [(base + j, [base + v for v in grp]) for (j, grp) in t.joins]
+
+        instance_id = prefix + protocol_id
+        instances.protocols[instance_id] = (base + t.start, base + t.end)
+        instances.protocol_timepoints[instance_id] = list(range(base, base + len(names)))
+        nodes = instances.protocol_nodes[instance_id] = [prefix + node for node in t.nodes]
+        instances.node_kinds.update(zip(nodes, t.node_kinds))
+        instances.behaviors.update((node, behavior) for node, behavior in zip(nodes, t.behaviors)
+                                   if behavior is not None)
+        if prefix:
+            original = [f"{kind}_{suffix}" for kind, suffix in zip(t.prefixes, t.suffixes)]
+            instance_names[protocol_id].append(dict(zip(original, names)))
+
+        for (call_start, call_end, node, called_id) in t.calls:
+            start, end = add_instance(called_id, f"{prefix}{node}{INSTANCE_SEPARATOR}", path + (protocol_id,))
+            # The instance spans the calling node
+            instances.edges.append((base + call_start, start, [[0, 0]]))
+            instances.edges.append((end, base + call_end, [[0, 0]]))
+        return base + t.start, base + t.end
+
+    for protocol_id in problem.protocols:
+        if protocol_id not in called:
+            add_instance(protocol_id, "", ())
+
+    owner = {problem.timepoints[i]: protocol_id
+             for protocol_id, indices in problem.protocol_timepoints.items() for i in indices}
+    for identity, clause in problem.constraints:
+        sub_protocols = {owner.get(name) for name in clause.timepoints()} & called
+        if not sub_protocols:
+            instances.constraints.append((identity, clause))
+        elif len(sub_protocols) == 1:
+            for names in instance_names[sub_protocols.pop()]:
+                instances.constraints.append((identity, clause.renamed(names)))
+        else:
+            raise ValueError(f"Time constraints {identity} refer to more than one sub-protocol")
+    return instances
@@ -1,42 +1,228 @@
 """
 Check a protocol for various properties, such as consistency
 """
+import asyncio
+import time
+
 import pysmt.shortcuts
 
 from paml_check.activity_graph import ActivityGraph
+from paml_check.dtp import DisjunctiveTemporalSolver
+from paml_check.hierarchy import summarize
+from paml_check.instances import instantiate
 from paml_check.utils import print_debug
 from paml_check.schedule import Schedule
+from paml_check.solver import ProblemSolver, SolverLimits, SolverTimeout
+from paml_check.stats import CheckStats, timed
 
-__all__ = ['check_doc']
+__all__ = ['check_doc', 'compile_doc', 'check_problem', 'enumerate_schedules',
+           'check_doc_async', 'get_minimum_duration_async', 'CheckResult', 'CheckStats']
 
 
-def check_doc(doc):
+class CheckResult:
+    """
+    Outcome of a check run under a time limit.  value is the Schedule (or
+    None if unsatisfiable) for check_doc_async, and the minimum duration dict
+    for get_minimum_duration_async.  It is None when the check timed out.
     """
-    Check a paml document for temporal consistency
+    SATISFIABLE = "sat"
+    UNSATISFIABLE = "unsat"
+    TIMEOUT = "timeout"
+
+    def __init__(self, status, value=None, graph=None, elapsed=None):
+        self.status = status
+        self.value = value
+        self.graph = graph
+        self.elapsed = elapsed
+
+    @property
+    def timed_out(self):
+        return self.status == self.TIMEOUT
+
+    def __repr__(self):
+        return f"CheckResult(status={self.status!r}, elapsed={self.elapsed})"
+
+
+def check_doc(doc, release=False, limits=None, stats=None, protocol=None, summaries=None, expand=False,
+              per_invocation=False, hint=None, backend="z3"):
+    """
+    Check a paml document for temporal consistency.
+    The check does not modify doc or any global sbol3 or pysmt state, so
+    documents may be checked concurrently from several threads.
     :param doc:
-    :return:
+    :param release: if True, drop the intermediate ActivityGraph once it is
+        compiled and return the TemporalProblem in its place
+    :param limits: SolverLimits for the check
+    :param stats: CheckStats to record phase timings and counts in
+    :param protocol: protocol, identity, or list of them, to check with the
+        sub-protocols they call and the time constraints that only refer to
+        them (default: all protocols in doc)
+    :param summaries: see check_problem
+    :param expand: see check_problem
+    :param per_invocation: schedule each call to a sub-protocol as a separate
+        instance of it (see instances.instantiate), rather than sharing one
+        time window between the calls
+    :param hint: see check_problem
+    :param backend: see check_problem
+    :return: (schedule or None, graph or problem)
+    :raises SolverTimeout: if limits expire before the check completes
     """
-    graph = ActivityGraph(doc)
+    if release:
+        problem = compile_doc(doc, stats=stats, protocol=protocol, per_invocation=per_invocation)
+        return check_problem(problem, limits=limits, stats=stats, summaries=summaries, expand=expand,
+                             hint=hint, backend=backend), problem
+
+    graph = ActivityGraph(doc, stats=stats, roots=_roots(protocol))
     # graph.print_debug()
+    problem = graph.compile()
+    if per_invocation:
+        problem = instantiate(problem)
 
-    formula = graph.generate_constraints()
-    result = check(formula)
-    if result:
-        s = Schedule(result, graph)
-        return s, graph
-    else:
-        return None, graph
+    return check_problem(problem, limits=limits, stats=stats, summaries=summaries, expand=expand,
+                         hint=hint, backend=backend), graph
 
-def get_minimum_duration(doc):
+def compile_doc(doc, destructive=False, stats=None, protocol=None, per_invocation=False, templates=None):
+    """
+    Compile a paml document into a self-contained TemporalProblem that does
+    not reference the document
+    :param doc:
+    :param destructive: build the graph from doc directly rather than a copy
+    :param stats: CheckStats to record phase timings and counts in
+    :param protocol: protocol, identity, or list of them, to compile (see check_doc)
+    :param per_invocation: give each call to a sub-protocol its own instance (see check_doc)
+    :param templates: dict caching the protocol templates of per_invocation
+        instances, by protocol identity and content (see instances.instantiate)
+    :return: TemporalProblem
+    """
+    problem = ActivityGraph(doc, destructive=destructive, stats=stats, roots=_roots(protocol)).compile()
+    if per_invocation:
+        with timed(stats, "instantiate"):
+            problem = instantiate(problem, templates)
+    return problem
+
+def check_problem(problem, limits=None, stats=None, summaries=None, expand=False, hint=None, backend="z3"):
+    """
+    Check a compiled problem for temporal consistency.  The check runs in its
+    own pysmt environment, which is released before returning.
+    :param problem: TemporalProblem
+    :param limits: SolverLimits for the check
+    :param stats: CheckStats to record phase timings and counts in
+    :param summaries: if not None, solve sub-protocols bottom-up and replace
+        their calls by their duration intervals, which are cached in this
+        dict by protocol identity and content (see hierarchy.summarize)
+    :param expand: with summaries, also solve the summarized sub-protocols
+        for the schedule of their activities
+    :param hint: model of a previous check, such as Schedule.assignment of
+        an earlier version of the document, for the solver to start from.
+        Timepoints are named after the identities of their nodes, so the
+        values of unchanged nodes carry over.
+    :param backend: "z3", or "dtp" to search over the alternatives of the
+        disjunctions with the DisjunctiveTemporalSolver, which is often
+        faster on problems with many disjunctive constraints
+    :return: Schedule or None
+    :raises SolverTimeout: if limits expire before the check completes
+    :raises ValueError: if the backend is unknown, or cannot represent a
+        constraint of the problem
+    """
+    solved = problem
+    if summaries is not None:
+        with timed(stats, "summarize"):
+            solved = summarize(problem, summaries, limits=limits, stats=stats)
+    with _solver_class(backend)(solved, limits=limits, stats=stats) as solver:
+        if hint:
+            solver.set_initial_values(hint)
+        if not solver.check():
+            return None
+        assignment = solver.get_assignment()
+    if summaries is not None and expand:
+        assignment = solved.expand_assignment(assignment, limits=limits)
+        solved = problem
+    with timed(stats, "schedule"):
+        return Schedule(assignment, solved)
+
+def enumerate_schedules(graph, k=None, min_difference=1.0, limits=None, stats=None, only_activities=True):
+    """
+    Generate schedules that differ from each other.  Each schedule starts
+    some activity at least min_difference seconds earlier or later than
+    every schedule before it.  One incremental solver is used, with a
+    diversity constraint added after each schedule, and schedules are
+    generated lazily, so callers may stop early.
+    :param graph: ActivityGraph or compiled TemporalProblem
+    :param k: maximum number of schedules (default: until none is left)
+    :param min_difference: seconds by which some activity start must differ
+    :param limits: SolverLimits for all of the checks
+    :param stats: CheckStats to record phase timings and counts in
+    :param only_activities: compare the starts of CallBehaviorAction
+        activities only, rather than of all nodes
+    :return: generator of Schedule
+    :raises ValueError: if min_difference is less than the problem's
+        epsilon, so that a schedule would not exclude itself
+    :raises SolverTimeout: if limits expire before the next schedule is found
+    """
+    problem = graph.compile()
+    if not min_difference >= problem.epsilon:
+        raise ValueError(f"min_difference must be at least {problem.epsilon}, got {min_difference}")
+    return _enumerate_schedules(problem, k, min_difference, limits, stats, only_activities)
+
+
+def _enumerate_schedules(problem, k, min_difference, limits, stats, only_activities):
+    nodes = [node for nodes in problem.protocol_nodes.values() for node in nodes
+             if f"start_{node}" in problem.timepoint_index and
+             (not only_activities or problem.node_kinds.get(node) == "CallBehaviorAction")]
+    starts = [f"start_{node}" for node in nodes]
+    count = 0
+    with ProblemSolver(problem, limits=limits, stats=stats) as solver:
+        mgr = solver.mgr
+        while (k is None or count < k) and solver.check():
+            assignment = solver.get_assignment()
+            with timed(stats, "schedule"):
+                schedule = Schedule(assignment, problem)
+            count += 1
+            yield schedule
+            if not starts:
+                return
+            solver.add_assertion(mgr.Or([
+                condition
+                for name in starts
+                for condition in (mgr.LE(solver.symbol(name), mgr.Real(assignment[name] - min_difference)),
+                                  mgr.GE(solver.symbol(name), mgr.Real(assignment[name] + min_difference)))
+            ]))
+
+def get_minimum_duration(doc, limits=None, deadline=None, callback=None, stats=None, protocol=None,
+                         hint=None, processes=None):
     """
     Get minimum duration for each protocol in doc
     :param doc:
+    :param limits: SolverLimits for the whole search
+    :param deadline: time.monotonic() value at which to stop and report the
+        best durations found so far
+    :param callback: progress callback, see ActivityGraph.get_minimum_duration
+    :param stats: CheckStats to record phase timings and counts in
+    :param protocol: protocol, identity, or list of them, to minimize (see check_doc)
+    :param hint: model of a previous check or search, such as of an earlier
+        version of doc, to start the search from
+    :param processes: if doc has disjunctive constraints, probe this many
+        bounds at once in worker processes
     :return: minimum duration dict, indexed by protocol id
+    :raises SolverTimeout: if limits expire before a first schedule is found
     """
-    graph = ActivityGraph(doc)
-    duration = graph.get_minimum_duration()
+    graph = ActivityGraph(doc, stats=stats, roots=_roots(protocol))
+    duration = graph.get_minimum_duration(limits=limits, deadline=deadline, callback=callback,
+                                          processes=processes, hint=hint)
     return duration
 
+def _solver_class(backend):
+    if backend == "z3":
+        return ProblemSolver
+    if backend == "dtp":
+        return DisjunctiveTemporalSolver
+    raise ValueError(f"Unknown backend {backend}")
+
+def _roots(protocol):
+    if protocol is None or isinstance(protocol, (list, tuple, set)):
+        return protocol
+    return [protocol]
+
 def check(formula):
     """
     Check whether a formula is satisfiable and return the model if so
@@ -44,3 +230,79 @@ def check(formula):
     :return:
     """
     return pysmt.shortcuts.get_model(formula)
+
+
+def _check_doc_result(doc, limits):
+    start = time.monotonic()
+    try:
+        schedule, problem = check_doc(doc, release=True, limits=limits)
+    except SolverTimeout:
+        return CheckResult(CheckResult.TIMEOUT, elapsed=time.monotonic() - start)
+    status = CheckResult.SATISFIABLE if schedule else CheckResult.UNSATISFIABLE
+    return CheckResult(status, value=schedule, graph=problem, elapsed=time.monotonic() - start)
+
+def _minimum_duration_result(doc, limits, callback=None):
+    start = time.monotonic()
+    try:
+        # Stop the search at the deadline and keep the best durations so far
+        durations = get_minimum_duration(doc, limits=limits, deadline=limits.deadline, callback=callback)
+    except SolverTimeout:
+        return CheckResult(CheckResult.TIMEOUT, elapsed=time.monotonic() - start)
+    if any(d is None for d in durations.values()):
+        status = CheckResult.UNSATISFIABLE
+    elif all(d["converged"] for d in durations.values()):
+        status = CheckResult.SATISFIABLE
+    else:
+        status = CheckResult.TIMEOUT
+    return CheckResult(status, value=durations, elapsed=time.monotonic() - start)
+
+# Time the worker is given to return its own (possibly partial) result after
+# the timeout, before the caller stops waiting for it
+_TIMEOUT_GRACE = 0.5
+
+async def _run_limited(func, doc, timeout, rlimit, executor, *args):
+    """
+    Run func(doc, limits, *args) in an executor.  If the timeout passes
+    first, or the awaiting task is cancelled, the limits are cancelled so
+    that the worker stops at its current solver call rather than running on
+    unobserved.
+    """
+    limits = SolverLimits(timeout=timeout, rlimit=rlimit)
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(executor, func, doc, limits, *args)
+    try:
+        wait = timeout + _TIMEOUT_GRACE if timeout is not None else None
+        return await asyncio.wait_for(asyncio.shield(future), wait)
+    except asyncio.TimeoutError:
+        limits.cancel()
+        return CheckResult(CheckResult.TIMEOUT, elapsed=timeout)
+    except asyncio.CancelledError:
+        limits.cancel()
+        raise
+
+async def check_doc_async(doc, timeout=None, rlimit=None, executor=None):
+    """
+    Check a paml document for temporal consistency without blocking the
+    event loop
+    :param doc:
+    :param timeout: wall clock seconds allowed for the check, or None
+    :param rlimit: z3 resource limit for each solver call, or None
+    :param executor: concurrent.futures executor (default: the loop's)
+    :return: CheckResult whose value is the Schedule
+    """
+    return await _run_limited(_check_doc_result, doc, timeout, rlimit, executor)
+
+async def get_minimum_duration_async(doc, timeout=None, rlimit=None, executor=None, callback=None):
+    """
+    Get minimum duration for each protocol in doc without blocking the
+    event loop.  When the timeout passes after a first schedule was found,
+    the result has status TIMEOUT and holds the best durations found.
+    :param doc:
+    :param timeout: wall clock seconds allowed for the search, or None
+    :param rlimit: z3 resource limit for each solver call, or None
+    :param executor: concurrent.futures executor (default: the loop's)
+    :param callback: progress callback, see ActivityGraph.get_minimum_duration.
+        It is called from the executor thread.
+    :return: CheckResult whose value is the minimum duration dict
+    """
+    return await _run_limited(_minimum_duration_result, doc, timeout, rlimit, executor, callback)
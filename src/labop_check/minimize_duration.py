@@ -1,41 +1,114 @@
 """
 Helper to minimize duration of protocol
 """
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+import time
 
 import pysmt
 
+from paml_check.solver import ProblemSolver, SolverLimits, SolverTimeout
+
 class MinimizeDuration():
     """
     Helper class to find minimum duration for a protocol
     """
 
-    def __init__(self, base_formula, graph, protocol, threshold=0.1):
+    def __init__(self, base_formula, graph, protocol, threshold=0.1, solver=None, assumptions=(), hint=None):
         """
         Initialize variables for the search
-        :param base_formula:
+        :param base_formula: formula to check in the global environment, or
+            None when solver is given
         :param graph:
-        :param protocol:
+        :param protocol: protocol, or its identity when solver is given
         :param threshold:
+        :param solver: ProblemSolver with the compiled graph asserted.  Bounds
+            are then checked incrementally as assumptions in its private
+            environment rather than by solving base_formula from scratch.
+        :param assumptions: formulas in the solver's environment to assume in
+            every check, along with the bounds
+        :param hint: model of a previous search, such as of an earlier
+            version of the problem (only used with a solver).  The search
+            first checks for a duration within threshold of the hint's,
+            starting from the hint's values, and then for a shorter one.
         """
         self.graph = graph
         self.base_formula = base_formula
         self.protocol = protocol
         self.threshold = threshold
-        self.end_time_point_var = self.graph.get_end_time_var(self.protocol)
+        self.solver = solver
+        self.assumptions = list(assumptions)
+        self.hint = hint
+        if solver is None:
+            self.end_time_point_var = self.graph.get_end_time_var(self.protocol)
+        else:
+            self.protocol_identity = str(getattr(protocol, "identity", protocol))
+            self.end_time_point_var = solver.symbol(solver.problem.get_end_time_name(self.protocol_identity))
+
+    def minimize(self, supremum_duration, infimum_duration=0.0, incumbent_result=None,
+                 deadline=None, callback=None):
+        """
+        Search for minimum duration of a protocol
+        :param infimum_duration:
+        :param supremum_duration:
+        :param deadline: time.monotonic() value after which to stop early
+        :param callback: called with (supremum, infimum, incumbent) after each solver call
+        :return: minimum (or best found before deadline), and its model
+        """
+        duration, result = supremum_duration, incumbent_result
+        for duration, infimum_duration, result in self.iter_minimize(supremum_duration,
+                                                                     infimum_duration=infimum_duration,
+                                                                     incumbent_result=incumbent_result,
+                                                                     deadline=deadline):
+            if callback:
+                callback(duration, infimum_duration, result)
+        return duration, result
 
-    def minimize(self, supremum_duration, infimum_duration=0.0, incumbent_result=None):
+    def iter_minimize(self, supremum_duration, infimum_duration=0.0, incumbent_result=None, deadline=None):
         """
-        Recursive search for minimum duration of a protocol
+        Anytime bisection search for minimum duration of a protocol.
+        After each solver call, yield the current bounds and the incumbent
+        model, whose duration is the supremum.  Stops when the bounds are
+        within threshold, or when deadline passes.
         :param infimum_duration:
         :param supremum_duration:
-        :return: minimum
+        :param incumbent_result: model with duration supremum_duration
+        :param deadline: time.monotonic() value after which to stop
+        :return: generator of (supremum, infimum, incumbent)
         """
-        if supremum_duration - infimum_duration > self.threshold:
+        hinted_duration = None
+        if self.solver is not None and self.hint:
+            hinted_duration = self.hint.get(self.solver.problem.get_end_time_name(self.protocol_identity))
+        # With a hint, check first for the hint's duration, starting from its
+        # values, and then for anything shorter, so that the search of an
+        # unchanged problem takes two checks rather than a bisection
+        verify = hinted_duration is not None
+        while supremum_duration - infimum_duration > self.threshold:
             # Have not found a suitably minimal duration yet
+            timeout = None
+            if deadline is not None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    return
 
             # Check whether there is a smaller duration below the midpoint
             mid_duration = (infimum_duration + supremum_duration) / 2.0
-            left_duration, result = self.bounded_check(infimum_duration, mid_duration)
+            if hinted_duration is not None and \
+                    infimum_duration < hinted_duration + self.threshold < supremum_duration:
+                self.solver.set_initial_values(self.hint)
+                mid_duration = hinted_duration + self.threshold
+            elif verify:
+                mid_duration = max(supremum_duration - self.threshold, mid_duration)
+                verify = False
+            hinted_duration = None
+            try:
+                left_duration, result = self.bounded_check(infimum_duration, mid_duration, timeout=timeout)
+            except SolverTimeout:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return
+                raise
 
             if left_duration:
                 # Found a smaller duration, update suprememum
@@ -45,23 +118,19 @@ class MinimizeDuration():
                 # Did not find a smaller duration, so update infimum
                 infimum_duration = mid_duration
 
-            # Recurse on the half that has a possible minimum
-            duration, result = self.minimize(supremum_duration,
-                                             infimum_duration=infimum_duration,
-                                             incumbent_result=incumbent_result)
-        else:
-            duration = supremum_duration
-            result = incumbent_result
-
-        return duration, result
+            yield supremum_duration, infimum_duration, incumbent_result
 
-    def bounded_check(self, infimum_duration, supremum_duration):
+    def bounded_check(self, infimum_duration, supremum_duration, timeout=None):
         """
         Encode constraints for infimum and supremum and check if feasible
         :param infimum_duration:
         :param supremum_duration:
+        :param timeout: seconds allowed for the check (only used with a solver)
         :return: duration if feasible or None
         """
+        if self.solver is not None:
+            return self._bounded_check_incremental(infimum_duration, supremum_duration, timeout)
+
         formula = pysmt.shortcuts.And([
             self.base_formula,
             pysmt.shortcuts.LT(self.end_time_point_var, pysmt.shortcuts.Real(supremum_duration)),
@@ -73,3 +142,228 @@ class MinimizeDuration():
             duration = self.graph.get_duration(result, self.protocol)
 
         return duration, result
+
+    def _bounded_check_incremental(self, infimum_duration, supremum_duration, timeout):
+        mgr = self.solver.mgr
+        if self.solver.stats is not None:
+            self.solver.stats.count("minimize_solver_calls")
+        bounds = self.assumptions + [
+            mgr.LT(self.end_time_point_var, mgr.Real(supremum_duration)),
+            mgr.GE(self.end_time_point_var, mgr.Real(infimum_duration)),
+        ]
+        result = None
+        duration = None
+        if self.solver.check(bounds, timeout=timeout):
+            result = self.solver.get_assignment()
+            duration = self.solver.problem.get_duration(result, self.protocol_identity)
+
+        return duration, result
+
+
+# State of a worker process of ParallelMinimizeDuration
+_worker = {}
+
+
+def _init_worker(problem, bounds, rlimit):
+    # SolverLimits holds a lock, so only its rlimit is sent to the worker
+    limits = SolverLimits(rlimit=rlimit) if rlimit is not None else None
+    _worker["solver"] = ProblemSolver(problem, limits=limits)
+    _worker["bounds"] = bounds
+
+
+def _relevant(bound, bounds):
+    """
+    A probe for a duration below bound is still needed unless a duration
+    below bound was found (supremum < bound) or none exists below it
+    (bound <= infimum)
+    :param bound:
+    :param bounds: shared (infimum, supremum) array
+    :return:
+    """
+    with bounds.get_lock():
+        infimum, supremum = bounds[0], bounds[1]
+    return infimum < bound <= supremum
+
+
+def _probe(protocol_id, infimum_duration, bound, timeout):
+    """
+    Check for a duration in [infimum_duration, bound) in the solver of this
+    worker process.  A thread interrupts the check as soon as the shared
+    bounds show that its answer is no longer needed.
+    :return: (duration, model), with None for both if there is no such
+        duration, or None if the check was cancelled or timed out
+    """
+    solver = _worker["solver"]
+    bounds = _worker["bounds"]
+    if not _relevant(bound, bounds):
+        return None
+    mgr = solver.mgr
+    end = solver.symbol(solver.problem.get_end_time_name(protocol_id))
+    done = threading.Event()
+
+    def watch():
+        while not done.wait(0.01):
+            if not _relevant(bound, bounds):
+                solver.interrupt()
+                return
+
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    try:
+        feasible = solver.check([mgr.LT(end, mgr.Real(bound)), mgr.GE(end, mgr.Real(infimum_duration))],
+                                timeout=timeout)
+    except SolverTimeout:
+        return None
+    finally:
+        # Only interrupt the check, not reading the model
+        done.set()
+        watcher.join()
+    if not feasible:
+        return None, None
+    result = solver.get_assignment()
+    return solver.problem.get_duration(result, protocol_id), result
+
+
+class ParallelMinimizeDuration():
+    """
+    Speculative k-ary search for the minimum duration of protocols, for
+    problems with disjunctive constraints, where each check is expensive.
+    Each round probes k bounds that split the interval between the infimum
+    and supremum into k + 1 parts, in worker processes that each hold a
+    solver for the problem, and so narrows the interval by a factor of k + 1
+    rather than 2.  Probes that earlier answers make irrelevant are
+    interrupted.
+    """
+
+    def __init__(self, problem, processes=None, k=None, threshold=0.1, limits=None, stats=None):
+        """
+        Start the worker processes
+        :param problem: TemporalProblem, which is sent to each worker
+        :param processes: number of worker processes (default: os.cpu_count())
+        :param k: bounds probed in each round (default: processes)
+        :param threshold:
+        :param limits: SolverLimits whose rlimit applies to each probe (the
+            deadline is applied by iter_minimize)
+        :param stats: CheckStats to count the probes in
+        """
+        self.problem = problem
+        self.stats = stats
+        self.processes = processes or os.cpu_count() or 1
+        self.k = k or self.processes
+        self.threshold = threshold
+        self.cancelled = False
+        context = multiprocessing.get_context("spawn")
+        self.bounds = context.Array("d", [0.0, 0.0])
+        # The deadline and cancellation are applied here; workers only need the rlimit
+        rlimit = limits.rlimit if limits is not None else None
+        self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.processes, mp_context=context,
+                                                           initializer=_init_worker,
+                                                           initargs=(problem, self.bounds, rlimit))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Stop the probes in progress and the worker processes
+        :return:
+        """
+        self.interrupt()
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+    def interrupt(self):
+        """
+        Stop the search, making every probe irrelevant so that the workers
+        stop checking.  May be called from any thread, such as by
+        SolverLimits.cancel().
+        :return:
+        """
+        self.cancelled = True
+        with self.bounds.get_lock():
+            self.bounds[0] = float("inf")
+            self.bounds[1] = float("-inf")
+
+    def _publish(self, infimum_duration, supremum_duration):
+        with self.bounds.get_lock():
+            if self.cancelled:
+                return
+            self.bounds[0] = infimum_duration
+            self.bounds[1] = supremum_duration
+
+    def minimize(self, protocol_id, supremum_duration, infimum_duration=0.0, incumbent_result=None,
+                 deadline=None, callback=None):
+        """
+        Search for minimum duration of a protocol
+        :param protocol_id:
+        :param supremum_duration:
+        :param infimum_duration:
+        :param incumbent_result: model with duration supremum_duration
+        :param deadline: time.monotonic() value after which to stop early
+        :param callback: called with (supremum, infimum, incumbent) after each round
+        :return: minimum (or best found before deadline), and its model
+        """
+        duration, result = supremum_duration, incumbent_result
+        for duration, infimum_duration, result in self.iter_minimize(protocol_id, supremum_duration,
+                                                                     infimum_duration=infimum_duration,
+                                                                     incumbent_result=incumbent_result,
+                                                                     deadline=deadline):
+            if callback:
+                callback(duration, infimum_duration, result)
+        return duration, result
+
+    def iter_minimize(self, protocol_id, supremum_duration, infimum_duration=0.0, incumbent_result=None,
+                      deadline=None):
+        """
+        Anytime k-ary search for minimum duration of a protocol.  After each
+        round of probes, yield the current bounds and the incumbent model,
+        as MinimizeDuration.iter_minimize does after each solver call.
+        :param protocol_id:
+        :param supremum_duration:
+        :param infimum_duration:
+        :param incumbent_result: model with duration supremum_duration
+        :param deadline: time.monotonic() value after which to stop
+        :return: generator of (supremum, infimum, incumbent)
+        :raises SolverTimeout: if the search is interrupted, or a round of
+            probes ends without an answer
+        """
+        protocol_id = str(getattr(protocol_id, "identity", protocol_id))
+        while supremum_duration - infimum_duration > self.threshold:
+            if self.cancelled:
+                raise SolverTimeout("Search was interrupted")
+            timeout = None
+            if deadline is not None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    return
+
+            width = (supremum_duration - infimum_duration) / (self.k + 1)
+            probes = [infimum_duration + width * (i + 1) for i in range(self.k)]
+            self._publish(infimum_duration, supremum_duration)
+            if self.stats is not None:
+                self.stats.count("minimize_solver_calls", len(probes))
+            futures = {self.pool.submit(_probe, protocol_id, infimum_duration, bound, timeout): bound
+                       for bound in probes}
+            answered = False
+            for future in concurrent.futures.as_completed(futures):
+                answer = future.result()
+                if answer is None:
+                    continue
+                answered = True
+                duration, result = answer
+                if duration is not None:
+                    if duration < supremum_duration:
+                        supremum_duration = duration
+                        incumbent_result = result
+                else:
+                    infimum_duration = max(infimum_duration, futures[future])
+                self._publish(infimum_duration, supremum_duration)
+
+            if not answered:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return
+                raise SolverTimeout("No probe answered within its limits")
+
+            yield supremum_duration, infimum_duration, incumbent_result
@@ -0,0 +1,304 @@
+"""
+Monitor the execution of a protocol.  Observed start and end times of
+activities are propagated through the temporal network of the compiled
+problem, violated constraints are reported as they are observed or become
+unavoidable, and the rest of the schedule is re-planned at its earliest
+times.
+"""
+import datetime
+import heapq
+import logging
+
+from paml_check.schedule import Schedule
+from paml_check.solver import ProblemSolver
+from paml_check.stn import SimpleTemporalNetwork
+
+l = logging.getLogger(__file__)
+l.setLevel(logging.ERROR)
+
+
+class Violation:
+    """
+    A constraint that the observed times violate
+    """
+    __slots__ = ("identities", "activities", "timepoint", "amount", "observed")
+
+    def __init__(self, identities, activities, timepoint, amount, observed):
+        """
+        :param identities: identities of the TimeConstraints involved
+        :param activities: identities of the activities involved
+        :param timepoint: name of the timepoint at which the violation was found
+        :param amount: seconds by which the constraints are violated
+        :param observed: True if the violation is between observed times
+            alone, False if the remaining schedule can no longer meet the
+            constraints
+        """
+        self.identities = identities
+        self.activities = activities
+        self.timepoint = timepoint
+        self.amount = amount
+        self.observed = observed
+
+    def __repr__(self):
+        return (f"Violation(identities={self.identities}, activities={self.activities}, "
+                f"amount={self.amount}, observed={self.observed})")
+
+
+class ExecutionMonitor:
+    """
+    Track the execution of a checked schedule.  The disjunctive choices of
+    the planned schedule (which interval of a disjunctive edge or
+    constraint holds) are kept, so each observation is propagated through a
+    simple temporal network in time proportional to the edges it affects,
+    without solving the problem again.  Only when an observation conflicts
+    with one of these choices is the problem solved again, with the
+    observed times fixed, for a plan that makes other choices.
+    """
+
+    def __init__(self, graph, schedule=None, limits=None):
+        """
+        :param graph: ActivityGraph or compiled TemporalProblem
+        :param schedule: planned Schedule (default: solve the problem for one)
+        :param limits: SolverLimits for solving the problem when no schedule is given
+        :raises ValueError: if the problem has no schedule
+        """
+        self.problem = graph.compile()
+        self.limits = limits
+        if schedule is None:
+            with ProblemSolver(self.problem, limits=limits) as solver:
+                if not solver.check():
+                    raise ValueError(f"{self.problem.name} has no schedule to monitor")
+                schedule = Schedule(solver.get_assignment(), self.problem)
+        self.start_time = schedule.start_time
+        self.planned = dict(schedule.assignment)
+        self.network = SimpleTemporalNetwork.from_problem(self.problem, self.planned)
+        self.network.initialize([self.planned[name] for name in self.problem.timepoints])
+        self.observed = {}
+        self.now = None
+        self.violations = []
+        self._reported = {}
+
+        # Parts of the problem that the network does not represent exactly
+        # are checked once all of their timepoints are observed
+        self._exact_edges = [[] for _ in self.problem.timepoints]
+        self._choices = set()
+        for k, (source, target, intervals) in enumerate(self.problem.edges):
+            if len(intervals) != 1:
+                self._exact_edges[source].append(k)
+                self._exact_edges[target].append(k)
+                self._choices.add(("edge", k))
+        self._exact_joins = [[] for _ in self.problem.timepoints]
+        for k, (j, members) in enumerate(self.problem.joins):
+            for i in [j] + members:
+                self._exact_joins[i].append(k)
+        self._exact_constraints = [[] for _ in self.problem.timepoints]
+        for identity, clause in self.problem.constraints:
+            if not SimpleTemporalNetwork.is_simple(clause):
+                self._choices.add(("constraint", identity))
+                for name in set(clause.timepoints()):
+                    self._exact_constraints[self.problem.timepoint_index[name]].append((identity, clause))
+
+        # Timepoints in no edge, join or constraint, such as the durations,
+        # only follow the current time, so they are not queued
+        constrained = {i for source, target, _ in self.problem.edges for i in (source, target)}
+        constrained |= {i for j, members in self.problem.joins for i in [j] + members}
+        constrained |= {self.problem.timepoint_index[name] for _, clause in self.problem.constraints
+                        for name in clause.timepoints()}
+        self._free = [i for i in range(len(self.problem.timepoints)) if i not in constrained]
+        self._reset_pending()
+
+    def observe(self, observations, now=None):
+        """
+        Record observed times
+        :param observations: dict from timepoint name ("start_<activity>" or
+            "end_<activity>") to seconds from the start of the schedule, or
+            to a datetime
+        :param now: current time, in seconds or as a datetime.  Timepoints
+            not yet observed, and not known to have passed, are re-planned
+            to happen no earlier.
+        :return: list of the new Violations
+        """
+        indices = []
+        for name, value in observations.items():
+            index = self.problem.timepoint_index.get(name)
+            if index is None:
+                raise ValueError(f"Unknown timepoint: {name}")
+            self.observed[name] = self._seconds(value)
+            indices.append(index)
+        if now is not None:
+            self.now = max(self._seconds(now), self.now if self.now is not None else 0.0)
+
+        conflicts = self._update(indices)
+        if any(label in self._choices for conflict in conflicts for label in conflict.reasons):
+            replanned = self._replan()
+            if replanned is not None:
+                conflicts = replanned
+
+        new = {("observation", name) for name in observations}
+        violations = {}
+        for conflict in conflicts:
+            violation = self._violation(conflict)
+            if conflict.repeated and not violation.identities:
+                # A consequence of a violation reported before
+                continue
+            # Report the first conflict derived from each cause
+            key = tuple(violation.identities) or \
+                tuple(label for label in conflict.reasons if label in new) or \
+                tuple(label for label in conflict.reasons if label[0] == "observation")
+            violations.setdefault(key, violation)
+        for violation in self._check_exact(indices):
+            violations[tuple(violation.identities) or tuple(violation.activities)] = violation
+        # Violations reported by earlier observations are reported again only if they grew
+        violations = {key: violation for key, violation in violations.items()
+                      if key not in self._reported or
+                      (violation.amount or 0.0) > self._reported[key] + self.problem.epsilon}
+        self._reported.update((key, violation.amount or 0.0) for key, violation in violations.items())
+        violations = list(violations.values())
+        self.violations += violations
+        for violation in violations:
+            l.warning(f"Time constraint violation: {violation}")
+        return violations
+
+    def _update(self, indices):
+        """
+        Fix the observed timepoints and propagate them, and the current time
+        :param indices: the timepoints observed
+        :return: list of Conflict
+        """
+        network = self.network
+        conflicts = []
+        for index in indices:
+            name = self.problem.timepoints[index]
+            conflicts += network.fix(index, self.observed[name], ("observation", name))
+        network.propagate(indices, conflicts)
+        if self.now is not None:
+            changed = []
+            overdue = []
+            pending = self._pending
+            # Only the timepoints whose lower bound now has passed are visited
+            while pending and pending[0][0] < self.now:
+                _, index = heapq.heappop(pending)
+                if network.fixed[index]:
+                    continue
+                if network.lower[index] >= self.now:
+                    # Propagation raised the bound since it was pushed
+                    heapq.heappush(pending, (network.lower[index], index))
+                elif self.now <= network.upper[index]:
+                    # A timepoint that must precede an observed time has passed
+                    conflicts += network.add_bound(index, self.now, network.infinity, ("now", self.now))
+                    changed.append(index)
+                    heapq.heappush(pending, (network.lower[index], index))
+                else:
+                    # Its latest time has passed, so it is left as planned
+                    # until it is observed
+                    overdue.append((network.lower[index], index))
+            for item in overdue:
+                heapq.heappush(pending, item)
+            network.propagate(changed, conflicts)
+        return conflicts
+
+    def _reset_pending(self):
+        """
+        Queue the constrained timepoints not yet observed by their lower
+        bounds.  Bounds only rise between resets, so a queued bound may be
+        stale but is never above the timepoint's bound.
+        """
+        free = set(self._free)
+        self._pending = [(lower, index) for index, (lower, fixed) in
+                         enumerate(zip(self.network.lower, self.network.fixed)) if not fixed and index not in free]
+        heapq.heapify(self._pending)
+
+    def _replan(self):
+        """
+        Solve the problem with the observed times fixed, and rebuild the
+        network from the new plan
+        :return: list of Conflict of the new network, or None if the
+            observations leave the problem without a schedule
+        """
+        with ProblemSolver(self.problem, limits=self.limits) as solver:
+            mgr = solver.mgr
+            if not solver.check([mgr.Equals(solver.symbol(name), mgr.Real(value))
+                                 for name, value in self.observed.items()]):
+                return None
+            self.planned = solver.get_assignment()
+        l.info(f"Re-planned {self.problem.name} with {len(self.observed)} observed times")
+        self.network = SimpleTemporalNetwork.from_problem(self.problem, self.planned)
+        self.network.initialize([self.planned[name] for name in self.problem.timepoints])
+        self._reset_pending()
+        return self._update([self.problem.timepoint_index[name] for name in self.observed])
+
+    def schedule(self):
+        """
+        The observed times, and the earliest times of the timepoints not yet
+        observed
+        :return: Schedule
+        """
+        earliest = self.network.earliest()
+        if self.now is not None:
+            for index in self._free:
+                if not self.network.fixed[index]:
+                    name = self.problem.timepoints[index]
+                    earliest[name] = max(earliest[name], self.now)
+        return Schedule(earliest, self.problem, start_time=self.start_time)
+
+    def _seconds(self, value):
+        if isinstance(value, datetime.datetime):
+            return (value - self.start_time).total_seconds()
+        return float(value)
+
+    def _activities(self, timepoints):
+        # Timepoint names are "<start|end|duration>_<activity identity>"
+        return sorted({self.problem.timepoints[i].split("_", 1)[1] for i in timepoints})
+
+    def _violation(self, conflict):
+        identities = []
+        timepoints = {conflict.timepoint}
+        observed = self.network.fixed[conflict.timepoint]
+        for kind, detail in conflict.reasons:
+            if kind == "constraint":
+                identities.append(detail)
+            elif kind == "edge":
+                source, target, _ = self.problem.edges[detail]
+                timepoints |= {source, target}
+                observed = observed and self.network.fixed[source] and self.network.fixed[target]
+            elif kind == "join":
+                j, members = self.problem.joins[detail]
+                timepoints |= {j, *members}
+            elif kind == "now":
+                observed = False
+        return Violation(identities, self._activities(timepoints),
+                         self.problem.timepoints[conflict.timepoint], conflict.amount, observed)
+
+    def _check_exact(self, changed):
+        violations = []
+        fixed = self.network.fixed
+        lower = self.network.lower
+        edges = {k for i in changed if fixed[i] for k in self._exact_edges[i]}
+        for k in sorted(edges):
+            source, target, intervals = self.problem.edges[k]
+            if fixed[source] and fixed[target]:
+                difference = lower[target] - lower[source]
+                amount = min((max(low - difference, difference - high) for low, high in intervals),
+                             default=float("inf"))
+                if amount > self.problem.epsilon:
+                    violations.append(Violation([], self._activities([source, target]),
+                                                self.problem.timepoints[target], amount, True))
+        joins = {k for i in changed if fixed[i] for k in self._exact_joins[i]}
+        for k in sorted(joins):
+            j, members = self.problem.joins[k]
+            if fixed[j] and all(fixed[m] for m in members):
+                amount = min(abs(lower[j] - lower[m]) for m in members)
+                if amount > self.problem.epsilon:
+                    violations.append(Violation([], self._activities([j] + members),
+                                                self.problem.timepoints[j], amount, True))
+        constraints = {}
+        for i in changed:
+            if fixed[i]:
+                constraints.update((id(clause), (identity, clause)) for identity, clause in self._exact_constraints[i])
+        for identity, clause in constraints.values():
+            names = list(clause.timepoints())
+            if all(fixed[self.problem.timepoint_index[name]] for name in names) and \
+                    not clause.holds(self.observed, self.problem.epsilon):
+                indices = [self.problem.timepoint_index[name] for name in names]
+                violations.append(Violation([identity], self._activities(indices), names[-1], None, True))
+        return violations
@@ -0,0 +1,170 @@
+"""
+Joint minimization of the end times of all protocols of a problem.  Rather
+than a bisection search per protocol, with the other protocols left free, the
+objectives are handed to z3's optimizer, which finds one schedule that is
+optimal for all of them in a single call.
+"""
+import pysmt.environment
+import pysmt.shortcuts
+import z3
+
+from paml_check.solver import SolverTimeout, _Z3_NO_TIMEOUT
+from paml_check.stats import timed
+from pysmt.solvers.z3 import Z3Converter
+
+
+class ProblemOptimizer:
+    """
+    z3 Optimize context for a TemporalProblem.  Like ProblemSolver, it owns
+    its pysmt Environment and z3 Context, so it can be used concurrently with
+    other solvers.  pysmt has no interface to z3's optimizer, so the problem
+    formula is converted and asserted directly.
+    """
+
+    def __init__(self, problem, limits=None, stats=None):
+        """
+        Build the problem formula and assert it in a new optimizer
+        :param problem: TemporalProblem
+        :param limits: SolverLimits applied to the optimization
+        :param stats: CheckStats to record solver calls in
+        """
+        self.problem = problem
+        self.limits = limits
+        self.stats = stats
+        self.env = pysmt.environment.Environment()
+        self.mgr = self.env.formula_manager
+        self.symbols = problem.symbols(self.mgr)
+        self.z3 = z3.Optimize(ctx=z3.Context())
+        self.converter = Z3Converter(self.env, z3_ctx=self.z3.ctx)
+        if limits is not None and limits.rlimit is not None:
+            self.z3.set("rlimit", limits.rlimit)
+        with timed(stats, "generate_constraints"):
+            formula = problem.to_formula(self.mgr, self.symbols)
+        self.z3.add(self.converter.convert(formula))
+        if limits is not None:
+            limits.register(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Release the optimizer and its environment
+        :return:
+        """
+        if self.limits is not None:
+            self.limits.unregister(self)
+        self.z3 = None
+        self.converter = None
+        self.symbols = None
+        self.mgr = None
+        self.env = None
+
+    def symbol(self, name):
+        return self.symbols[self.problem.timepoint_index[name]]
+
+    def add_assertion(self, formula):
+        """
+        Assert a formula, built with self.mgr
+        :param formula:
+        :return:
+        """
+        self.z3.add(self.converter.convert(formula))
+
+    def minimize(self, term):
+        """
+        Add an objective.  Objectives are minimized lexicographically, in the
+        order they are added.
+        :param term: real valued formula, built with self.mgr
+        :return:
+        """
+        self.z3.minimize(self.converter.convert(term))
+
+    def interrupt(self):
+        """
+        Ask an optimization running in another thread to stop
+        :return:
+        """
+        optimizer = self.z3
+        if optimizer is not None:
+            optimizer.ctx.interrupt()
+
+    def check(self):
+        """
+        Find a model that minimizes the objectives
+        :return: True if the problem is satisfiable
+        :raises SolverTimeout: if the limits expire before the optimizer answers
+        """
+        timeout = None
+        if self.limits is not None:
+            if self.limits.expired():
+                raise SolverTimeout("Solver limits expired before check")
+            timeout = self.limits.remaining()
+        self.z3.set("timeout", max(1, int(timeout * 1000)) if timeout is not None else _Z3_NO_TIMEOUT)
+        try:
+            with timed(self.stats, "solve"):
+                result = self.z3.check()
+        finally:
+            if self.stats is not None:
+                self.stats.count("solver_calls")
+        if result == z3.unknown:
+            raise SolverTimeout("Solver did not answer within its limits")
+        return result == z3.sat
+
+    def get_assignment(self):
+        """
+        Values of all timepoints in the optimal model
+        :return: dict from timepoint name to float
+        """
+        model = self.z3.model()
+        convert = self.converter.convert
+        return {name: float(model.eval(convert(s), model_completion=True).as_fraction())
+                for name, s in zip(self.problem.timepoints, self.symbols)}
+
+
+def minimize_jointly(graph, weights=None, order=None, makespan=False, limits=None, stats=None):
+    """
+    Minimize the end times of all protocols in one optimization call
+    :param graph: ActivityGraph or compiled TemporalProblem
+    :param weights: dict from protocol id to the weight of its end time in a
+        weighted sum objective (default: 1.0 for every protocol)
+    :param order: list of protocol ids whose end times are minimized
+        lexicographically, in this order, before the weighted sum of the
+        others.  The weights of listed protocols are ignored.
+    :param makespan: first minimize the latest end time of any protocol
+    :param limits: SolverLimits for the optimization
+    :param stats: CheckStats to record the solver call in
+    :return: (assignment, dict from protocol id to its duration), or
+        (None, None) if the problem is infeasible
+    :raises ValueError: if a protocol id in weights or order is not a
+        protocol of the problem
+    """
+    problem = graph.compile()
+    weights = {str(protocol_id): weight for protocol_id, weight in (weights or {}).items()}
+    order = [str(protocol_id) for protocol_id in (order or [])]
+    for protocol_id in list(weights) + order:
+        if protocol_id not in problem.protocols:
+            raise ValueError(f"No protocol {protocol_id}")
+
+    with ProblemOptimizer(problem, limits=limits, stats=stats) as optimizer, timed(stats, "minimize"):
+        mgr = optimizer.mgr
+        ends = {protocol_id: optimizer.symbol(problem.get_end_time_name(protocol_id))
+                for protocol_id in problem.protocols}
+        if makespan and ends:
+            latest = mgr.Symbol("makespan", pysmt.shortcuts.REAL)
+            optimizer.add_assertion(mgr.And([mgr.GE(latest, end) for end in ends.values()]))
+            optimizer.minimize(latest)
+        for protocol_id in order:
+            optimizer.minimize(ends[protocol_id])
+        weighted = [mgr.Times(mgr.Real(float(weights.get(protocol_id, 1.0))), end)
+                    for protocol_id, end in ends.items() if protocol_id not in order]
+        if weighted:
+            optimizer.minimize(mgr.Plus(weighted))
+        if not optimizer.check():
+            return None, None
+        assignment = optimizer.get_assignment()
+    return assignment, {protocol_id: problem.get_duration(assignment, protocol_id)
+                        for protocol_id in problem.protocols}
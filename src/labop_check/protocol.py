@@ -1,4 +1,6 @@
 import math
+import sys
+import warnings
 import paml
 import uml
 import graphviz
@@ -7,7 +9,8 @@ from paml_check.constraints import \
     binary_temporal_constraint, \
     join_constraint, \
     unary_temporal_constaint, \
-    duration_constraint
+    duration_constraint, \
+    Conjunction
 from paml_check.utils import Interval
 # from paml_check.minimize_duration import MinimizeDuration
 from paml_check.convert_constraints import ConstraintConverter
@@ -23,47 +26,88 @@ l.setLevel(logging.ERROR)
 
 
 class TimeVariable:
-    def __init__(self, prefix, ref):
+    """
+    A start, end, or duration timepoint of an activity node.  Instances are
+    slotted and share an interned identity string with their group so that
+    large documents do not pay for a per-instance __dict__.
+    """
+    __slots__ = ("ref", "prefix", "identity", "name", "value")
+
+    def __init__(self, prefix, ref, identity=None):
         self.ref = ref
         self.prefix = prefix
-        self.name = f"{prefix}_{ref.identity}"
-        self.symbol = pysmt.shortcuts.Symbol(self.name, pysmt.shortcuts.REAL)
+        self.identity = identity if identity is not None else sys.intern(str(ref.identity))
+        self.name = sys.intern(f"{prefix}_{self.identity}")
         self.value = None
 
+    def to_symbol(self, mgr=None):
+        """
+        Look up the pysmt symbol of the variable.  Variables do not hold
+        their symbols, so building a graph does not touch pysmt state;
+        TemporalProblem.symbols(mgr) gives those of every timepoint.
+        :param mgr: formula manager to build with (default: global environment)
+        :return: symbol
+        """
+        mgr = mgr if mgr is not None else pysmt.shortcuts.get_env().formula_manager
+        return mgr.Symbol(self.name, pysmt.shortcuts.REAL)
+
+    @property
+    def symbol(self):
+        """
+        Deprecated: the symbol in the global environment.  Use to_symbol(mgr)
+        or TemporalProblem.symbols(mgr), which build in a given environment.
+        """
+        warnings.warn("TimeVariable.symbol is deprecated, use to_symbol(mgr) or TemporalProblem.symbols(mgr)",
+                      DeprecationWarning, stacklevel=2)
+        return self.to_symbol()
+
     def to_dot(self):
         return self.name.replace(":", "_")
 
-class TimeVariableGroup(dict):
+class TimeVariableGroup:
+    """
+    The start, end, and duration TimeVariables of a single activity node.
+    Supports the read-only mapping interface (keyed by variable prefix) that
+    callers used when this was a dict subclass.
+    """
     DURATION_VARIABLE = 'duration'
     START_TIME_VARIABLE = 'start'
     END_TIME_VARIABLE = 'end'
+    VARIABLES = (START_TIME_VARIABLE, END_TIME_VARIABLE, DURATION_VARIABLE)
 
+    __slots__ = ("_protocol", "ref", "identity", "start", "end", "duration")
 
     @property
     def protocol(self):
         return self._protocol
 
-    @property
-    def start(self):
-        return self[self.START_TIME_VARIABLE]
+    def __init__(self, protocol, ref):
+        self._protocol = protocol
+        self.ref = ref
+        self.identity = sys.intern(str(ref.identity))
+        self.start = TimeVariable(self.START_TIME_VARIABLE, ref, self.identity)
+        self.end = TimeVariable(self.END_TIME_VARIABLE, ref, self.identity)
+        self.duration = TimeVariable(self.DURATION_VARIABLE, ref, self.identity)
 
-    @property
-    def end(self):
-        return self[self.END_TIME_VARIABLE]
+    def __getitem__(self, prefix):
+        if prefix not in self.VARIABLES:
+            raise KeyError(prefix)
+        return getattr(self, prefix)
 
-    @property
-    def duration(self):
-        return self[self.DURATION_VARIABLE]
+    def __iter__(self):
+        return iter(self.VARIABLES)
 
-    def _define_time_variable(self, prefix, ref):
-        self[prefix] = TimeVariable(prefix, ref)
+    def __len__(self):
+        return len(self.VARIABLES)
 
-    def __init__(self, protocol, ref):
-        self._protocol = protocol
-        self._define_time_variable(self.START_TIME_VARIABLE, ref)
-        self._define_time_variable(self.END_TIME_VARIABLE, ref)
-        self._define_time_variable(self.DURATION_VARIABLE, ref)
-        self.ref = ref
+    def keys(self):
+        return self.VARIABLES
+
+    def values(self):
+        return [self.start, self.end, self.duration]
+
+    def items(self):
+        return list(zip(self.VARIABLES, self.values()))
 
     def to_dot(self):
         uri = self.protocol.identity.replace(":", "_")
@@ -135,6 +179,7 @@ class Protocol:
 
         # Build time variables
         self.time_edges = []
+        self.link_edges = []
         self.time_variable_groups = {}
         self.define_time_variable_group(self.initial)
         self.define_time_variable_group(self.final)
@@ -203,11 +248,12 @@ class Protocol:
         variables = []
         for _, grp in self.time_variable_groups.items():
             for _, v in grp.items():
-                variables.append(v.symbol)
+                variables.append(v.to_symbol())
         return variables
 
     def define_time_variable_group(self, ref):
-        self.time_variable_groups[ref.identity] = TimeVariableGroup(self, ref)
+        group = TimeVariableGroup(self, ref)
+        self.time_variable_groups[group.identity] = group
     
     def identity_to_time_variables(self, identity):
         org_identity = str(identity)
@@ -293,6 +339,7 @@ class Protocol:
         new_edge = (start, [intersected_difference], end)
         if new_edge not in self.time_edges:
             self.time_edges.append(new_edge)
+        return new_edge
 
     def _insert_join(self, node):
         v = self.identity_to_time_variables(node.identity)
@@ -316,10 +363,10 @@ class Protocol:
 
 
     def _make_protocol_constraints(self):
-        protocol_start = self.time_variables.start.symbol
-        protocol_end = self.time_variables.end.symbol
-        initial_start = self.initial_time_variables.start.symbol
-        final_end = self.final_time_variables.end.symbol
+        protocol_start = self.time_variables.start.to_symbol()
+        protocol_end = self.time_variables.end.to_symbol()
+        initial_start = self.initial_time_variables.start.to_symbol()
+        final_end = self.final_time_variables.end.to_symbol()
         start_constraint = pysmt.shortcuts.Equals(protocol_start, initial_start)
         end_constraint = pysmt.shortcuts.Equals(protocol_end, final_end)
         return [start_constraint, end_constraint]
@@ -329,8 +376,8 @@ class Protocol:
         for j, grp in self.join_groups.items():
             join_constraints.append(
                 join_constraint(
-                    j.symbol,
-                    [v.symbol for v in grp]
+                    j.to_symbol(),
+                    [v.to_symbol() for v in grp]
                 )
             )
         return join_constraints
@@ -342,9 +389,9 @@ class Protocol:
                                                      pysmt.shortcuts.LE(s, pysmt.shortcuts.Real(self.infinity)))
                                  for s in symbols]
 
-        time_constraints = [binary_temporal_constraint(start.symbol,
+        time_constraints = [binary_temporal_constraint(start.to_symbol(),
                                                        Interval.substitute_infinity(self.infinity, disjunctive_distance),
-                                                       end.symbol)
+                                                       end.to_symbol())
                             for (start, disjunctive_distance, end) in self.time_edges]
         
         join_constraints = self._make_join_constraints()
@@ -412,9 +459,15 @@ class Protocol:
     def link_protocols(self, protocols):
         """
         Make time edges between calling behavior and the start and end of the subprotocols.
+        Edges made by a previous call are replaced, so protocols can be relinked
+        after a subprotocol is rebuilt.
         :param protocols:
         :return:
         """
+        for edge in self.link_edges:
+            if edge in self.time_edges:
+                self.time_edges.remove(edge)
+        self.link_edges = []
         for node in self.ref.nodes:
             if isinstance(node, uml.CallBehaviorAction) and \
                str(node.behavior) in protocols:
@@ -426,8 +479,8 @@ class Protocol:
                 sub_protocol_end = sub_protocol.time_variables.end
 
                 ## The subprotocol time span equals the calling behavior time span
-                self._insert_time_edge(node_start, sub_protocol_start, 0, max_dur=0)
-                self._insert_time_edge(sub_protocol_end, node_end, 0, max_dur=0)
+                self.link_edges.append(self._insert_time_edge(node_start, sub_protocol_start, 0, max_dur=0))
+                self.link_edges.append(self._insert_time_edge(sub_protocol_end, node_end, 0, max_dur=0))
     
     def print_debug(self):
         def dprint(msg):
@@ -478,7 +531,7 @@ class Protocol:
         for name, grp in self.time_variable_groups.items():
             dprint(f"    {name}")
             for _, var in grp.items():
-                dprint(f"      {var.prefix} = {float(model[var.symbol].constant_value())}")
+                dprint(f"      {var.prefix} = {float(model[var.to_symbol()].constant_value())}")
             l.debug("")
         l.debug("  ----------------")
 
@@ -487,17 +540,29 @@ class TimeConstraints(object):
     def __init__(self, ref : pamlt.TimeConstraints, activity_graph ):
         self.ref = ref
         self.activity_graph = activity_graph
+        self._clause = None
 
-    def extract_time_constraints(self):
+    @property
+    def clause(self):
+        """
+        The clause of the constraints, extracted on first use
+        """
+        if self._clause is None:
+            self._clause = self.extract_clause()
+        return self._clause
+
+    def extract_clause(self):
+        """
+        Convert the constraints into a single solver independent Clause
+        :return: clause
+        """
         cc = ConstraintConverter(self)
         time_constraints = self.ref
-        doc = time_constraints.document
         count = len(time_constraints.constraints)
 
         # no constraints were specified
         if count == 0:
-            # FIXME what shortcut is approriate to return when no constraints are specified?
-            return pysmt.shortcuts.TRUE()
+            return Conjunction([], identity=time_constraints.identity)
 
         # exactly one constraint was specified
         if count == 1:
@@ -505,11 +570,23 @@ class TimeConstraints(object):
 
         # more than one constraint was specified
         # so fallback to an implicit And
-        l.warning(f"Time Constraints with identity '{time_constraints.indentity}' provided multiple top level constraints."
+        l.warning(f"Time Constraints with identity '{time_constraints.identity}' provided multiple top level constraints."
                 + "\n  These will be treated as an implicit And operation. This is not recommended.")
         clauses = [ cc.convert_constraint(tc_ref)
                     for tc_ref in time_constraints.constraints ]
-        return pysmt.shortcuts.And(clauses)
+        return Conjunction(clauses, identity=time_constraints.identity)
+
+    def extract_time_constraints(self, mgr=None):
+        """
+        Build the pysmt formula for the constraints
+        :param mgr: formula manager to build with (default: global environment)
+        :return: formula
+        """
+        clause = self.clause
+        mgr = mgr if mgr is not None else pysmt.shortcuts.get_env().formula_manager
+        symbols = {name: mgr.Symbol(name, pysmt.shortcuts.REAL)
+                   for name in set(clause.timepoints())}
+        return clause.to_formula(symbols, mgr=mgr)
 
     def _get_protocol_of_identity(self, identity):
         org_identity = str(identity)
@@ -0,0 +1,192 @@
+"""
+Monte Carlo robustness analysis.  Activity durations are sampled from
+distributions, and the earliest schedule of every sample is found at once by
+longest path propagation over the temporal network, with NumPy arrays
+holding one column per sample.
+"""
+import numpy as np
+
+from paml_check.solver import ProblemSolver
+from paml_check.stn import SimpleTemporalNetwork
+
+
+class RobustnessResult:
+    """
+    Feasibility and makespan of each sampled scenario
+    """
+
+    def __init__(self, durations, feasible, makespans):
+        """
+        :param durations: dict from activity identity to its sampled durations
+        :param feasible: bool array, True for the samples that meet every constraint
+        :param makespans: dict from protocol identity to its duration in each
+            sample, NaN for infeasible samples
+        """
+        self.durations = durations
+        self.feasible = feasible
+        self.makespans = makespans
+
+    @property
+    def samples(self):
+        return len(self.feasible)
+
+    @property
+    def success_probability(self):
+        return float(self.feasible.mean()) if len(self.feasible) else 0.0
+
+    def percentiles(self, q=(50, 90, 95, 99)):
+        """
+        Makespan percentiles over the feasible samples
+        :param q: percentiles to compute
+        :return: dict from protocol identity to dict from percentile to seconds
+        """
+        result = {}
+        for protocol_id, makespan in self.makespans.items():
+            feasible = makespan[self.feasible]
+            values = np.percentile(feasible, q) if len(feasible) else [np.nan] * len(q)
+            result[protocol_id] = dict(zip(q, (float(v) for v in values)))
+        return result
+
+    def __repr__(self):
+        return f"RobustnessResult(samples={self.samples}, success_probability={self.success_probability:.4f})"
+
+
+def _sample(distribution, rng, size):
+    """
+    :param distribution: a number, a callable of (rng, size), or a tuple of
+        the name of a numpy.random.Generator method and its arguments, such
+        as ("normal", 600, 60) or ("uniform", 300, 900)
+    :return: array of non-negative durations
+    """
+    if callable(distribution):
+        values = distribution(rng, size)
+    elif isinstance(distribution, (tuple, list)):
+        name, *args = distribution
+        values = getattr(rng, name)(*args, size=size)
+    else:
+        values = np.full(size, float(distribution))
+    return np.maximum(np.asarray(values, dtype=float), 0.0)
+
+
+def robustness(graph, distributions, samples=1000, seed=None, assignment=None, max_iterations=50, limits=None):
+    """
+    Estimate the probability that the constraints still hold when activity
+    durations vary.  A sampled duration replaces the duration constraints of
+    its activity.  Each sample is scheduled as early as possible; disjunctive
+    edges and constraints keep the choices of assignment.
+    :param graph: ActivityGraph or compiled TemporalProblem
+    :param distributions: dict from activity or behavior identity to its
+        duration distribution (see _sample).  A behavior's distribution
+        applies to every activity that calls it.
+    :param samples: number of scenarios
+    :param seed: seed for numpy.random.default_rng
+    :param assignment: a model of the problem (default: solve for one)
+    :param max_iterations: passes over the upper bound constraints before
+        a sample that has not settled is counted as infeasible
+    :param limits: SolverLimits for solving for a model
+    :return: RobustnessResult
+    :raises ValueError: if the problem is infeasible or an identity in
+        distributions is not an activity or behavior of the problem
+    """
+    problem = graph.compile()
+    if assignment is None:
+        with ProblemSolver(problem, limits=limits) as solver:
+            if not solver.check():
+                raise ValueError(f"{problem.name} is infeasible")
+            assignment = solver.get_assignment()
+    network = SimpleTemporalNetwork.from_problem(problem, assignment)
+    n = len(problem.timepoints)
+    rng = np.random.default_rng(seed)
+
+    # Sample the durations of the activities
+    activities = {}
+    for identity, distribution in distributions.items():
+        identity = str(identity)
+        matches = [node for node, behavior in problem.behaviors.items() if behavior == identity]
+        if identity in problem.node_kinds:
+            matches = [identity]
+        if not matches:
+            raise ValueError(f"No activity or behavior {identity}")
+        for node in matches:
+            activities[node] = distribution
+    durations = {node: _sample(distribution, rng, samples) for node, distribution in activities.items()}
+    sampled = {(problem.timepoint_index[f"start_{node}"], problem.timepoint_index[f"end_{node}"]): row
+               for row, node in enumerate(durations)}
+    weights = np.stack(list(durations.values())) if durations else np.empty((0, samples))
+
+    # Arcs u -> v require time[v] >= time[u] + weight, where weight is a
+    # constant or, for sampled arcs, +/- a row of weights
+    arcs = []
+    for source, target, low, high, _ in network.edges:
+        if (source, target) in sampled:
+            continue
+        arcs.append((source, target, low, -1, 1.0))
+        if high < network.infinity:
+            arcs.append((target, source, -high, -1, 1.0))
+    for (start, end), row in sampled.items():
+        arcs.append((start, end, 0.0, row, 1.0))
+        arcs.append((end, start, 0.0, row, -1.0))
+
+    # Arcs along the order of the planned schedule form a DAG, so one sweep
+    # in that order settles them.  Arcs against it are relaxed after each sweep.
+    order = sorted(range(n), key=lambda i: (assignment[problem.timepoints[i]], i))
+    position = np.empty(n, dtype=np.intp)
+    position[order] = np.arange(n)
+    level = np.zeros(n, dtype=np.intp)
+    forward = [arc for arc in arcs if position[arc[0]] < position[arc[1]]]
+    backward = [arc for arc in arcs if position[arc[0]] >= position[arc[1]]]
+    forward.sort(key=lambda arc: position[arc[1]])
+    for u, v, _, _, _ in forward:
+        level[v] = max(level[v], level[u] + 1)
+    levels = {}
+    for arc in forward:
+        levels.setdefault(level[arc[1]], []).append(arc)
+    forward_levels = [_arc_arrays(levels[k]) for k in sorted(levels)]
+    backward_arrays = _arc_arrays(backward)
+
+    times = np.tile(np.asarray(network.lower, dtype=float)[:, np.newaxis], (1, samples))
+    upper = np.asarray(network.upper, dtype=float)
+    settled = np.zeros(samples, dtype=bool)
+    for _ in range(max_iterations):
+        before = times.copy()
+        for arrays in forward_levels:
+            _relax(times, weights, arrays)
+        _relax(times, weights, backward_arrays)
+        settled = ~(times > before + network.epsilon).any(axis=0)
+        if settled.all():
+            break
+
+    feasible = settled & ~(times > upper[:, np.newaxis] + network.epsilon).any(axis=0)
+    # Every arc holds once the times settle, unless a join cannot equal its latest member
+    for j, members in problem.joins:
+        feasible &= np.abs(times[members] - times[j]).min(axis=0) <= network.epsilon
+    makespans = {}
+    for protocol_id, (start, end) in problem.protocols.items():
+        makespan = times[end] - times[start]
+        makespan[~feasible] = np.nan
+        makespans[protocol_id] = makespan
+    return RobustnessResult(durations, feasible, makespans)
+
+
+def _arc_arrays(arcs):
+    constant = [arc for arc in arcs if arc[3] < 0]
+    variable = [arc for arc in arcs if arc[3] >= 0]
+    return (np.array([a[0] for a in constant], dtype=np.intp),
+            np.array([a[1] for a in constant], dtype=np.intp),
+            np.array([a[2] for a in constant], dtype=float),
+            np.array([a[0] for a in variable], dtype=np.intp),
+            np.array([a[1] for a in variable], dtype=np.intp),
+            np.array([a[3] for a in variable], dtype=np.intp),
+            np.array([a[4] for a in variable], dtype=float))
+
+
+def _relax(times, weights, arrays):
+    """
+    Raise the times of the targets of arcs to the times of their sources
+    plus the arc weights, in every sample
+    """
+    sources, targets, constants, variable_sources, variable_targets, rows, signs = arrays
+    if len(sources):
+        np.maximum.at(times, targets, times[sources] + constants[:, np.newaxis])
+    if len(variable_sources):
+        np.maximum.at(times, variable_targets, times[variable_sources] + signs[:, np.newaxis] * weights[rows])
@@ -1,59 +1,67 @@
 import datetime
-from ast import literal_eval
 import pandas as pd
 from datetime import timedelta
 # import plotly.express as px
-import uml
 
 class Schedule(object):
 
     def __init__(self, model, graph, start_time=datetime.datetime.utcnow()):
+        """
+        :param model: pysmt model, or dict from timepoint name to value
+        :param graph: ActivityGraph or compiled TemporalProblem
+        :param start_time:
+        """
         self.start_time = start_time
-        self.start_times = {self._get_activity(tp) : self._to_date_time(val) for (tp, val) in model if self._is_start_timepoint(tp) }
-        self.end_times = {self._get_activity(tp): self._to_date_time(val) for (tp, val) in model if self._is_end_timepoint(tp)}
+        values = self._model_values(model)
+        self.assignment = dict(values)
+        self.start_times = {self._get_activity(tp) : self._to_date_time(val) for (tp, val) in values if self._is_start_timepoint(tp) }
+        self.end_times = {self._get_activity(tp): self._to_date_time(val) for (tp, val) in values if self._is_end_timepoint(tp)}
         self.activities = self.start_times.keys()
         self.activity_graph = graph
+        self.problem = graph.compile()
         self.activity_pretty_strings = self._get_activity_pretty_strings()
 
-    def _make_pretty_node_identity(self, node, protocol):
-        return node.identity.replace(f"{protocol.identity}/", "")
+    def _model_values(self, model):
+        if isinstance(model, dict):
+            return list(model.items())
+        return [(tp.symbol_name(), float(val.constant_value())) for (tp, val) in model]
 
-    def _make_pretty_node_behavior(self, node):
-        return node.behavior.rsplit("/", 1)[1]
+    def _make_pretty_node_identity(self, node_identity, protocol_identity):
+        return node_identity.replace(f"{protocol_identity}/", "")
+
+    def _make_pretty_node_behavior(self, behavior):
+        return behavior.rsplit("/", 1)[1]
+
+    def _is_call_behavior_action(self, activity):
+        return self.problem.node_kinds.get(activity) == "CallBehaviorAction"
 
     def _get_activity_pretty_strings(self):
         activity_pretty_strings = {}
         idx = 0
-        for _, protocol in self.activity_graph.protocols.items():
+        for protocol_identity, nodes in self.problem.protocol_nodes.items():
             idx += 1
             superscript = f"<sup>{idx}</sup>"
-            activity_pretty_strings[protocol.identity] = f"<b>{protocol.identity}</b>{superscript}"
-            for node in protocol.ref.nodes:
-                pid = f"{self._make_pretty_node_identity(node, protocol)}"
-                if node.identity in self.activities:
-                    if isinstance(node, uml.CallBehaviorAction):
-                        activity_pretty_strings[node.identity] = f"<i>{self._make_pretty_node_behavior(node)}</i> {pid}{superscript}"
-                    elif isinstance(node, uml.InitialNode) or \
-                         isinstance(node, uml.ForkNode) or \
-                         isinstance(node, uml.JoinNode) or \
-                         isinstance(node, uml.FlowFinalNode):
-                        activity_pretty_strings[node.identity] = f"{pid}{superscript}"
-                    else :
-                        activity_pretty_strings[node.identity] = f"{pid}{superscript}"
+            activity_pretty_strings[protocol_identity] = f"<b>{protocol_identity}</b>{superscript}"
+            for node_identity in nodes:
+                pid = f"{self._make_pretty_node_identity(node_identity, protocol_identity)}"
+                if node_identity in self.activities:
+                    if self._is_call_behavior_action(node_identity):
+                        activity_pretty_strings[node_identity] = f"<i>{self._make_pretty_node_behavior(self.problem.behaviors[node_identity])}</i> {pid}{superscript}"
+                    else:
+                        activity_pretty_strings[node_identity] = f"{pid}{superscript}"
         return activity_pretty_strings
 
     def _is_start_timepoint(self, tp):
-        return literal_eval("%s" % str(tp)).startswith("start")
+        return tp.startswith("start")
 
     def _is_end_timepoint(self, tp):
-        return literal_eval("%s" % str(tp)).startswith("end")
+        return tp.startswith("end")
 
     def _get_activity(self, tp):
-        return literal_eval("%s" % str(tp)).split("_", 1)[1]
+        return tp.split("_", 1)[1]
 
     def _to_date_time(self, val):
-        f_val = float(val.constant_value())
-        return self.start_time + timedelta(seconds=f_val)
+        return self.start_time + timedelta(seconds=val)
 
     def to_df(self, only_activities=True):
         df = pd.DataFrame([
@@ -63,11 +71,28 @@ class Schedule(object):
 
                  Activity=activity)
             for activity in self.activities
-            if not only_activities or isinstance(self.activity_graph.doc.find(activity), uml.CallBehaviorAction)
+            if not only_activities or self._is_call_behavior_action(activity)
         ])
         df = df.sort_values(by="Start")
         return df
 
+    def to_records(self, only_activities=True):
+        """
+        JSON serializable form of the schedule
+        :param only_activities: only include CallBehaviorAction activities
+        :return: list of dicts with the activity, its task string, and its
+            start and end in seconds from the start of the schedule
+        """
+        records = [
+            dict(activity=activity,
+                 task=self.activity_pretty_strings.get(activity, activity),
+                 start=self.assignment[f"start_{activity}"],
+                 end=self.assignment[f"end_{activity}"])
+            for activity in self.activities
+            if not only_activities or self._is_call_behavior_action(activity)
+        ]
+        return sorted(records, key=lambda record: record["start"])
+
     def plot(self, filename=None, show=False):
         df = self.to_df()
         return df
@@ -0,0 +1,444 @@
+"""
+Persistent checking service.  A CheckServer listens on a Unix socket for
+JSON-RPC 2.0 requests, one JSON object per line, and runs them in a pool of
+worker processes that have already imported paml, sbol3, pysmt and z3.
+Requests about a document go to the worker chosen by its content hash,
+which compiles the document once into a TemporalProblem and keeps it, so
+repeated requests skip parsing and graph construction and only send the
+hash.  CheckClient is a thin client for the service.
+"""
+import argparse
+import collections
+import concurrent.futures
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import socketserver
+import threading
+import time
+
+from paml_check.stats import timed
+
+l = logging.getLogger(__file__)
+l.setLevel(logging.INFO)
+
+DEFAULT_SOCKET = os.path.join(os.environ.get("XDG_RUNTIME_DIR", "/tmp"), "labop-check.sock")
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+SERVER_ERROR = -32000
+
+
+class RPCError(Exception):
+    """
+    Error returned to the client in a JSON-RPC error response
+    """
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class LRUCache:
+    """
+    Thread-safe mapping that keeps the most recently used entries
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+def document_key(text, format, protocol=None):
+    """
+    Key a document by its serialization format and content
+    :param text: serialized document
+    :param format: rdflib serialization format
+    :param protocol: identity, or list of identities, of the protocols
+        compiled from the document, or None for all of them
+    :return: hex digest
+    """
+    digest = hashlib.sha256(format.encode("utf-8"))
+    digest.update(b"\0")
+    if protocol is not None:
+        digest.update(json.dumps(protocol, sort_keys=True).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+# Compiled problems of the worker process, by document_key
+_problems = None
+
+
+def _warm_worker(cache_size=128):
+    """
+    Worker process initializer.  Import the checker and solve a trivial
+    formula so that the first request does not pay for module imports and
+    z3 startup.
+    :param cache_size: number of compiled problems the worker keeps
+    """
+    global _problems
+    _problems = LRUCache(cache_size)
+
+    import pysmt.shortcuts
+    import paml_check.labop_check  # noqa: F401
+
+    x = pysmt.shortcuts.Symbol("warm_up", pysmt.shortcuts.REAL)
+    pysmt.shortcuts.get_model(pysmt.shortcuts.GE(x, pysmt.shortcuts.Real(0.0)))
+
+
+def _compile_document(text, format, stats=None, protocol=None):
+    import sbol3
+    from paml_check.labop_check import compile_doc
+
+    with timed(stats, "parse"):
+        doc = sbol3.Document()
+        doc.read_string(text, format)
+    return compile_doc(doc, destructive=True, stats=stats, protocol=protocol)
+
+
+def _minimum_duration_record(duration, include_model=False):
+    if duration is None:
+        return None
+    record = {key: value for key, value in duration.items() if key != "result"}
+    if include_model:
+        record["result"] = duration["result"]
+    return record
+
+
+def _execute(method, key, text, format, params, hint=None):
+    """
+    Run a request in a worker process
+    :param method: request method name
+    :param key: document_key of the document
+    :param text: serialized document, used if the worker has not compiled
+        it yet.  None if the server expects the worker to have it.
+    :param format: rdflib serialization format of text
+    :param params: request parameters
+    :param hint: model of an earlier request about the document, to start
+        the solver from
+    :return: (whether the problem was cached, result, model or None), or
+        None if text is None and the worker no longer has the problem
+    """
+    from paml_check.labop_check import CheckResult, CheckStats, check_problem
+    from paml_check.solver import SolverLimits, SolverTimeout
+
+    stats = CheckStats() if params.get("stats", False) else None
+    problem = _problems.get(key)
+    cached = problem is not None
+    if problem is None:
+        if text is None:
+            return None
+        problem = _compile_document(text, format, stats, params.get("protocol"))
+        _problems.put(key, problem)
+
+    limits = SolverLimits(timeout=params.get("timeout"), rlimit=params.get("rlimit"))
+    start = time.monotonic()
+    result = {}
+    model = None
+    try:
+        if method == "get_minimum_duration":
+            durations = problem.get_minimum_duration(limits=limits, deadline=limits.deadline, stats=stats,
+                                                     hint=hint)
+            if any(d is None for d in durations.values()):
+                status = CheckResult.UNSATISFIABLE
+            elif all(d["converged"] for d in durations.values()):
+                status = CheckResult.SATISFIABLE
+            else:
+                status = CheckResult.TIMEOUT
+            include_model = params.get("include_model", False)
+            result["durations"] = {protocol: _minimum_duration_record(d, include_model)
+                                   for protocol, d in durations.items()}
+            model = next((d["result"] for d in durations.values() if d is not None), None)
+        else:
+            schedule = check_problem(problem, limits=limits, stats=stats, hint=hint)
+            status = CheckResult.SATISFIABLE if schedule else CheckResult.UNSATISFIABLE
+            model = schedule.assignment if schedule else None
+            if schedule and method == "export_schedule":
+                result["schedule"] = schedule.to_records(only_activities=params.get("only_activities", True))
+            elif schedule and params.get("include_model", False):
+                result["result"] = schedule.assignment
+    except SolverTimeout:
+        status = CheckResult.TIMEOUT
+    result["status"] = status
+    result["elapsed"] = time.monotonic() - start
+    if stats is not None:
+        result["stats"] = stats.to_dict()
+    return cached, result, model
+
+
+class CheckServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    JSON-RPC server for checking documents.  Each connection is handled in
+    its own thread, which waits on the worker pool, so several clients can
+    be served at once.
+
+    Each worker is a process of its own, and documents are assigned to
+    workers by their content hash, so that every request about a document
+    finds its compiled problem in the worker it runs in.
+
+    Methods (params in brackets are optional):
+      check_doc(document | path, [format, protocol, timeout, rlimit, include_model, stats])
+      get_minimum_duration(document | path, [format, protocol, timeout, rlimit, include_model, stats])
+      export_schedule(document | path, [format, protocol, timeout, rlimit, only_activities, stats])
+      stats(), ping(), shutdown()
+    """
+    daemon_threads = True
+    METHODS = ("check_doc", "get_minimum_duration", "export_schedule")
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, workers=None, cache_size=128):
+        """
+        :param socket_path: path of the Unix socket to listen on
+        :param workers: number of worker processes (default: CPU count)
+        :param cache_size: number of compiled problems each worker keeps
+        """
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.socket_path = socket_path
+        self.workers = workers or os.cpu_count() or 1
+        # The documents the workers have compiled
+        self.problems = LRUCache(cache_size)
+        # The last model of each document, and of each path, whose values
+        # are hints for re-running the document or an edited version of it
+        self.models = LRUCache(cache_size)
+        self.counts = collections.Counter()
+        self._counts_lock = threading.Lock()
+        # Spawn rather than fork, as the server process runs threads
+        self.pools = [concurrent.futures.ProcessPoolExecutor(max_workers=1,
+                                                             mp_context=multiprocessing.get_context("spawn"),
+                                                             initializer=_warm_worker, initargs=(cache_size,))
+                      for _ in range(self.workers)]
+        # Start every worker now rather than on the first requests
+        concurrent.futures.wait([pool.submit(time.sleep, 0) for pool in self.pools])
+        super().__init__(socket_path, _CheckRequestHandler)
+
+    def server_close(self):
+        super().server_close()
+        for pool in self.pools:
+            pool.shutdown(wait=False, cancel_futures=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def count(self, name):
+        with self._counts_lock:
+            self.counts[name] += 1
+
+    def dispatch(self, method, params):
+        """
+        Run one request
+        :param method: request method name
+        :param params: request parameters
+        :return: JSON serializable result
+        :raises RPCError:
+        """
+        if method == "ping":
+            return "pong"
+        if method == "stats":
+            with self._counts_lock:
+                counts = dict(self.counts)
+            return {"workers": self.workers, "cached_problems": len(self.problems), "counts": counts}
+        if method == "shutdown":
+            # shutdown() waits for serve_forever() to return, so it cannot
+            # be called from a request thread directly
+            threading.Thread(target=self.shutdown, daemon=True).start()
+            return "shutting down"
+        if method not in self.METHODS:
+            raise RPCError(METHOD_NOT_FOUND, f"Unknown method: {method}")
+
+        text, format = self._read_document(params)
+        key = document_key(text, format, params.get("protocol"))
+        self.count(method)
+        # Minimum duration searches keep their own models, as their first
+        # model decides the path of the search
+        kind = "minimize" if method == "get_minimum_duration" else "check"
+        model_keys = [(kind, key)] + ([(kind, "path", params["path"])] if "path" in params else [])
+        hint = next((m for m in map(self.models.get, model_keys) if m is not None), None)
+        if hint is not None:
+            self.count("warm_starts")
+        pool = self.pools[int(key, 16) % self.workers]
+        try:
+            # Only the key is sent for a document the worker has compiled
+            response = None
+            if key in self.problems:
+                response = pool.submit(_execute, method, key, None, format, params, hint).result()
+            if response is None:
+                # The worker has not compiled the document, or dropped it
+                response = pool.submit(_execute, method, key, text, format, params, hint).result()
+            cached, result, model = response
+        except Exception as e:
+            l.exception(f"{method} failed")
+            raise RPCError(SERVER_ERROR, f"{type(e).__name__}: {e}")
+        self.problems.put(key, True)
+        self.count("cache_hits" if cached else "cache_misses")
+        if model is not None:
+            for model_key in model_keys:
+                self.models.put(model_key, model)
+        result["cached"] = cached
+        result["document"] = key
+        return result
+
+    def _read_document(self, params):
+        format = params.get("format", "turtle")
+        if "document" in params:
+            return params["document"], format
+        if "path" in params:
+            try:
+                with open(params["path"], "r", encoding="utf-8") as f:
+                    return f.read(), format
+            except OSError as e:
+                raise RPCError(INVALID_PARAMS, str(e))
+        raise RPCError(INVALID_PARAMS, "Expected a document or a path parameter")
+
+
+class _CheckRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            response = self._respond(line)
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+    def _respond(self, line):
+        request_id = None
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                raise RPCError(PARSE_ERROR, str(e))
+            if not isinstance(request, dict) or "method" not in request:
+                raise RPCError(INVALID_REQUEST, "Expected a JSON-RPC request object")
+            request_id = request.get("id")
+            params = request.get("params", {})
+            if not isinstance(params, dict):
+                raise RPCError(INVALID_PARAMS, "Expected named parameters")
+            result = self.server.dispatch(request["method"], params)
+            return {"jsonrpc": "2.0", "id": request_id, "result": result}
+        except RPCError as e:
+            return {"jsonrpc": "2.0", "id": request_id, "error": {"code": e.code, "message": e.message}}
+
+
+class CheckClient:
+    """
+    Client for a CheckServer.  Documents are passed by path (read by the
+    server) or as serialized text.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, timeout=None):
+        """
+        :param socket_path: path of the server's Unix socket
+        :param timeout: socket timeout in seconds, or None to wait indefinitely
+        """
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        self.socket.connect(socket_path)
+        self._file = self.socket.makefile("rwb")
+        self._next_id = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._file.close()
+        self.socket.close()
+
+    def call(self, method, **params):
+        """
+        Send a request and wait for its response
+        :param method: request method name
+        :param params: request parameters
+        :return: result
+        :raises RPCError: if the server returns an error
+        """
+        self._next_id += 1
+        request = {"jsonrpc": "2.0", "id": self._next_id, "method": method, "params": params}
+        self._file.write(json.dumps(request).encode("utf-8") + b"\n")
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Server closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise RPCError(response["error"]["code"], response["error"]["message"])
+        return response["result"]
+
+    def check_doc(self, path=None, document=None, **params):
+        return self.call("check_doc", **_document_params(path, document), **params)
+
+    def get_minimum_duration(self, path=None, document=None, **params):
+        return self.call("get_minimum_duration", **_document_params(path, document), **params)
+
+    def export_schedule(self, path=None, document=None, **params):
+        return self.call("export_schedule", **_document_params(path, document), **params)
+
+    def stats(self):
+        return self.call("stats")
+
+    def ping(self):
+        return self.call("ping")
+
+    def shutdown(self):
+        return self.call("shutdown")
+
+
+def _document_params(path, document):
+    if document is not None:
+        return {"document": document}
+    return {"path": os.path.abspath(path)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve LabOP temporal checks on a Unix socket")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="path of the Unix socket")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--cache-size", type=int, default=128, help="number of compiled documents each worker keeps")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig()
+    server = CheckServer(args.socket, workers=args.workers, cache_size=args.cache_size)
+    l.info(f"Serving on {args.socket} with {server.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+Solve a TemporalProblem in a private pysmt environment
+"""
+import threading
+import time
+
+import pysmt.environment
+import pysmt.exceptions
+import pysmt.logics
+import pysmt.shortcuts
+import z3
+
+from paml_check.stats import timed
+from pysmt.decorators import clear_pending_pop
+from pysmt.oracles import SizeOracle
+from pysmt.solvers.solver import IncrementalTrackingSolver
+from pysmt.solvers.z3 import Z3Converter, Z3Solver
+
+_solver_class_lock = threading.Lock()
+
+# z3 uses UINT_MAX milliseconds to mean no timeout
+_Z3_NO_TIMEOUT = 4294967295
+
+
+class SolverTimeout(Exception):
+    pass
+
+
+class SolverLimits:
+    """
+    Wall clock and resource limits shared by every solver call of a check.
+    cancel() may be called from any thread and interrupts the running
+    solver calls.
+    """
+
+    def __init__(self, timeout=None, rlimit=None):
+        """
+        :param timeout: seconds the whole check may take, or None
+        :param rlimit: z3 resource limit for each solver call, or None
+        """
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.rlimit = rlimit
+        self.cancelled = False
+        self._solvers = set()
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        """
+        :return: seconds left before the deadline, or None if there is none
+        """
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def expired(self):
+        return self.cancelled or self.remaining() == 0.0
+
+    def solver_options(self):
+        options = {}
+        if self.rlimit is not None:
+            options["rlimit"] = self.rlimit
+        return options
+
+    def cancel(self):
+        """
+        Stop the check, interrupting any solver call in progress
+        :return:
+        """
+        with self._lock:
+            self.cancelled = True
+            solvers = list(self._solvers)
+        for solver in solvers:
+            solver.interrupt()
+
+    def register(self, solver):
+        with self._lock:
+            self._solvers.add(solver)
+        if self.cancelled:
+            solver.interrupt()
+
+    def unregister(self, solver):
+        with self._lock:
+            self._solvers.discard(solver)
+
+
+class PrivateZ3Solver(Z3Solver):
+    """
+    Z3Solver that shares no state with other solvers.  The pysmt Z3Solver
+    creates its z3 solver in z3's global context, and type checks assertions
+    with FNode.get_type(), which uses the global pysmt environment.  Neither
+    is safe to use from several threads, so this solver owns a z3 Context and
+    type checks in its own environment.
+    """
+
+    def __init__(self, environment, logic, **options):
+        IncrementalTrackingSolver.__init__(self,
+                                           environment=environment,
+                                           logic=logic,
+                                           **options)
+        self.z3 = z3.SolverFor(str(logic), ctx=z3.Context())
+        self.options(self)
+        self.declarations = set()
+        self.converter = Z3Converter(environment, z3_ctx=self.z3.ctx)
+        self.mgr = environment.formula_manager
+        self._name_cnt = 0
+
+    def _assert_is_boolean(self, formula):
+        if not self.environment.stc.get_type(formula).is_bool_type():
+            raise pysmt.exceptions.PysmtTypeError("Argument must be boolean.")
+
+    @clear_pending_pop
+    def _solve(self, assumptions=None):
+        # z3 accepts any formula as an assumption, so check under the
+        # assumptions directly rather than asserting them in a pushed scope.
+        # An interrupt can then only stop the check itself, and never leaves
+        # a scope with stale assumptions on the stack.
+        result = self.z3.check(*[self.converter.convert(a) for a in assumptions or []])
+        if result == z3.unknown:
+            raise pysmt.exceptions.SolverReturnedUnknownResultError
+        return result == z3.sat
+
+
+def _solver_class(solver_name):
+    if solver_name == "z3":
+        return PrivateZ3Solver
+    # Look the class up in the global factory, which probes for installed
+    # solvers once, rather than letting each new Environment probe again.
+    with _solver_class_lock:
+        return pysmt.shortcuts.get_env().factory.all_solvers()[solver_name]
+
+
+class ProblemSolver:
+    """
+    Incremental solver for a TemporalProblem.  Each instance owns its own
+    pysmt Environment, so the formulas it builds are released with it rather
+    than accumulating in the global formula manager, and instances can be
+    used concurrently from different threads.
+    """
+
+    def __init__(self, problem, solver_name="z3", solver_options=None, limits=None, stats=None, selectors=False,
+                 threshold=None):
+        """
+        Build the problem formula and assert it in a new solver
+        :param problem: TemporalProblem
+        :param solver_name: pysmt solver name
+        :param solver_options: options passed through to the solver
+        :param limits: SolverLimits applied to every check
+        :param stats: CheckStats to record formula size and solver calls in
+        :param selectors: assert each edge, join and custom constraint only
+            under a Boolean selector, which checks must assume for it to
+            hold (see assume() and get_unsat_core())
+        :param threshold: largest ExactlyOne constraint to encode pairwise
+            (default: constraints.EXACTLY_ONE_THRESHOLD)
+        """
+        self.problem = problem
+        self.limits = limits
+        self.stats = stats
+        self.threshold = threshold
+        options = dict(limits.solver_options()) if limits is not None else {}
+        options.update(solver_options or {})
+        self.env = pysmt.environment.Environment()
+        self.mgr = self.env.formula_manager
+        self.symbols = problem.symbols(self.mgr)
+        self.solver = _solver_class(solver_name)(environment=self.env,
+                                                 logic=pysmt.logics.QF_LRA,
+                                                 solver_options=options)
+        self.selectors = {}
+        self._selector_labels = {}
+        self._assumptions = None
+        with timed(stats, "generate_constraints"):
+            if selectors:
+                formula = self._selected_formula()
+            else:
+                formula = problem.to_formula(self.mgr, self.symbols, threshold=self.threshold)
+        if stats is not None:
+            stats.set_count("formula_dag_size", self.env.sizeo.get_size(formula, SizeOracle.MEASURE_DAG_NODES))
+        self.solver.add_assertion(formula)
+        if limits is not None:
+            limits.register(self)
+
+    def _selected_formula(self):
+        domains, labeled = self.problem.labeled_formulas(self.mgr, self.symbols, threshold=self.threshold)
+        implications = []
+        for k, (label, formula) in enumerate(labeled):
+            selector = self.mgr.Symbol(f"selector_{k}")
+            self.selectors[label] = selector
+            self._selector_labels[selector] = label
+            implications.append(self.mgr.Implies(selector, formula))
+        return self.mgr.And([domains] + implications)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Release the solver and its environment
+        :return:
+        """
+        if self.limits is not None:
+            self.limits.unregister(self)
+        if self.stats is not None and isinstance(self.solver, Z3Solver):
+            # z3 statistics accumulate over the checks of a solver
+            statistics = self.solver.z3.statistics()
+            self.stats.add_solver_statistics({key: statistics.get_key_value(key) for key in statistics.keys()})
+        if self.solver is not None:
+            self.solver.exit()
+        self.solver = None
+        self.symbols = None
+        self.mgr = None
+        self.env = None
+
+    def symbol(self, name):
+        return self.symbols[self.problem.timepoint_index[name]]
+
+    def assume(self, labels=None):
+        """
+        Assumptions that select edges, joins and constraints
+        :param labels: labels of the parts to select (default: all of them)
+        :return: list of selector symbols, to pass to check()
+        """
+        if labels is None:
+            return list(self.selectors.values())
+        return [self.selectors[label] for label in labels]
+
+    def get_unsat_core(self):
+        """
+        Labels of the selected parts that the last, unsatisfiable, check
+        needed.  Only z3 reports a core; with other solvers, all of the
+        assumed parts are returned.
+        :return: list of labels
+        """
+        if isinstance(self.solver, Z3Solver):
+            names = {str(literal) for literal in self.solver.z3.unsat_core()}
+            return [label for selector, label in self._selector_labels.items() if selector.symbol_name() in names]
+        return [self._selector_labels[a] for a in self._assumptions or [] if a in self._selector_labels]
+
+    def add_assertion(self, formula):
+        """
+        Assert a formula, built with self.mgr, for all later checks
+        :param formula:
+        :return:
+        """
+        self.solver.add_assertion(formula)
+
+    def set_initial_values(self, assignment):
+        """
+        Suggest values for the solver to try first, such as a previous model.
+        Only z3 (4.13.1 or later) uses the suggestions; other solvers ignore
+        them.
+        :param assignment: dict from timepoint name to value.  Names that are
+            not timepoints of the problem are skipped.
+        :return:
+        """
+        if not isinstance(self.solver, Z3Solver) or not hasattr(self.solver.z3, "set_initial_value"):
+            return
+        convert = self.solver.converter.convert
+        ctx = self.solver.z3.ctx
+        for name, value in assignment.items():
+            index = self.problem.timepoint_index.get(name)
+            if index is not None:
+                self.solver.z3.set_initial_value(convert(self.symbols[index]), z3.RealVal(value, ctx))
+
+    def interrupt(self):
+        """
+        Ask a check running in another thread to stop
+        :return:
+        """
+        solver = self.solver
+        if isinstance(solver, Z3Solver):
+            solver.z3.ctx.interrupt()
+
+    def check(self, assumptions=None, timeout=None):
+        """
+        Check satisfiability of the asserted formula
+        :param assumptions: optional list of formulas assumed for this check only
+        :param timeout: optional seconds allowed for this check only
+        :return: True if satisfiable
+        :raises SolverTimeout: if the limits or timeout expire before the solver answers
+        """
+        if self.limits is not None:
+            if self.limits.expired():
+                raise SolverTimeout("Solver limits expired before check")
+            remaining = self.limits.remaining()
+            if remaining is not None:
+                timeout = remaining if timeout is None else min(timeout, remaining)
+        if isinstance(self.solver, Z3Solver):
+            # The z3 timeout persists between calls, so always (re)set it
+            self.solver.z3.set("timeout", max(1, int(timeout * 1000)) if timeout is not None else _Z3_NO_TIMEOUT)
+        self._assumptions = assumptions
+        try:
+            with timed(self.stats, "solve"):
+                return self.solver.solve(assumptions)
+        except pysmt.exceptions.SolverReturnedUnknownResultError:
+            raise SolverTimeout("Solver did not answer within its limits")
+        finally:
+            if self.stats is not None:
+                self.stats.count("solver_calls")
+
+    def get_assignment(self):
+        """
+        Values of all timepoints in the last satisfying model
+        :return: dict from timepoint name to float
+        """
+        if isinstance(self.solver, Z3Solver):
+            # Evaluate directly in the z3 model rather than converting each
+            # value back into a pysmt formula
+            model = self.solver.z3.model()
+            convert = self.solver.converter.convert
+            return {name: float(model.eval(convert(s), model_completion=True).as_fraction())
+                    for name, s in zip(self.problem.timepoints, self.symbols)}
+        values = self.solver.get_values(self.symbols)
+        return {name: float(values[s].constant_value())
+                for name, s in zip(self.problem.timepoints, self.symbols)}
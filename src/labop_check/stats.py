@@ -0,0 +1,102 @@
+"""
+Instrumentation of the phases of a check
+"""
+import contextlib
+import threading
+import time
+
+
+class CheckStats:
+    """
+    Wall time per phase, counters and solver statistics collected during a
+    check.  Pass an instance as the stats argument of check_doc and related
+    functions; it is filled in as the check runs.
+
+    Phases, which may nest (solve time includes the solver calls made by the
+    minimum duration search):
+      parse: reading a serialized document (server only)
+      clone: copying the document in ActivityGraph
+      build: building the Protocols and TimeConstraints of an ActivityGraph
+      compile: compiling the graph into a TemporalProblem
+      instantiate: giving each sub-protocol call its own instance
+      summarize: solving sub-protocols for their duration summaries
+      generate_constraints: building the formula of a TemporalProblem
+      solve: solver calls
+      minimize: minimum duration search
+      schedule: building the Schedule from a model
+
+    Counts include protocols, nodes, edges, time_variables, time_edges,
+    time_constraints (ActivityGraph); timepoints, problem_edges, joins,
+    constraints (TemporalProblem); formula_dag_size; solver_calls and
+    minimize_solver_calls.
+    """
+
+    def __init__(self, callback=None):
+        """
+        :param callback: called with (phase, seconds) as each phase ends
+        """
+        self.callback = callback
+        self.phases = {}
+        self.counts = {}
+        self.solver_statistics = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+        if self.callback:
+            self.callback(name, seconds)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def set_count(self, name, value):
+        with self._lock:
+            self.counts[name] = value
+
+    def add_solver_statistics(self, statistics):
+        """
+        Accumulate the statistics of a solver call.  Memory statistics keep
+        their maximum, other numbers are summed.
+        :param statistics: dict from statistic name to value
+        :return:
+        """
+        with self._lock:
+            for key, value in statistics.items():
+                if not isinstance(value, (int, float)):
+                    continue
+                if "memory" in key:
+                    self.solver_statistics[key] = max(value, self.solver_statistics.get(key, value))
+                else:
+                    self.solver_statistics[key] = self.solver_statistics.get(key, 0) + value
+
+    def to_dict(self):
+        with self._lock:
+            return {"phases": dict(self.phases),
+                    "counts": dict(self.counts),
+                    "solver_statistics": dict(self.solver_statistics)}
+
+    def __repr__(self):
+        phases = ", ".join(f"{name}={seconds:.4f}s" for name, seconds in self.phases.items())
+        return f"CheckStats({phases})"
+
+
+def timed(stats, name):
+    """
+    Time a phase if stats are being collected
+    :param stats: CheckStats or None
+    :param name: phase name
+    :return: context manager
+    """
+    if stats is None:
+        return contextlib.nullcontext()
+    return stats.phase(name)
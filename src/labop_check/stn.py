@@ -0,0 +1,392 @@
+"""
+Simple temporal network over the timepoints of a TemporalProblem.  Bounds
+on the time of each timepoint are tightened by propagating along difference
+edges, touching only the edges of timepoints whose bounds change, so the
+network can be updated incrementally as timepoints are fixed.
+"""
+import collections
+import heapq
+
+from paml_check.constraints import Conjunction, Difference, Disjunction, ExactlyOne
+
+
+class Conflict:
+    """
+    A timepoint whose lower bound exceeds its upper bound
+    """
+    __slots__ = ("timepoint", "lower", "upper", "reasons", "repeated")
+
+    def __init__(self, timepoint, lower, upper, reasons, repeated=False):
+        """
+        :param timepoint: index of the timepoint
+        :param lower: the lower bound derived for it
+        :param upper: the upper bound derived for it
+        :param reasons: labels of the edges, joins and bounds the two bounds
+            were derived from
+        :param repeated: True if the timepoint was already in conflict
+        """
+        self.timepoint = timepoint
+        self.lower = lower
+        self.upper = upper
+        self.reasons = reasons
+        self.repeated = repeated
+
+    @property
+    def amount(self):
+        return self.lower - self.upper
+
+    def __repr__(self):
+        return f"Conflict(timepoint={self.timepoint}, lower={self.lower}, upper={self.upper})"
+
+
+class SimpleTemporalNetwork:
+    """
+    Difference edges target - source in [low, high] between timepoints, and
+    joins whose time is the latest time of their members.  Each timepoint
+    has a lower and an upper bound within [0, infinity].  After propagate()
+    the lower bounds are the earliest times of the timepoints, and form a
+    schedule if there are no conflicts.
+
+    Edges, joins and bounds carry a label, which conflicts report as their
+    reasons.
+    """
+
+    def __init__(self, timepoints, infinity=10e10, epsilon=0.0001):
+        """
+        :param timepoints: timepoint names, indexed by position
+        :param infinity: upper bound of all timepoints
+        :param epsilon: tolerance when comparing bounds
+        """
+        self.timepoints = list(timepoints)
+        self.infinity = infinity
+        self.epsilon = epsilon
+        n = len(self.timepoints)
+        self.lower = [0.0] * n
+        self.upper = [float(infinity)] * n
+        self.fixed = [False] * n
+        self.relaxed = set()                # unfixed timepoints whose bounds were in conflict
+        self.edges = []                     # (source, target, low, high, label)
+        self.out_edges = [[] for _ in range(n)]
+        self.in_edges = [[] for _ in range(n)]
+        self.joins = []                     # (join, [members], label)
+        self.member_of = [[] for _ in range(n)]
+        # (label, timepoint the bound was derived from, or None)
+        self._lower_reason = [None] * n
+        self._upper_reason = [None] * n
+
+    @classmethod
+    def from_problem(cls, problem, assignment=None):
+        """
+        Build the network of a TemporalProblem.  Disjunctive edges are
+        restricted to the interval that holds in assignment or, without one,
+        relaxed to the hull of their intervals.  Custom constraints are
+        added where they are conjunctions of differences, choosing the
+        disjunct that holds in assignment; other parts are left out.
+        Edge labels are ("edge", index in problem.edges), ("join", index in
+        problem.joins) and ("constraint", TimeConstraints identity).
+        :param problem: TemporalProblem
+        :param assignment: dict from timepoint name to value, such as a model
+        :return: SimpleTemporalNetwork
+        """
+        network = cls(problem.timepoints, infinity=problem.infinity, epsilon=problem.epsilon)
+        values = None
+        if assignment is not None:
+            values = [assignment.get(name) for name in problem.timepoints]
+        for k, (source, target, intervals) in enumerate(problem.edges):
+            difference = None
+            if values is not None and values[source] is not None and values[target] is not None:
+                difference = values[target] - values[source]
+            low, high = network._choose_interval(intervals, difference)
+            network.add_edge(source, target, low, high, ("edge", k))
+        for k, (j, members) in enumerate(problem.joins):
+            network.add_join(j, members, ("join", k))
+        for identity, clause in problem.constraints:
+            for difference in cls.simple_differences(clause, assignment):
+                low, high = network._choose_interval(difference.intervals,
+                                                     network._difference_of(difference, assignment))
+                target = problem.timepoint_index[difference.target]
+                if difference.source is None:
+                    network.add_bound(target, low, high, ("constraint", identity))
+                else:
+                    network.add_edge(problem.timepoint_index[difference.source], target,
+                                     low, high, ("constraint", identity))
+        return network
+
+    @staticmethod
+    def simple_differences(clause, assignment=None):
+        """
+        The differences a clause implies, choosing among the alternatives
+        of disjunctions by the ones that hold in assignment
+        :param clause: Clause
+        :param assignment: dict from timepoint name to value, or None
+        :return: list of Difference
+        """
+        if isinstance(clause, Difference):
+            return [clause]
+        if isinstance(clause, Conjunction):
+            return [d for c in clause.clauses for d in SimpleTemporalNetwork.simple_differences(c, assignment)]
+        if isinstance(clause, (Disjunction, ExactlyOne)) and assignment is not None:
+            if len(clause.clauses) == 1:
+                return SimpleTemporalNetwork.simple_differences(clause.clauses[0], assignment)
+            for c in clause.clauses:
+                if c.holds(assignment):
+                    return SimpleTemporalNetwork.simple_differences(c, assignment)
+        return []
+
+    @staticmethod
+    def is_simple(clause):
+        """
+        :param clause: Clause
+        :return: True if the clause is a conjunction of differences, each
+            with a single interval, so the network represents it exactly
+        """
+        if isinstance(clause, Difference):
+            return len(clause.intervals) == 1
+        if isinstance(clause, Conjunction):
+            return all(SimpleTemporalNetwork.is_simple(c) for c in clause.clauses)
+        return False
+
+    def _difference_of(self, difference, assignment):
+        if assignment is None:
+            return None
+        try:
+            source = assignment[difference.source] if difference.source is not None else 0.0
+            return assignment[difference.target] - source
+        except KeyError:
+            return None
+
+    def _choose_interval(self, intervals, difference=None):
+        if not intervals:
+            # No difference is allowed
+            return self.infinity, -self.infinity
+        if len(intervals) == 1:
+            return tuple(intervals[0])
+        if difference is not None:
+            for low, high in intervals:
+                if low - self.epsilon <= difference <= high + self.epsilon:
+                    return low, high
+        return min(low for low, _ in intervals), max(high for _, high in intervals)
+
+    def add_edge(self, source, target, low, high, label=None):
+        """
+        Constrain target - source to [low, high].  Call propagate() with
+        source and target to update the bounds.
+        :return: index of the edge
+        """
+        k = len(self.edges)
+        self.edges.append((source, target, float(low), float(high), label))
+        self.out_edges[source].append(k)
+        self.in_edges[target].append(k)
+        return k
+
+    def add_join(self, join, members, label=None):
+        """
+        Constrain the time of join to be at most the latest time of members
+        (edges from the members to the join keep it at least that late)
+        """
+        k = len(self.joins)
+        self.joins.append((join, list(members), label))
+        for member in members:
+            self.member_of[member].append(k)
+        return k
+
+    def add_bound(self, timepoint, low, high, label=None):
+        """
+        Constrain the time of a timepoint to [low, high]
+        :return: list of Conflict
+        """
+        conflicts = []
+        self._tighten_lower(timepoint, float(low), (label, None), conflicts)
+        self._tighten_upper(timepoint, float(high), (label, None), conflicts)
+        return conflicts
+
+    def fix(self, timepoint, value, label=None):
+        """
+        Fix the time of a timepoint, such as when it is observed.  A fixed
+        timepoint keeps its value; bounds that contradict it are reported
+        as conflicts.  Call propagate() with the timepoint afterwards.
+        :return: list of Conflict, if value is outside the current bounds
+        """
+        value = float(value)
+        conflicts = []
+        if value < self.lower[timepoint] - self.epsilon:
+            conflicts.append(self._conflict(timepoint, self.lower[timepoint], value,
+                                            self._chain(self._lower_reason, timepoint) + [label]))
+        if value > self.upper[timepoint] + self.epsilon:
+            conflicts.append(self._conflict(timepoint, value, self.upper[timepoint],
+                                            self._chain(self._upper_reason, timepoint) + [label]))
+        self.lower[timepoint] = self.upper[timepoint] = value
+        self._lower_reason[timepoint] = self._upper_reason[timepoint] = (label, None)
+        self.fixed[timepoint] = True
+        self.relaxed.discard(timepoint)
+        return conflicts
+
+    def initialize(self, potential=None):
+        """
+        Propagate the bounds of all timepoints.  Given a potential, an
+        assignment that satisfies the edges, such as the model the network
+        was built from, the bounds are shortest path distances found by
+        Dijkstra's algorithm on edge lengths reweighted by the potential,
+        which avoids the many passes that propagate() makes over long
+        chains of timepoints.
+        :param potential: list of timepoint values, indexed like timepoints
+        :return: list of Conflict
+        """
+        conflicts = []
+        if potential is not None and None not in potential:
+            self._shortest_paths(self.upper, self._upper_reason, potential, forward=True)
+            negated = [-value for value in self.lower]
+            self._shortest_paths(negated, self._lower_reason, [-value for value in potential], forward=False)
+            self.lower = [-value for value in negated]
+            conflicts = [self._conflict(k, self.lower[k], self.upper[k],
+                                        self._chain(self._lower_reason, k) + self._chain(self._upper_reason, k))
+                         for k in range(len(self.timepoints)) if self.lower[k] > self.upper[k] + self.epsilon]
+        return self.propagate(conflicts=conflicts)
+
+    def _shortest_paths(self, distance, reasons, potential, forward):
+        """
+        Tighten distance[i] to the shortest path from any timepoint j
+        starting at distance[j].  Arcs follow the upper bound rules when
+        forward, and the negated lower bound rules otherwise.
+        """
+        heap = [(distance[i] - potential[i], i) for i in range(len(distance))]
+        heapq.heapify(heap)
+        done = [False] * len(distance)
+        while heap:
+            key, u = heapq.heappop(heap)
+            if done[u] or key > distance[u] - potential[u] + self.epsilon * 1e-3:
+                continue
+            done[u] = True
+            arcs = []
+            for k in self.out_edges[u]:
+                _, target, low, high, label = self.edges[k]
+                arcs.append((target, high if forward else -low, label))
+            for k in self.in_edges[u]:
+                source, _, low, high, label = self.edges[k]
+                arcs.append((source, -low if forward else high, label))
+            for v, weight, label in arcs:
+                value = distance[u] + weight
+                if not done[v] and not self.fixed[v] and value < distance[v]:
+                    distance[v] = value
+                    reasons[v] = (label, u)
+                    heapq.heappush(heap, (value - potential[v], v))
+
+    def propagate(self, changed=None, conflicts=None):
+        """
+        Propagate the bounds of changed timepoints through the network.
+        Only the edges of timepoints whose bounds change are visited.  A
+        bound that would cross the other bound of an unfixed timepoint is
+        reported, and the timepoint is scheduled at its lower bound; bounds
+        that contradict a fixed timepoint are reported and not applied.
+        :param changed: indices of timepoints whose bounds changed (default: all)
+        :param conflicts: list to add the conflicts to (default: a new list)
+        :return: list of Conflict
+        """
+        n = len(self.timepoints)
+        queue = collections.deque(range(n) if changed is None else changed)
+        queued = set(queue)
+        updates = collections.Counter()
+        conflicts = [] if conflicts is None else conflicts
+
+        def push(k):
+            updates[k] += 1
+            if updates[k] > n:
+                # A timepoint updated more than n times is on a negative cycle
+                conflicts.append(self._conflict(k, self.lower[k], self.upper[k],
+                                                self._chain(self._lower_reason, k) +
+                                                self._chain(self._upper_reason, k)))
+                return
+            if k not in queued:
+                queued.add(k)
+                queue.append(k)
+
+        while queue:
+            i = queue.popleft()
+            queued.discard(i)
+            lower, upper = self.lower[i], self.upper[i]
+            for k in self.out_edges[i]:
+                _, target, low, high, label = self.edges[k]
+                if self._tighten_lower(target, lower + low, (label, i), conflicts):
+                    push(target)
+                if self._tighten_upper(target, upper + high, (label, i), conflicts):
+                    push(target)
+            for k in self.in_edges[i]:
+                source, _, low, high, label = self.edges[k]
+                if self._tighten_lower(source, lower - high, (label, i), conflicts):
+                    push(source)
+                if self._tighten_upper(source, upper - low, (label, i), conflicts):
+                    push(source)
+            for k in self.member_of[i]:
+                join, members, label = self.joins[k]
+                if self._tighten_upper(join, max(self.upper[m] for m in members), (label, i), conflicts):
+                    push(join)
+        return conflicts
+
+    def _tighten_lower(self, k, value, reason, conflicts):
+        if value <= self.lower[k] + self.epsilon * 1e-3:
+            return False
+        if value > self.upper[k] + self.epsilon:
+            conflicts.append(self._conflict(k, value, self.upper[k],
+                                            self._chain(self._lower_reason, k, reason) +
+                                            self._chain(self._upper_reason, k)))
+            if self.fixed[k]:
+                return False
+            # The upper bound is given up, but still explains the conflict
+            self.upper[k] = value
+            self.relaxed.add(k)
+        elif self.fixed[k]:
+            return False
+        self.lower[k] = value
+        self._lower_reason[k] = reason
+        return True
+
+    def _tighten_upper(self, k, value, reason, conflicts):
+        if value >= self.upper[k] - self.epsilon * 1e-3:
+            return False
+        if value < self.lower[k] - self.epsilon:
+            conflicts.append(self._conflict(k, self.lower[k], value,
+                                            self._chain(self._lower_reason, k) +
+                                            self._chain(self._upper_reason, k, reason)))
+            if self.fixed[k] or self.upper[k] == self.lower[k]:
+                return False
+            value = self.lower[k]
+            self.relaxed.add(k)
+        elif self.fixed[k]:
+            return False
+        self.upper[k] = value
+        self._upper_reason[k] = reason
+        return True
+
+    def _chain(self, reasons, k, reason=None):
+        """
+        Labels of the edges a bound was derived through, back to the bound
+        or fixed timepoint it started from
+        """
+        labels = []
+        seen = set()
+        reason = reason if reason is not None else reasons[k]
+        while reason is not None and k not in seen:
+            seen.add(k)
+            label, k = reason
+            if label is not None and label not in labels:
+                labels.append(label)
+            if k is None:
+                break
+            reason = reasons[k]
+        return labels
+
+    def _conflict(self, k, lower, upper, reasons):
+        return Conflict(k, lower, upper, [label for label in dict.fromkeys(reasons) if label is not None],
+                        repeated=k in self.relaxed)
+
+    def earliest(self):
+        """
+        :return: dict from timepoint name to its lower bound
+        """
+        return dict(zip(self.timepoints, self.lower))
+
+    def latest(self):
+        """
+        :return: dict from timepoint name to its upper bound
+        """
+        return dict(zip(self.timepoints, self.upper))
@@ -0,0 +1,116 @@
+"""
+What-if queries over durations.  Each swept duration becomes a pair of
+parameter symbols in a single formula, and each combination of candidate
+values is checked by assuming the parameter values in one incremental
+solver, rather than rebuilding and solving the problem for each value.
+"""
+import concurrent.futures
+import copy
+import itertools
+import multiprocessing
+
+from paml_check.constraints import Conjunction, Difference, Disjunction, ExactlyOne, Negation, ParameterDifference
+from paml_check.minimize_duration import MinimizeDuration
+from paml_check.solver import ProblemSolver
+
+
+def parameterize(problem, parameters):
+    """
+    Replace the swept durations of a problem by parameters
+    :param problem: TemporalProblem
+    :param parameters: identities of DurationConstraints, whose intervals
+        are replaced, or of activities, whose duration (end - start) is
+        constrained in addition to their own constraints
+    :return: (TemporalProblem, list of the parameter name of each identity)
+    :raises ValueError: if an identity is neither a duration constraint nor
+        an activity of the problem
+    """
+    names = {str(identity): f"parameter{k}" for k, identity in enumerate(parameters)}
+    found = set()
+
+    def replace(clause):
+        if isinstance(clause, Difference) and str(clause.identity) in names:
+            found.add(str(clause.identity))
+            return ParameterDifference(clause.source, clause.target, names[str(clause.identity)],
+                                       identity=clause.identity)
+        if isinstance(clause, Negation):
+            return Negation(replace(clause.clause), identity=clause.identity)
+        if isinstance(clause, (Conjunction, Disjunction, ExactlyOne)):
+            return type(clause)([replace(c) for c in clause.clauses], identity=clause.identity)
+        return clause
+
+    parameterized = copy.copy(problem)
+    parameterized.constraints = [(identity, replace(clause)) for identity, clause in problem.constraints]
+    for identity, name in names.items():
+        if identity in found:
+            continue
+        start, end = f"start_{identity}", f"end_{identity}"
+        if start not in problem.timepoint_index or end not in problem.timepoint_index:
+            raise ValueError(f"{identity} is not a duration constraint or activity")
+        parameterized.constraints.append((identity, ParameterDifference(start, end, name, identity=identity)))
+    return parameterized, [names[str(identity)] for identity in parameters]
+
+
+def _interval(value):
+    if isinstance(value, (tuple, list)):
+        return float(value[0]), float(value[1])
+    return float(value), float(value)
+
+
+def _check_combinations(problem, names, combinations, minimize=True, threshold=0.1, limits=None):
+    """
+    Check each combination of parameter values in one solver
+    :return: list of result dicts, see sweep()
+    """
+    results = []
+    with ProblemSolver(problem, limits=limits) as solver:
+        mgr = solver.mgr
+        bounds = [ParameterDifference(None, None, name).bounds(mgr) for name in names]
+        for values in combinations:
+            assumptions = []
+            for (low_symbol, high_symbol), value in zip(bounds, values):
+                low, high = _interval(value)
+                assumptions += [mgr.Equals(low_symbol, mgr.Real(low)), mgr.Equals(high_symbol, mgr.Real(high))]
+            result = {"values": values, "feasible": solver.check(assumptions), "durations": None}
+            if result["feasible"] and minimize:
+                assignment = solver.get_assignment()
+                result["durations"] = {}
+                for protocol_id in problem.protocols:
+                    search = MinimizeDuration(None, None, protocol_id, threshold=threshold, solver=solver,
+                                              assumptions=assumptions)
+                    duration, _ = search.minimize(problem.get_duration(assignment, protocol_id),
+                                                  incumbent_result=assignment)
+                    result["durations"][protocol_id] = duration
+            results.append(result)
+    return results
+
+
+def sweep(graph, parameters, minimize=True, threshold=0.1, limits=None, processes=None):
+    """
+    Check every combination of candidate durations
+    :param graph: ActivityGraph or compiled TemporalProblem
+    :param parameters: dict from the identity of a DurationConstraint or
+        activity to a list of candidate durations in seconds.  A candidate
+        is a number, for an exact duration, or a (min, max) pair.
+    :param minimize: also find the minimum duration of each protocol for
+        each feasible combination
+    :param threshold: precision of the minimum durations
+    :param limits: SolverLimits for each solver call (only without processes)
+    :param processes: split the combinations between this many worker
+        processes, each with its own solver
+    :return: list of dicts, in the order of itertools.product over the
+        candidate lists, of "values" (tuple of candidates), "feasible" and
+        "durations" (minimum duration by protocol id, or None)
+    """
+    problem, names = parameterize(graph.compile(), list(parameters))
+    combinations = list(itertools.product(*parameters.values()))
+    if not processes or processes < 2 or len(combinations) < 2:
+        return _check_combinations(problem, names, combinations, minimize, threshold, limits)
+
+    size = -(-len(combinations) // processes)
+    chunks = [combinations[k:k + size] for k in range(0, len(combinations), size)]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=len(chunks),
+                                                mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(_check_combinations, problem, names, chunk, minimize, threshold)
+                   for chunk in chunks]
+        return [result for future in futures for result in future.result()]
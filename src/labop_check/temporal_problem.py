@@ -0,0 +1,406 @@
+"""
+Self-contained temporal problem compiled from an ActivityGraph
+"""
+import hashlib
+import sys
+
+import pysmt
+import pysmt.shortcuts
+
+from paml_check.constraints import binary_temporal_constraint, join_constraint
+from paml_check.stats import timed
+from paml_check.utils import Interval
+
+
+class TemporalProblem:
+    """
+    The timepoints, time edges, joins and custom constraints of an
+    ActivityGraph, referring to timepoints by name and index only.  A problem
+    holds no references to the source document or to pysmt formulas, so the
+    document may be released once it is compiled and each solve can build
+    its formula in a private pysmt Environment.
+    """
+
+    def __init__(self, name, epsilon=0.0001, infinity=10e10):
+        self.name = name
+        self.epsilon = epsilon
+        self.infinity = infinity
+        self.timepoints = []        # timepoint names, indexed by position
+        self.timepoint_index = {}   # timepoint name -> position
+        self.edges = []             # (source index, target index, disjunctive intervals)
+        self.joins = []             # (join index, [joined indices])
+        self.constraints = []       # (TimeConstraints identity, Clause)
+        self.protocols = {}         # protocol identity -> (start index, end index)
+        self.protocol_nodes = {}    # protocol identity -> [node identity]
+        self.protocol_timepoints = {}   # protocol identity -> [timepoint index]
+        self.node_kinds = {}        # node identity -> node type name
+        self.behaviors = {}         # node identity -> behavior identity
+
+    @classmethod
+    def from_activity_graph(cls, graph):
+        """
+        Compile an ActivityGraph
+        :param graph:
+        :return: TemporalProblem
+        """
+        problem = cls(graph.name, epsilon=graph.epsilon, infinity=graph.infinity)
+        for _, protocol in graph.protocols.items():
+            problem.add_protocol(protocol)
+        for identity, time_constraint in graph.time_constraints.items():
+            problem.constraints.append((identity, time_constraint.clause))
+        return problem
+
+    def compile(self):
+        """
+        A problem is already compiled, this mirrors ActivityGraph.compile()
+        :return: self
+        """
+        return self
+
+    def add_timepoint(self, name):
+        """
+        Add a timepoint if it is not already present
+        :param name:
+        :return: index of the timepoint
+        """
+        index = self.timepoint_index.get(name)
+        if index is None:
+            name = sys.intern(name)
+            index = len(self.timepoints)
+            self.timepoints.append(name)
+            self.timepoint_index[name] = index
+        return index
+
+    def add_protocol(self, protocol):
+        """
+        Add the timepoints, time edges and joins of a Protocol
+        :param protocol:
+        :return:
+        """
+        self.protocol_timepoints[protocol.identity] = [self.add_timepoint(var.name)
+                                                       for _, grp in protocol.time_variable_groups.items()
+                                                       for _, var in grp.items()]
+
+        for (start, disjunctive_distance, end) in protocol.time_edges:
+            intervals = Interval.substitute_infinity(self.infinity,
+                                                     [list(dd) for dd in disjunctive_distance])
+            self.edges.append((self.timepoint_index[start.name],
+                               self.timepoint_index[end.name],
+                               intervals))
+
+        for j, grp in protocol.join_groups.items():
+            self.joins.append((self.timepoint_index[j.name],
+                               [self.timepoint_index[v.name] for v in grp]))
+
+        tvs = protocol.time_variables
+        self.protocols[protocol.identity] = (self.timepoint_index[tvs.start.name],
+                                             self.timepoint_index[tvs.end.name])
+        nodes = self.protocol_nodes[protocol.identity] = []
+        for node in protocol.ref.nodes:
+            identity = sys.intern(str(node.identity))
+            nodes.append(identity)
+            self.node_kinds[identity] = type(node).__name__
+            if hasattr(node, "behavior") and node.behavior is not None:
+                self.behaviors[identity] = str(node.behavior)
+
+    def calls(self):
+        """
+        The calls each protocol makes to other protocols of the problem
+        :return: dict from protocol identity to [(calling node identity, called protocol identity)]
+        """
+        return {protocol_id: [(node, self.behaviors[node]) for node in nodes
+                              if self.behaviors.get(node) in self.protocols]
+                for protocol_id, nodes in self.protocol_nodes.items()}
+
+    def content_hashes(self, calls=None):
+        """
+        Hash the timepoints, edges, joins, nodes and calls of each protocol, by
+        name rather than index, so that a protocol left unchanged in a new
+        version of its document hashes the same
+        :param calls: self.calls(), if already computed
+        :return: dict from protocol identity to hex digest
+        """
+        calls = self.calls() if calls is None else calls
+        owner = {index: protocol_id for protocol_id, indices in self.protocol_timepoints.items() for index in indices}
+        lines = {protocol_id: [self.timepoints[index] for index in indices]
+                 for protocol_id, indices in self.protocol_timepoints.items()}
+        for (source, target, intervals) in self.edges:
+            if owner.get(source) is not None and owner.get(source) == owner.get(target):
+                lines[owner[source]].append(f"edge {self.timepoints[source]} {self.timepoints[target]} {intervals}")
+        for (j, grp) in self.joins:
+            if owner.get(j) is not None and all(owner.get(v) == owner[j] for v in grp):
+                lines[owner[j]].append(f"join {self.timepoints[j]} {[self.timepoints[v] for v in grp]}")
+        for protocol_id, nodes in self.protocol_nodes.items():
+            lines[protocol_id] += [f"node {node} {self.node_kinds[node]} {self.behaviors.get(node)}"
+                                   for node in nodes]
+            lines[protocol_id] += [f"call {node} {called}" for node, called in calls[protocol_id]]
+        return {protocol_id: hashlib.sha256("\n".join(protocol_lines).encode("utf-8")).hexdigest()
+                for protocol_id, protocol_lines in lines.items()}
+
+    def closure(self, protocol_ids):
+        """
+        :param protocol_ids: iterable of protocol identities
+        :return: set of the protocols and the protocols they call, transitively
+        """
+        calls = self.calls()
+        closure = set()
+        pending = list(protocol_ids)
+        while pending:
+            protocol_id = pending.pop()
+            if protocol_id not in closure:
+                closure.add(protocol_id)
+                pending += [called for _, called in calls[protocol_id]]
+        return closure
+
+    def sub_problem(self, protocol_ids, sub=None):
+        """
+        The part of the problem that only involves the given protocols:
+        their timepoints, the edges and joins between them, and the custom
+        constraints on them alone
+        :param protocol_ids: iterable of protocol identities
+        :param sub: empty problem to fill in (default: a new TemporalProblem)
+        :return: TemporalProblem
+        """
+        protocol_ids = [p for p in self.protocols if p in set(protocol_ids)]
+        if sub is None:
+            sub = TemporalProblem(self.name, epsilon=self.epsilon, infinity=self.infinity)
+        index = {}
+        for protocol_id in protocol_ids:
+            sub.protocol_timepoints[protocol_id] = []
+            for i in self.protocol_timepoints[protocol_id]:
+                index[i] = sub.add_timepoint(self.timepoints[i])
+                sub.protocol_timepoints[protocol_id].append(index[i])
+            start, end = self.protocols[protocol_id]
+            sub.protocols[protocol_id] = (index[start], index[end])
+            sub.protocol_nodes[protocol_id] = list(self.protocol_nodes[protocol_id])
+            for node in sub.protocol_nodes[protocol_id]:
+                sub.node_kinds[node] = self.node_kinds[node]
+                if node in self.behaviors:
+                    sub.behaviors[node] = self.behaviors[node]
+
+        sub.edges = [(index[source], index[target], intervals)
+                     for (source, target, intervals) in self.edges
+                     if source in index and target in index]
+        sub.joins = [(index[j], [index[v] for v in grp])
+                     for (j, grp) in self.joins
+                     if j in index and all(v in index for v in grp)]
+        sub.constraints = [(identity, clause) for (identity, clause) in self.constraints
+                           if all(name in sub.timepoint_index for name in clause.timepoints())]
+        return sub
+
+    def get_end_time_name(self, protocol_identity):
+        return self.timepoints[self.protocols[str(protocol_identity)][1]]
+
+    def get_duration(self, assignment, protocol_identity):
+        """
+        Get the duration of a protocol in an assignment
+        :param assignment: mapping from timepoint name to value
+        :param protocol_identity:
+        :return: value
+        """
+        duration = None
+        if assignment:
+            duration = float(assignment[self.get_end_time_name(protocol_identity)])
+        return duration
+
+    def count(self, stats):
+        """
+        Record the size of the problem
+        :param stats: CheckStats
+        :return:
+        """
+        stats.set_count("timepoints", len(self.timepoints))
+        stats.set_count("problem_edges", len(self.edges))
+        stats.set_count("joins", len(self.joins))
+        stats.set_count("constraints", len(self.constraints))
+
+    def is_disjunctive(self):
+        """
+        :return: True if an edge or custom constraint offers a choice, so
+            that the problem is not a simple temporal network
+        """
+        from paml_check.stn import SimpleTemporalNetwork
+
+        return any(len(intervals) > 1 for (_, _, intervals) in self.edges) or \
+            any(not SimpleTemporalNetwork.is_simple(clause) for (_, clause) in self.constraints)
+
+    def get_minimum_duration(self, limits=None, deadline=None, callback=None, stats=None, processes=None,
+                             hint=None):
+        """
+        Find the minimum duration of each protocol by a bisection search on
+        its end time, in a private solver environment
+        :param limits: SolverLimits for the whole search
+        :param deadline: time.monotonic() value at which to stop searching and
+            report the best durations found so far
+        :param callback: called with (protocol id, supremum, infimum, incumbent)
+            after each solver call of the search
+        :param stats: CheckStats to record the search in
+        :param processes: if the problem is disjunctive, search with this many
+            worker processes, each probing a bound in every round (see
+            ParallelMinimizeDuration)
+        :param hint: model of a previous check or search, such as of an
+            earlier version of the problem, to start the first check and the
+            search of each protocol from (see MinimizeDuration)
+        :return: dict of "duration", "lower_bound", "converged" and "result"
+            (the model), indexed by protocol id
+        """
+        from paml_check.minimize_duration import MinimizeDuration, ParallelMinimizeDuration
+        from paml_check.solver import ProblemSolver
+
+        parallel = None
+        if processes is not None and processes > 1 and self.is_disjunctive():
+            parallel = ParallelMinimizeDuration(self, processes=processes, limits=limits, stats=stats)
+            if limits is not None:
+                limits.register(parallel)
+                if limits.deadline is not None:
+                    deadline = limits.deadline if deadline is None else min(deadline, limits.deadline)
+        min_duration = {protocol: None for protocol in self.protocols}
+        try:
+            with ProblemSolver(self, limits=limits, stats=stats) as solver, timed(stats, "minimize"):
+                if hint:
+                    solver.set_initial_values(hint)
+                if solver.check():
+                    result = solver.get_assignment()
+                    for protocol_id in self.protocols:
+                        minimum_duration = self.get_duration(result, protocol_id)
+                        if parallel is None:
+                            search = MinimizeDuration(None, None, protocol_id, solver=solver, hint=hint)
+                            steps = search.iter_minimize(minimum_duration, incumbent_result=result, deadline=deadline)
+                        else:
+                            search = parallel
+                            steps = parallel.iter_minimize(protocol_id, minimum_duration, incumbent_result=result,
+                                                           deadline=deadline)
+                        lower_bound = 0.0
+                        minimum_result = result
+                        for minimum_duration, lower_bound, minimum_result in steps:
+                            if callback:
+                                callback(protocol_id, minimum_duration, lower_bound, minimum_result)
+                        min_duration[protocol_id] = {
+                            "duration": minimum_duration,
+                            "lower_bound": lower_bound,
+                            "converged": minimum_duration - lower_bound <= search.threshold,
+                            "result": minimum_result
+                        }
+        finally:
+            if parallel is not None:
+                if limits is not None:
+                    limits.unregister(parallel)
+                parallel.close()
+        return min_duration
+
+    def get_joint_minimum_duration(self, weights=None, order=None, makespan=False, limits=None, stats=None):
+        """
+        Minimize the end times of all protocols together, in one call to z3's
+        optimizer (see optimize.minimize_jointly)
+        :param weights: dict from protocol id to the weight of its end time
+        :param order: protocol ids to minimize lexicographically, in order
+        :param makespan: first minimize the latest end time of any protocol
+        :param limits: SolverLimits for the optimization
+        :param stats: CheckStats to record the solver call in
+        :return: (assignment, dict from protocol id to its duration), or
+            (None, None) if the problem is infeasible
+        """
+        from paml_check.optimize import minimize_jointly
+
+        return minimize_jointly(self, weights=weights, order=order, makespan=makespan, limits=limits, stats=stats)
+
+    def explain(self, limits=None, minimal=True, stats=None):
+        """
+        Find the edges, joins and custom constraints that make the problem
+        infeasible (see explain.explain)
+        :param limits: SolverLimits for the solver calls
+        :param minimal: shrink the unsat core until no part can be dropped
+        :param stats: CheckStats to record the solver calls in
+        :return: Explanation, or None if the problem is feasible
+        """
+        from paml_check.explain import explain
+
+        return explain(self, limits=limits, minimal=minimal, stats=stats)
+
+    def get_time_windows(self, horizon=None, limits=None, stats=None):
+        """
+        Find the earliest and latest times of each activity, its slack and
+        the critical path of each protocol (see analysis.time_windows)
+        :param horizon: latest end time of the protocols, a number or a dict
+            indexed by protocol id (default: their earliest end times)
+        :param limits: SolverLimits for solving for a model
+        :param stats: CheckStats to record the solver call in
+        :return: TimeWindows, or None if the problem is infeasible
+        """
+        from paml_check.analysis import time_windows
+
+        return time_windows(self, horizon=horizon, limits=limits, stats=stats)
+
+    def symbols(self, mgr=None):
+        """
+        Create the symbol of each timepoint
+        :param mgr: formula manager to build with (default: global environment)
+        :return: list of symbols, indexed like timepoints
+        """
+        mgr = mgr if mgr is not None else pysmt.shortcuts.get_env().formula_manager
+        return [mgr.Symbol(name, pysmt.shortcuts.REAL) for name in self.timepoints]
+
+    def labeled_formulas(self, mgr=None, symbols=None, threshold=None):
+        """
+        Build the formula of each edge, join and custom constraint separately,
+        so that a solver can assume any subset of them.  Conjunctions of
+        custom constraints are split by the identities of their parts, such
+        as of each DurationConstraint.
+        :param mgr: formula manager to build with (default: global environment)
+        :param symbols: symbols previously created by self.symbols(mgr)
+        :param threshold: largest ExactlyOne constraint to encode pairwise
+            (default: constraints.EXACTLY_ONE_THRESHOLD)
+        :return: (formula of the timepoint domains, list of (label, formula)),
+            with labels ("edge", index in edges), ("join", index in joins)
+            and ("constraint", identity)
+        """
+        mgr = mgr if mgr is not None else pysmt.shortcuts.get_env().formula_manager
+        if symbols is None:
+            symbols = self.symbols(mgr)
+
+        domains = mgr.And([mgr.And(mgr.GE(s, mgr.Real(0.0)), mgr.LE(s, mgr.Real(self.infinity)))
+                           for s in symbols])
+        labeled = [(("edge", k), binary_temporal_constraint(symbols[source], intervals, symbols[target], mgr=mgr))
+                   for k, (source, target, intervals) in enumerate(self.edges)]
+        labeled += [(("join", k), join_constraint(symbols[j], [symbols[v] for v in grp], mgr=mgr))
+                    for k, (j, grp) in enumerate(self.joins)]
+
+        by_name = dict(zip(self.timepoints, symbols))
+        constraints = {}
+        for identity, clause in self.constraints:
+            for part_identity, part in clause.parts(str(identity)):
+                constraints.setdefault(part_identity, []).append(part.to_formula(by_name, mgr=mgr, threshold=threshold))
+        labeled += [(("constraint", identity), mgr.And(formulas)) for identity, formulas in constraints.items()]
+        return domains, labeled
+
+    def to_formula(self, mgr=None, symbols=None, threshold=None):
+        """
+        Build the pysmt formula for the problem
+        :param mgr: formula manager to build with (default: global environment)
+        :param symbols: symbols previously created by self.symbols(mgr)
+        :param threshold: largest ExactlyOne constraint to encode pairwise
+            (default: constraints.EXACTLY_ONE_THRESHOLD)
+        :return: formula
+        """
+        mgr = mgr if mgr is not None else pysmt.shortcuts.get_env().formula_manager
+        if symbols is None:
+            symbols = self.symbols(mgr)
+
+        timepoint_var_domains = [mgr.And(mgr.GE(s, mgr.Real(0.0)),
+                                         mgr.LE(s, mgr.Real(self.infinity)))
+                                 for s in symbols]
+
+        time_constraints = [binary_temporal_constraint(symbols[source], intervals, symbols[target], mgr=mgr)
+                            for (source, target, intervals) in self.edges]
+
+        join_constraints = [join_constraint(symbols[j], [symbols[v] for v in grp], mgr=mgr)
+                            for (j, grp) in self.joins]
+
+        by_name = dict(zip(self.timepoints, symbols))
+        custom_constraints = [clause.to_formula(by_name, mgr=mgr, threshold=threshold)
+                              for (_, clause) in self.constraints]
+
+        return mgr.And(timepoint_var_domains +
+                       time_constraints +
+                       join_constraints +
+                       custom_constraints)
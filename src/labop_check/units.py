@@ -1,4 +1,4 @@
-
+import functools
 import pint
 import tyto
 
@@ -10,5 +10,11 @@ Quantity = UNIT_REGISTRY.Quantity
 def convert_quantity(value, from_unit, to_unit):
     return Quantity(value, from_unit).to(to_unit).magnitude
 
+@functools.lru_cache(maxsize=None)
+def om_term(uri):
+    # Ontology lookups are slow and their answers never change, so only do
+    # each one once per process (lru_cache is safe to share between threads)
+    return tyto.OM.get_term_by_uri(uri)
+
 def om_convert(value, from_unit, to_unit):
-    return convert_quantity(value, tyto.OM.get_term_by_uri(from_unit), tyto.OM.get_term_by_uri(to_unit))
+    return convert_quantity(value, om_term(from_unit), om_term(to_unit))
@@ -0,0 +1,213 @@
+"""
+Validate executed schedules against the constraints of a protocol.  The
+time edges, joins and custom time constraints of a compiled problem are
+turned into arrays once, and a batch of logs is checked against all of them
+with array operations rather than a solver call per log.
+"""
+import numpy as np
+
+from paml_check.constraints import Conjunction, Difference, Disjunction, ExactlyOne, Negation
+
+
+class ValidationResult:
+    """
+    Slack of each log with respect to each constraint.  Positive slack is
+    the margin by which the constraint holds, negative slack the amount by
+    which it is violated, and NaN means the log is missing a timepoint of
+    the constraint.
+    """
+
+    def __init__(self, labels, slack, epsilon):
+        """
+        :param labels: (kind, identity) of each constraint, where kind is
+            "edge", "join" or "constraint", and identity is
+            "<source> -> <target>" for edges, the join timepoint for joins
+            and the TimeConstraints identity for custom constraints
+        :param slack: array of shape (logs, constraints)
+        :param epsilon: tolerance
+        """
+        self.labels = labels
+        self.slack = slack
+        with np.errstate(invalid="ignore"):
+            self.violated = slack < -epsilon
+
+    @property
+    def violated_logs(self):
+        """
+        :return: bool array, True for the logs that violate any constraint
+        """
+        return self.violated.any(axis=1)
+
+    @property
+    def violation_counts(self):
+        """
+        :return: int array, the number of logs violating each constraint
+        """
+        return self.violated.sum(axis=0)
+
+    def violations(self, log):
+        """
+        :param log: index of a log
+        :return: list of (label, slack) of the constraints the log violates
+        """
+        return [(self.labels[k], float(self.slack[log, k])) for k in np.flatnonzero(self.violated[log])]
+
+
+class ScheduleValidator:
+    """
+    Check logs of executed schedules against an ActivityGraph or
+    TemporalProblem.  A log gives the times of timepoints, by name, in
+    seconds from the start of the execution.
+    """
+
+    def __init__(self, graph):
+        """
+        :param graph: ActivityGraph or compiled TemporalProblem
+        """
+        self.problem = problem = graph.compile()
+        self.epsilon = problem.epsilon
+        self.labels = []
+
+        # Edges, with their disjunctive intervals padded by NaN
+        sources, targets, intervals = [], [], []
+        for source, target, edge_intervals in problem.edges:
+            sources.append(source)
+            targets.append(target)
+            intervals.append(edge_intervals)
+            self.labels.append(("edge", f"{problem.timepoints[source]} -> {problem.timepoints[target]}"))
+        self._edge_sources = np.array(sources, dtype=np.intp)
+        self._edge_targets = np.array(targets, dtype=np.intp)
+        self._edge_low, self._edge_high = self._pad(intervals)
+
+        # Joins, with their members padded by repeating the first
+        width = max((len(members) for _, members in problem.joins), default=0)
+        self._joins = np.array([j for j, _ in problem.joins], dtype=np.intp)
+        self._join_members = np.array([members + members[:1] * (width - len(members))
+                                       for _, members in problem.joins],
+                                      dtype=np.intp).reshape(len(problem.joins), width)
+        self.labels += [("join", problem.timepoints[j]) for j, _ in problem.joins]
+
+        # Custom constraints are evaluated from the slack of their differences
+        self._differences = []
+        self._clauses = []
+        for identity, clause in problem.constraints:
+            self._clauses.append(self._compile(clause))
+            self.labels.append(("constraint", identity))
+        index = problem.timepoint_index
+        # A source of -1 refers to a column of zeros, for absolute times
+        self._difference_sources = np.array([index[d.source] if d.source is not None else -1
+                                             for d in self._differences], dtype=np.intp)
+        self._difference_targets = np.array([index[d.target] for d in self._differences], dtype=np.intp)
+        self._difference_low, self._difference_high = self._pad([d.intervals for d in self._differences])
+
+    @staticmethod
+    def _pad(intervals):
+        width = max((len(i) for i in intervals), default=1)
+        low = np.full((len(intervals), max(width, 1)), np.nan)
+        high = np.full((len(intervals), max(width, 1)), np.nan)
+        for k, disjunction in enumerate(intervals):
+            for m, (lo, hi) in enumerate(disjunction):
+                low[k, m] = lo
+                high[k, m] = hi
+        return low, high
+
+    def _compile(self, clause):
+        """
+        Index the differences of a clause
+        :return: nested tuples of the clause type and difference indices
+        """
+        if isinstance(clause, Difference):
+            self._differences.append(clause)
+            return Difference, len(self._differences) - 1
+        if isinstance(clause, Negation):
+            return Negation, self._compile(clause.clause)
+        if isinstance(clause, (Conjunction, Disjunction, ExactlyOne)):
+            return type(clause), [self._compile(c) for c in clause.clauses]
+        raise ValueError(f"Cannot validate clause of type {type(clause).__name__}")
+
+    def timestamps(self, logs):
+        """
+        Arrange logs as an array of times
+        :param logs: list of dicts from timepoint name to seconds, of
+            Schedules, or an array of shape (logs, timepoints) ordered like
+            problem.timepoints
+        :return: array of shape (logs, timepoints), NaN where a log has no time
+        """
+        if isinstance(logs, np.ndarray):
+            return logs.astype(float, copy=False)
+        times = np.full((len(logs), len(self.problem.timepoints)), np.nan)
+        index = self.problem.timepoint_index
+        for row, log in enumerate(logs):
+            log = getattr(log, "assignment", log)
+            for name, value in log.items():
+                column = index.get(name)
+                if column is not None:
+                    times[row, column] = value
+        return times
+
+    def validate(self, logs):
+        """
+        Check a batch of logs
+        :param logs: see timestamps()
+        :return: ValidationResult
+        """
+        times = self.timestamps(logs)
+        slack = np.concatenate([
+            self._interval_slack(times[:, self._edge_targets] - times[:, self._edge_sources],
+                                 self._edge_low, self._edge_high),
+            self._join_slack(times),
+            self._clause_slack(times),
+        ], axis=1)
+        return ValidationResult(self.labels, slack, self.epsilon)
+
+    @staticmethod
+    def _interval_slack(differences, low, high):
+        """
+        :param differences: array of shape (logs, constraints)
+        :param low: array of shape (constraints, intervals), NaN padded
+        :param high: like low
+        :return: array of shape (logs, constraints)
+        """
+        if differences.shape[1] == 0:
+            return differences
+        d = differences[:, :, np.newaxis]
+        with np.errstate(invalid="ignore"):
+            slack = np.minimum(d - low[np.newaxis], high[np.newaxis] - d)
+            # The slack of a disjunction is the slack of its best interval
+            slack = np.where(np.isnan(slack), -np.inf, slack).max(axis=2)
+        slack[np.isnan(differences)] = np.nan
+        return slack
+
+    def _join_slack(self, times):
+        if len(self._joins) == 0:
+            return np.empty((times.shape[0], 0))
+        distance = np.abs(times[:, self._joins][:, :, np.newaxis] - times[:, self._join_members])
+        return -distance.min(axis=2)
+
+    def _clause_slack(self, times):
+        if not self._clauses:
+            return np.empty((times.shape[0], 0))
+        padded = np.concatenate([times, np.zeros((times.shape[0], 1))], axis=1)
+        leaves = self._interval_slack(padded[:, self._difference_targets] - padded[:, self._difference_sources],
+                                      self._difference_low, self._difference_high)
+        return np.stack([self._combine(clause, leaves) for clause in self._clauses], axis=1)
+
+    def _combine(self, clause, leaves):
+        kind, parts = clause
+        if kind is Difference:
+            return leaves[:, parts]
+        if kind is Negation:
+            return -self._combine(parts, leaves)
+        if not parts:
+            # An empty conjunction always holds, and an empty disjunction never
+            return np.full(leaves.shape[0], np.inf if kind is Conjunction else -np.inf)
+        slacks = np.stack([self._combine(part, leaves) for part in parts], axis=1)
+        if kind is Conjunction:
+            return slacks.min(axis=1)
+        if kind is Disjunction:
+            return slacks.max(axis=1)
+        # ExactlyOne: the best alternative holds and the second best does not
+        if slacks.shape[1] == 1:
+            return slacks[:, 0]
+        ordered = np.sort(slacks, axis=1)
+        return np.minimum(ordered[:, -1], -ordered[:, -2])
@@ -0,0 +1,48 @@
+"""
+Fixtures shared by the tests
+"""
+import os
+import pytest
+import sbol3
+import labop_check.labop_check as pc
+from labop_check.benchmark import generate_document
+from labop_check.constraints import Difference, Disjunction
+
+
+def _disjunctive_problem(width):
+    """
+    A stage of parallel steps that may not overlap, in any order
+    """
+    problem = pc.compile_doc(generate_document(steps=width, width=width, duration_constraints=width))
+    protocol_id = list(problem.protocols)[0]
+    steps = [node for node in problem.protocol_nodes[protocol_id] if problem.node_kinds[node] == "CallBehaviorAction"]
+    for i, first in enumerate(steps):
+        for second in steps[i + 1:]:
+            problem.constraints.append((f"{first}_{second}", Disjunction([
+                Difference(f"end_{first}", f"start_{second}", [[0.0, problem.infinity]]),
+                Difference(f"end_{second}", f"start_{first}", [[0.0, problem.infinity]])])))
+    return problem
+
+
+@pytest.fixture
+def disjunctive_problem():
+    """
+    :return: function from a number of steps to a TemporalProblem whose
+        single protocol runs them without overlap
+    """
+    return _disjunctive_problem
+
+
+@pytest.fixture
+def get_doc_for_target():
+    """
+    :return: function from the name of a file in test/resources/labop to the
+        sbol3.Document read from it
+    """
+    def get_doc(target):
+        labop_file = os.path.join(os.getcwd(), "test/resources/labop", target)
+        doc = sbol3.Document()
+        sbol3.set_namespace("https://bbn.com/scratch/")
+        doc.read(labop_file, "turtle")
+        return doc
+    return get_doc
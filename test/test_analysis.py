@@ -0,0 +1,33 @@
+"""
+Time windows, slack and critical paths of activities
+"""
+import pytest
+from labop_check.activity_graph import ActivityGraph
+
+
+@pytest.mark.parametrize("target", ["igem_ludox_time_draft.ttl", "igem_ludox_dual_time_draft.ttl"])
+def test_time_windows(target, get_doc_for_target):
+    doc = get_doc_for_target(target)
+    graph = ActivityGraph(doc)
+    windows = graph.get_time_windows()
+    assert windows
+
+    df = windows.to_df()
+    assert len(df) > 0
+    assert (df["slack"] >= -windows.epsilon).all()
+    assert (df["earliest_start"] <= df["earliest_end"] + windows.epsilon).all()
+    assert (df["latest_start"] <= df["latest_end"] + windows.epsilon).all()
+
+    for protocol_id, path in windows.critical_paths().items():
+        # Without a later deadline, some activities must have no slack
+        assert path
+        starts = [windows.window(activity)["earliest_start"] for activity in path]
+        assert starts == sorted(starts)
+
+    # A later horizon gives activities more slack
+    problem = graph.compile()
+    horizon = max(windows.earliest[problem.get_end_time_name(p)] for p in problem.protocols) + 100.0
+    relaxed = graph.get_time_windows(horizon=horizon)
+    for activity in windows.activities():
+        assert relaxed.window(activity)["slack"] >= windows.window(activity)["slack"] - windows.epsilon
+    assert relaxed.to_df()["slack"].max() >= 100.0 - relaxed.epsilon
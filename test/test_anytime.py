@@ -0,0 +1,40 @@
+"""
+Anytime minimum duration search
+"""
+import time
+import pytest
+import labop_check.labop_check as pc
+
+timed_targets = ["igem_ludox_time_draft.ttl", "igem_ludox_dual_time_draft.ttl"]
+
+
+@pytest.mark.parametrize("target", timed_targets)
+def test_progress_callback(target, get_doc_for_target):
+    progress = {}
+
+    def callback(protocol_id, supremum, infimum, incumbent):
+        progress.setdefault(protocol_id, []).append((supremum, infimum))
+        assert incumbent
+
+    durations = pc.get_minimum_duration(get_doc_for_target(target), callback=callback)
+    for protocol_id, duration in durations.items():
+        assert duration["converged"]
+        steps = progress.get(protocol_id, [])
+        # The bounds close in monotonically on the reported minimum
+        for (sup_a, inf_a), (sup_b, inf_b) in zip(steps, steps[1:]):
+            assert sup_b <= sup_a
+            assert inf_b >= inf_a
+        if steps:
+            assert steps[-1] == (duration["duration"], duration["lower_bound"])
+
+
+@pytest.mark.parametrize("target", timed_targets)
+def test_expired_deadline(target, get_doc_for_target):
+    doc = get_doc_for_target(target)
+    converged = pc.get_minimum_duration(doc)
+    anytime = pc.get_minimum_duration(doc, deadline=time.monotonic())
+    for protocol_id, duration in anytime.items():
+        # The first schedule is still reported as an upper bound
+        assert duration["result"]
+        assert duration["duration"] >= converged[protocol_id]["duration"]
+        assert duration["lower_bound"] <= converged[protocol_id]["duration"]
@@ -0,0 +1,45 @@
+"""
+Async checking with timeouts and cancellation
+"""
+import asyncio
+import pytest
+import labop_check.labop_check as pc
+
+timed_targets = ["igem_ludox_time_draft.ttl", "igem_ludox_dual_time_draft.ttl"]
+
+
+@pytest.mark.parametrize("target", timed_targets)
+def test_check_doc_async(target, get_doc_for_target):
+    result = asyncio.run(pc.check_doc_async(get_doc_for_target(target), timeout=60))
+    assert result.status == pc.CheckResult.SATISFIABLE
+    assert result.value
+
+
+@pytest.mark.parametrize("target", timed_targets)
+def test_get_minimum_duration_async(target, get_doc_for_target):
+    doc = get_doc_for_target(target)
+    result = asyncio.run(pc.get_minimum_duration_async(doc, timeout=60))
+    assert result.status == pc.CheckResult.SATISFIABLE
+    expected = pc.get_minimum_duration(doc)
+    assert {p: d["duration"] for p, d in result.value.items()} == \
+        {p: d["duration"] for p, d in expected.items()}
+
+
+def test_async_timeout(get_doc_for_target):
+    doc = get_doc_for_target(timed_targets[0])
+    result = asyncio.run(pc.get_minimum_duration_async(doc, timeout=1e-6))
+    assert result.timed_out
+    assert result.value is None
+
+
+def test_async_cancel(get_doc_for_target):
+    doc = get_doc_for_target(timed_targets[1])
+
+    async def cancel_check():
+        task = asyncio.ensure_future(pc.get_minimum_duration_async(doc))
+        await asyncio.sleep(0)
+        task.cancel()
+        await task
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(cancel_check())
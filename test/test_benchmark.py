@@ -0,0 +1,57 @@
+"""
+Synthetic protocol generator and benchmark runner
+"""
+import pytest
+import labop_check.labop_check as pc
+from labop_check.benchmark import compare_results, generate_document, run_benchmark
+
+shapes = [
+    dict(steps=6, width=1, depth=0),
+    dict(steps=6, width=3, depth=0, duration_constraints=4, time_constraints=2),
+    dict(steps=4, width=2, depth=2, duration_constraints=4, time_constraints=2),
+]
+
+
+@pytest.mark.parametrize("shape", shapes)
+def test_generated_document(shape):
+    schedule, graph = pc.check_doc(generate_document(**shape))
+    assert schedule
+    assert len(graph.protocols) == shape["depth"] + 1
+
+
+def test_run_benchmark(tmp_path):
+    results = run_benchmark(cases=shapes[1:], repeat=1)
+    assert len(results["results"]) == 2
+    for result in results["results"]:
+        assert result["sizes"]["satisfiable"]
+        assert set(result["timings"]) == {"build", "compile", "generate_constraints", "solve", "resolve",
+                                          "minimize", "reminimize", "schedule"}
+    assert compare_results(results, results) == []
+
+    slower = {"results": [dict(r, timings={p: s * 2 + 1 for p, s in r["timings"].items()})
+                          for r in results["results"]]}
+    assert len(compare_results(results, slower)) == 2 * 8
+
+
+def test_dtp_backend():
+    case = dict(steps=6, width=3, duration_constraints=6, disjunctive_constraints=3)
+    result = run_benchmark(cases=[case], repeat=1, minimize=False, backends=("z3", "dtp"))["results"][0]
+    assert "solve_dtp" in result["timings"]
+    assert result["sizes"]["dtp_agrees"] is True
+    with pytest.raises(ValueError):
+        run_benchmark(cases=[case], repeat=1, backends=("cplex",))
+
+
+def test_disjunctive_document():
+    doc = generate_document(steps=6, width=3, duration_constraints=6, disjunctive_constraints=3)
+    schedule, graph = pc.check_doc(doc)
+    assert schedule
+    assert graph.compile().is_disjunctive()
+
+
+def test_alternatives():
+    doc = generate_document(steps=6, width=3, duration_constraints=6, disjunctive_constraints=3, alternatives=5)
+    problem = pc.compile_doc(doc)
+    schedule = pc.check_problem(problem, backend="dtp")
+    assert schedule
+    assert pc.check_problem(problem)
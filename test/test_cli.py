@@ -0,0 +1,40 @@
+"""
+Batch command-line checker
+"""
+import json
+import os
+import labop_check.labop_check as pc
+from labop_check.cli import find_documents, main
+
+resources = os.path.join(os.getcwd(), "test/resources/labop")
+
+
+def read_records(path):
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_check_directory(tmp_path):
+    output = str(tmp_path / "results.jsonl")
+    assert main([resources, "--jobs", "2", "--output", output]) == 0
+    records = read_records(output)
+    assert sorted(r["path"] for r in records) == find_documents([resources])
+    for record in records:
+        assert record["status"] == pc.CheckResult.SATISFIABLE
+        assert record["durations"]
+        assert record["timings"]["total"] > 0
+
+
+def test_resume_from_checkpoint(tmp_path):
+    output = str(tmp_path / "results.jsonl")
+    checkpoint = str(tmp_path / "checkpoint")
+    documents = find_documents([resources])
+    # An interrupted run that only checked the first document
+    assert main([documents[0], "--output", output, "--checkpoint", checkpoint, "--no-minimize"]) == 0
+    assert main([resources, "--jobs", "2", "--output", output, "--checkpoint", checkpoint, "--no-minimize"]) == 0
+    records = read_records(output)
+    assert sorted(r["path"] for r in records) == documents
+    assert all("durations" not in r for r in records)
+    # Nothing is left to check
+    assert main([resources, "--output", output, "--checkpoint", checkpoint]) == 0
+    assert len(read_records(output)) == len(documents)
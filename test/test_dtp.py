@@ -0,0 +1,85 @@
+"""
+Disjunctive temporal problem solver backend
+"""
+import pytest
+import labop_check.labop_check as pc
+from labop_check.constraints import Difference, ExactlyOne, Negation, ParameterDifference
+from labop_check.dtp import DisjunctiveTemporalSolver
+from labop_check.solver import SolverLimits
+
+
+def assert_schedule_holds(problem, assignment):
+    epsilon = problem.epsilon
+    for source, target, intervals in problem.edges:
+        difference = assignment[problem.timepoints[target]] - assignment[problem.timepoints[source]]
+        assert any(low - epsilon <= difference <= high + epsilon for low, high in intervals)
+    for j, members in problem.joins:
+        assert any(abs(assignment[problem.timepoints[j]] - assignment[problem.timepoints[m]]) <= epsilon
+                   for m in members)
+    for _, clause in problem.constraints:
+        assert clause.holds(assignment, epsilon)
+
+
+@pytest.mark.parametrize("target", ["igem_ludox_time_draft.ttl", "igem_ludox_dual_time_draft.ttl"])
+def test_check_doc(target, get_doc_for_target):
+    doc = get_doc_for_target(target)
+    schedule, graph = pc.check_doc(doc, backend="dtp")
+    assert schedule
+    assert_schedule_holds(graph.compile(), schedule.assignment)
+
+
+@pytest.mark.parametrize("width", [3, 5])
+def test_disjunctive_problem(width, disjunctive_problem):
+    problem = disjunctive_problem(width)
+    protocol_id = list(problem.protocols)[0]
+    schedule = pc.check_problem(problem, backend="dtp")
+    assert schedule
+    assert_schedule_holds(problem, schedule.assignment)
+
+    # The steps cannot all run within the longest of them
+    start, end = (problem.timepoints[i] for i in problem.protocols[protocol_id])
+    longest = max(schedule.assignment[f"end_{node}"] - schedule.assignment[f"start_{node}"]
+                  for node in problem.protocol_nodes[protocol_id] if problem.node_kinds[node] == "CallBehaviorAction")
+    problem.constraints.append(("deadline", Difference(start, end, [[0.0, longest]])))
+    assert not pc.check_problem(problem)
+    stats = pc.CheckStats()
+    assert not pc.check_problem(problem, backend="dtp", stats=stats)
+    assert stats.counts["dtp_conflicts"] > 0
+
+
+def test_exactly_one_and_negation(disjunctive_problem):
+    problem = disjunctive_problem(3)
+    protocol_id = list(problem.protocols)[0]
+    start, end = (problem.timepoints[i] for i in problem.protocols[protocol_id])
+    # The protocol takes at most 20 seconds, or 100 to 150 seconds, where
+    # only one of the windows holds
+    problem.constraints.append(("windows", ExactlyOne([
+        Difference(start, end, [[0.0, 20.0]]),
+        Difference(start, end, [[100.0, problem.infinity]]),
+        Negation(Difference(start, end, [[0.0, 150.0]]))])))
+    with DisjunctiveTemporalSolver(problem) as solver:
+        satisfiable = solver.check()
+        assignment = solver.get_assignment()
+    assert satisfiable
+    assert pc.check_problem(problem)
+    duration = assignment[end] - assignment[start]
+    assert duration <= 20.0 + problem.epsilon or 100.0 - problem.epsilon <= duration <= 150.0 + problem.epsilon
+
+
+def test_unsupported_constraint(disjunctive_problem):
+    problem = disjunctive_problem(3)
+    protocol_id = list(problem.protocols)[0]
+    start, end = (problem.timepoints[i] for i in problem.protocols[protocol_id])
+    problem.constraints.append(("parameter", ParameterDifference(start, end, "deadline")))
+    with pytest.raises(ValueError):
+        pc.check_problem(problem, backend="dtp")
+    with pytest.raises(ValueError):
+        pc.check_problem(problem, backend="no_such_backend")
+
+
+def test_cancelled_check(disjunctive_problem):
+    problem = disjunctive_problem(3)
+    limits = SolverLimits()
+    limits.cancel()
+    with pytest.raises(pc.SolverTimeout):
+        pc.check_problem(problem, limits=limits, backend="dtp")
@@ -0,0 +1,38 @@
+"""
+Enumerating diverse schedules
+"""
+import pytest
+import labop_check.labop_check as pc
+from labop_check.activity_graph import ActivityGraph
+
+
+@pytest.mark.parametrize("target", ["igem_ludox_time_draft.ttl", "igem_ludox_dual_time_draft.ttl"])
+def test_enumerate_schedules(target, get_doc_for_target):
+    doc = get_doc_for_target(target)
+    graph = ActivityGraph(doc)
+    min_difference = 60.0
+    schedules = list(pc.enumerate_schedules(graph, k=3, min_difference=min_difference))
+    assert len(schedules) == 3
+
+    def starts(schedule):
+        return {record["activity"]: record["start"] for record in schedule.to_records()}
+
+    for i, later in enumerate(schedules):
+        for earlier in schedules[:i]:
+            differences = [abs(starts(later)[a] - starts(earlier)[a]) for a in starts(earlier)]
+            assert max(differences) >= min_difference - graph.epsilon
+
+
+def test_enumerate_lazily(get_doc_for_target):
+    doc = get_doc_for_target("igem_ludox_time_draft.ttl")
+    schedules = pc.enumerate_schedules(ActivityGraph(doc))
+    assert next(schedules)
+    schedules.close()
+
+
+@pytest.mark.parametrize("min_difference", [0.0, -1.0, float("nan")])
+def test_min_difference_must_be_positive(min_difference, get_doc_for_target):
+    doc = get_doc_for_target("igem_ludox_time_draft.ttl")
+    # Otherwise every schedule would be found again
+    with pytest.raises(ValueError):
+        pc.enumerate_schedules(ActivityGraph(doc), min_difference=min_difference)
@@ -0,0 +1,66 @@
+"""
+Linear encoding of exactly-one constraints over many alternatives
+"""
+import math
+import pytest
+import pysmt.shortcuts
+import labop_check.labop_check as pc
+from labop_check.benchmark import generate_document
+from labop_check.constraints import Difference, ExactlyOne, Negation, exactly_one_constraint
+from labop_check.solver import ProblemSolver
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 17, 40])
+def test_equivalent_encodings(size):
+    formulas = [pysmt.shortcuts.Symbol(f"alternative_{i}") for i in range(size)]
+    linear = exactly_one_constraint(formulas, threshold=0)
+    pairwise = exactly_one_constraint(formulas, threshold=size)
+    # The encodings agree on every assignment, so also under negation
+    assert not pysmt.shortcuts.is_sat(pysmt.shortcuts.Xor(linear, pairwise))
+
+
+def windows(source, target, count, gap=100.0):
+    """
+    The difference is in exactly one of count separate windows
+    """
+    return ExactlyOne([Difference(source, target, [[2 * i * gap, (2 * i + 1) * gap]]) for i in range(count)])
+
+
+@pytest.mark.parametrize("negated", [False, True])
+def test_many_windows(negated):
+    problem = pc.compile_doc(generate_document(steps=6, width=1, duration_constraints=6))
+    protocol_id = list(problem.protocols)[0]
+    start, end = (problem.timepoints[i] for i in problem.protocols[protocol_id])
+    clause = windows(start, end, 40)
+    if negated:
+        clause = Negation(clause)
+    problem.constraints.append(("windows", clause))
+    schedule = pc.check_problem(problem)
+    assert schedule
+    assert clause.holds(schedule.assignment, problem.epsilon)
+
+
+def test_problem_threshold():
+    problem = pc.compile_doc(generate_document(steps=6, width=1, duration_constraints=6))
+    protocol_id = list(problem.protocols)[0]
+    start, end = (problem.timepoints[i] for i in problem.protocols[protocol_id])
+    problem.constraints.append(("windows", Negation(windows(start, end, 40))))
+    # The threshold reaches the nested ExactlyOne
+    linear = problem.to_formula(threshold=0)
+    pairwise = problem.to_formula(threshold=math.inf)
+    assert linear != pairwise
+    assert not pysmt.shortcuts.is_sat(pysmt.shortcuts.Xor(linear, pairwise))
+    with ProblemSolver(problem, threshold=math.inf) as solver:
+        assert solver.check()
+
+
+def test_exclusive_document():
+    doc = generate_document(steps=6, width=2, duration_constraints=6, exclusive_constraints=3, alternatives=24)
+    schedule, graph = pc.check_doc(doc)
+    assert schedule
+
+    def sizes(clause):
+        own = [len(clause.clauses)] if isinstance(clause, ExactlyOne) else []
+        return own + [size for c in getattr(clause, "clauses", []) for size in sizes(c)]
+
+    assert [size for _, clause in graph.compile().constraints for size in sizes(clause)] == [24] * 3
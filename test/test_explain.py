@@ -0,0 +1,38 @@
+"""
+Explaining infeasible problems by minimal unsat cores
+"""
+import pytest
+import labop_check.labop_check as pc
+from labop_check.activity_graph import ActivityGraph
+from labop_check.constraints import Conjunction, Difference
+from labop_check.solver import ProblemSolver
+
+
+@pytest.mark.parametrize("target", ["igem_ludox_time_draft.ttl", "igem_ludox_dual_time_draft.ttl"])
+def test_feasible(target, get_doc_for_target):
+    doc = get_doc_for_target(target)
+    assert ActivityGraph(doc).explain() is None
+
+
+@pytest.mark.parametrize("target", ["igem_ludox_time_draft.ttl", "igem_ludox_dual_time_draft.ttl"])
+def test_deadline_conflict(target, get_doc_for_target):
+    doc = get_doc_for_target(target)
+    problem = pc.compile_doc(doc)
+    protocol_id = list(problem.protocols)[0]
+    minimum = problem.get_minimum_duration()[protocol_id]["duration"]
+    start, end = (problem.timepoints[i] for i in problem.protocols[protocol_id])
+    # A deadline shorter than the protocol, next to a constraint that holds
+    problem.constraints.append(("https://bbn.com/scratch/deadlines", Conjunction([
+        Difference(start, end, [[0.0, minimum / 2]], identity="https://bbn.com/scratch/deadline"),
+        Difference(start, end, [[0.0, problem.infinity]], identity="https://bbn.com/scratch/loose")])))
+    explanation = problem.explain()
+    assert explanation.constraints == ["https://bbn.com/scratch/deadline"]
+    assert protocol_id in explanation.activities
+    assert explanation.edges
+
+    # Each part of a minimal explanation is needed for the conflict
+    labels = explanation.labels
+    with ProblemSolver(problem, selectors=True) as solver:
+        assert not solver.check(solver.assume(labels))
+        for k in range(len(labels)):
+            assert solver.check(solver.assume(labels[:k] + labels[k + 1:]))
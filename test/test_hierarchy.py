@@ -0,0 +1,67 @@
+"""
+Bottom-up summarization of sub-protocols
+"""
+import pytest
+import labop_check.labop_check as pc
+from labop_check.benchmark import generate_document
+from labop_check.hierarchy import summarize
+
+depths = [1, 3]
+
+
+@pytest.mark.parametrize("depth", depths)
+def test_summarized_minimum_duration(depth):
+    problem = pc.compile_doc(generate_document(steps=4, width=2, depth=depth))
+    summaries = {}
+    summarized = summarize(problem, summaries)
+    # Every sub-protocol is summarized once, and only the top level remains
+    assert len(summaries) == depth
+    assert len(summarized.protocols) == 1
+    assert len(summarized.timepoints) < len(problem.timepoints)
+
+    top = list(summarized.protocols)[0]
+    full = problem.get_minimum_duration()[top]["duration"]
+    assert summarized.get_minimum_duration()[top]["duration"] == pytest.approx(full, abs=0.1 * (depth + 1))
+
+
+@pytest.mark.parametrize("depth", depths)
+def test_summaries_are_reused(depth):
+    doc = generate_document(steps=4, width=1, depth=depth)
+    summaries = {}
+    stats = pc.CheckStats()
+    schedule, problem = pc.check_doc(doc, release=True, summaries=summaries, stats=stats)
+    assert schedule
+    assert stats.counts["solver_calls"] > 1
+    cached = dict(summaries)
+    stats = pc.CheckStats()
+    pc.check_doc(doc, release=True, summaries=summaries, stats=stats)
+    # Only the top level problem is solved the second time
+    assert summaries == cached
+    assert stats.counts["solver_calls"] == 1
+
+
+@pytest.mark.parametrize("depth", depths)
+def test_expanded_schedule(depth):
+    doc = generate_document(steps=4, width=2, depth=depth)
+    summarized, _ = pc.check_doc(doc, release=True, summaries={})
+    expanded, problem = pc.check_doc(doc, release=True, summaries={}, expand=True)
+    # The expanded schedule includes the activities of the sub-protocols
+    assert set(summarized.activities) < set(expanded.activities)
+    assert set(expanded.assignment) == set(problem.timepoints)
+
+
+def test_edited_sub_protocol():
+    problem = pc.compile_doc(generate_document(steps=4, width=1, depth=1))
+    summaries = {}
+    summarize(problem, summaries)
+    cached = dict(summaries)
+
+    # The sub-protocol now takes at least 1000 seconds
+    called = next(called for calls in problem.calls().values() for _, called in calls)
+    start, end = problem.protocols[called]
+    problem.edges.append((start, end, [[1000.0, 2000.0]]))
+    summarized = summarize(problem, summaries)
+    # Its old summary is not reused
+    assert set(cached) < set(summaries)
+    top = list(summarized.protocols)[0]
+    assert summarized.get_minimum_duration()[top]["duration"] >= 1000.0
@@ -0,0 +1,90 @@
+"""
+Re-checking a document after edits
+"""
+import labop
+import pytest
+import sbol3
+import labop_check.labop_check as pc
+from labop_check.activity_graph import ActivityGraph
+
+
+def _make_dummy_protocol(id, doc):
+    subprotocol = labop.Protocol(id, name=id)
+    doc.add(subprotocol)
+    action = labop.Primitive(f"action1_{id}")
+    doc.add(action)
+    subprotocol.primitive_step(f"action1_{id}")
+    return subprotocol
+
+
+def make_library():
+    doc = sbol3.Document()
+    sbol3.set_namespace("https://bbn.com/scratch/")
+    top = labop.Protocol("top_protocol")
+    doc.add(top)
+    subprotocol1 = _make_dummy_protocol("subprotocol1", doc)
+    top.primitive_step(subprotocol1)
+    subprotocol2 = _make_dummy_protocol("subprotocol2", doc)
+    subprotocol1.primitive_step(subprotocol2)
+    return doc, top, subprotocol1, subprotocol2
+
+
+def test_unchanged_document():
+    doc, *_ = make_library()
+    graph = ActivityGraph(doc)
+    protocols = dict(graph.protocols)
+    assert graph.recheck()
+    changes = graph.update(doc)
+    assert changes == {"added": [], "removed": [], "changed": []}
+    # Nothing was rebuilt
+    assert all(graph.protocols[identity] is protocol for identity, protocol in protocols.items())
+    assert graph.recheck()
+
+
+def test_edited_protocol():
+    doc, top, subprotocol1, subprotocol2 = make_library()
+    graph = ActivityGraph(doc)
+    assert graph.recheck()
+    kept = graph.protocols[top.identity]
+
+    doc.add(labop.Primitive("action2_subprotocol2"))
+    subprotocol2.primitive_step("action2_subprotocol2")
+    changes = graph.update(doc)
+    assert subprotocol2.identity in changes["changed"]
+    assert top.identity not in changes["changed"]
+    assert graph.protocols[top.identity] is kept
+
+    schedule = graph.recheck()
+    assert schedule
+    # The updated graph compiles to the same problem as a new graph
+    full = ActivityGraph(doc).compile()
+    assert sorted(graph.compile().timepoints) == sorted(full.timepoints)
+    assert len(graph.compile().edges) == len(full.edges)
+
+
+@pytest.mark.parametrize("target", ["igem_ludox_time_draft.ttl", "igem_ludox_dual_time_draft.ttl"])
+def test_recheck(target, get_doc_for_target):
+    doc = get_doc_for_target(target)
+    graph = ActivityGraph(doc)
+    first = graph.recheck()
+    assert first
+    graph.update(get_doc_for_target(target))
+    second = graph.recheck()
+    assert second
+    schedule, _ = pc.check_doc(doc)
+    assert set(second.assignment) == set(schedule.assignment)
+
+
+def test_destructive_edit():
+    doc, top, subprotocol1, subprotocol2 = make_library()
+    # The graph shares the document, so the edit below changes its doc too
+    graph = ActivityGraph(doc, destructive=True)
+    assert graph.recheck()
+
+    doc.add(labop.Primitive("action2_subprotocol2"))
+    subprotocol2.primitive_step("action2_subprotocol2")
+    changes = graph.update(doc)
+    assert subprotocol2.identity in changes["changed"]
+    assert top.identity not in changes["changed"]
+    full = ActivityGraph(doc).compile()
+    assert sorted(graph.compile().timepoints) == sorted(full.timepoints)
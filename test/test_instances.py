@@ -0,0 +1,72 @@
+"""
+Per-invocation instances of sub-protocols
+"""
+import labop
+import pytest
+import sbol3
+import labop_check.labop_check as pc
+from labop_check.instances import INSTANCE_SEPARATOR, instantiate
+
+
+def _make_dummy_protocol(id, doc):
+    subprotocol = labop.Protocol(id, name=id)
+    doc.add(subprotocol)
+    action = labop.Primitive(f"action1_{id}")
+    doc.add(action)
+    subprotocol.primitive_step(f"action1_{id}")
+    return subprotocol
+
+
+def make_repeated_calls(calls):
+    doc = sbol3.Document()
+    sbol3.set_namespace("https://bbn.com/scratch/")
+    protocol = labop.Protocol("top_protocol")
+    doc.add(protocol)
+    pipetting = _make_dummy_protocol("pipetting", doc)
+    for _ in range(calls):
+        protocol.primitive_step(pipetting)
+    return doc, protocol, pipetting
+
+
+def test_sequential_calls():
+    doc, protocol, pipetting = make_repeated_calls(2)
+    # Both calls share one time window, but must follow each other
+    schedule, _ = pc.check_doc(doc)
+    assert schedule is None
+
+    schedule, problem = pc.check_doc(doc, release=True, per_invocation=True)
+    assert schedule
+    instances = [p for p in problem.protocols if p.endswith(INSTANCE_SEPARATOR + pipetting.identity)]
+    assert len(instances) == 2
+    first, second = sorted(instances, key=lambda p: schedule.assignment[f"start_{p}"])
+    assert schedule.assignment[f"end_{first}"] <= schedule.assignment[f"start_{second}"]
+
+
+@pytest.mark.parametrize("calls", [1, 100])
+def test_templates_are_reused(calls):
+    doc, protocol, pipetting = make_repeated_calls(calls)
+    problem = pc.compile_doc(doc)
+    templates = {}
+    instances = instantiate(problem, templates)
+    assert {identity for identity, _ in templates} == {protocol.identity, pipetting.identity}
+    assert len(instances.protocols) == calls + 1
+    cached = dict(templates)
+    again = instantiate(problem, templates)
+    assert all(templates[p] is cached[p] for p in cached)
+    assert again.timepoints == instances.timepoints
+    assert pc.check_problem(instances)
+
+
+def test_templates_follow_edits():
+    doc, protocol, pipetting = make_repeated_calls(2)
+    templates = {}
+    first = pc.compile_doc(doc, per_invocation=True, templates=templates)
+    cached = dict(templates)
+
+    doc.add(labop.Primitive("action2_pipetting"))
+    pipetting.primitive_step("action2_pipetting")
+    second = pc.compile_doc(doc, per_invocation=True, templates=templates)
+    # The edited sub-protocol gets a new template, and its instances the new step
+    assert set(cached) < set(templates)
+    assert len(second.timepoints) > len(first.timepoints)
+    assert len(second.timepoints) == len(pc.compile_doc(doc, per_invocation=True).timepoints)
@@ -0,0 +1,81 @@
+"""
+Memory use of the time variables of an ActivityGraph
+"""
+import sys
+import tracemalloc
+import pytest
+from labop_check.activity_graph import ActivityGraph
+from labop_check.protocol import TimeVariableGroup
+
+targets = [
+    "igem_ludox_time_draft.ttl",
+    "igem_ludox_dual_time_draft.ttl",
+    "igem_ludox_draft.ttl",
+    "igem_ludox_dual_draft.ttl",
+]
+
+
+def _graph_variables(graph):
+    return [
+        var
+        for protocol in graph.protocols.values()
+        for grp in protocol.time_variable_groups.values()
+        for _, var in grp.items()
+    ]
+
+
+@pytest.mark.parametrize("target", targets)
+def test_time_variables_are_slotted(target, get_doc_for_target):
+    graph = ActivityGraph(get_doc_for_target(target))
+    for protocol in graph.protocols.values():
+        for grp in protocol.time_variable_groups.values():
+            assert not hasattr(grp, "__dict__")
+            for prefix, var in grp.items():
+                assert not hasattr(var, "__dict__")
+                assert grp[prefix] is var
+                # Variables share the interned identity of their group
+                assert var.identity is grp.identity
+                assert var.name == f"{prefix}_{grp.identity}"
+
+
+class _DictTimeVariable:
+    """
+    Baseline: a TimeVariable with a per-instance __dict__, as before it was
+    slotted.  Groups of these were dicts keyed by prefix.
+    """
+
+    def __init__(self, prefix, ref):
+        self.ref = ref
+        self.prefix = prefix
+        self.identity = str(ref.identity)
+        self.name = sys.intern(f"{prefix}_{self.identity}")
+        self.value = None
+
+
+def _traced_bytes(build):
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        built = build()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del built
+    return current - start
+
+
+@pytest.mark.parametrize("target", targets)
+def test_time_variable_memory(target, get_doc_for_target):
+    graph = ActivityGraph(get_doc_for_target(target), destructive=True)
+    groups = [(protocol, grp.ref) for protocol in graph.protocols.values()
+              for grp in protocol.time_variable_groups.values()]
+    num_variables = len(_graph_variables(graph))
+    assert num_variables == 3 * len(groups) > 0
+
+    # The graph has interned the names already, so both measure only the
+    # objects that hold the variables
+    slotted = _traced_bytes(lambda: [TimeVariableGroup(protocol, ref) for protocol, ref in groups])
+    baseline = _traced_bytes(lambda: [{prefix: _DictTimeVariable(prefix, ref) for prefix in TimeVariableGroup.VARIABLES}
+                                      for _, ref in groups])
+    assert slotted < baseline
+    assert slotted / num_variables < 128
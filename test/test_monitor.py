@@ -0,0 +1,80 @@
+"""
+Monitoring the execution of a schedule
+"""
+import pytest
+import labop_check.labop_check as pc
+from labop_check.monitor import ExecutionMonitor
+
+
+def _activities(schedule):
+    return [record["activity"] for record in schedule.to_records()]
+
+
+@pytest.mark.parametrize("target", ["igem_ludox_time_draft.ttl", "igem_ludox_dual_time_draft.ttl"])
+def test_observe_planned_times(target, get_doc_for_target):
+    doc = get_doc_for_target(target)
+    schedule, graph = pc.check_doc(doc)
+    assert schedule
+    monitor = ExecutionMonitor(graph, schedule)
+    for activity in _activities(schedule):
+        start, end = f"start_{activity}", f"end_{activity}"
+        assert monitor.observe({start: schedule.assignment[start],
+                                end: schedule.assignment[end]}) == []
+    updated = monitor.schedule()
+    for activity in _activities(schedule):
+        assert updated.assignment[f"end_{activity}"] == pytest.approx(schedule.assignment[f"end_{activity}"])
+
+
+@pytest.mark.parametrize("target", ["igem_ludox_time_draft.ttl", "igem_ludox_dual_time_draft.ttl"])
+def test_observe_late_activity(target, get_doc_for_target):
+    doc = get_doc_for_target(target)
+    schedule, graph = pc.check_doc(doc)
+    monitor = ExecutionMonitor(graph, schedule)
+    first = _activities(schedule)[0]
+    protocol = [p for p, nodes in schedule.problem.protocol_nodes.items() if first in nodes][0]
+    delay = 1000.0
+    late = schedule.assignment[f"end_{first}"] + delay
+    monitor.observe({f"start_{first}": schedule.assignment[f"start_{first}"],
+                     f"end_{first}": late})
+
+    # The rest of the protocol is re-planned after the observed end
+    updated = monitor.schedule()
+    assert updated.assignment[f"end_{first}"] == late
+    assert updated.assignment[f"end_{protocol}"] >= late
+    assert all(updated.assignment[name] >= 0.0 for name in updated.assignment)
+
+
+def test_observe_out_of_order(get_doc_for_target):
+    doc = get_doc_for_target("igem_ludox_time_draft.ttl")
+    schedule, graph = pc.check_doc(doc)
+    monitor = ExecutionMonitor(graph)
+    protocol = list(graph.protocols)[0]
+    activity = _activities(schedule)[0]
+    monitor.observe({f"start_{protocol}": 100.0})
+    # Activities cannot end before their protocol has started
+    violations = monitor.observe({f"end_{activity}": 50.0})
+    assert violations
+    assert all(violation.amount is None or violation.amount > 0 for violation in violations)
+    assert monitor.violations == violations
+
+    with pytest.raises(ValueError):
+        monitor.observe({"start_no_such_activity": 0.0})
+
+
+def test_observe_now(get_doc_for_target):
+    doc = get_doc_for_target("igem_ludox_time_draft.ttl")
+    schedule, graph = pc.check_doc(doc)
+    monitor = ExecutionMonitor(graph, schedule)
+    protocol = list(graph.protocols)[0]
+    first, second = _activities(schedule)[:2]
+    now = schedule.assignment[f"end_{protocol}"] + 100.0
+    monitor.observe({f"start_{first}": schedule.assignment[f"start_{first}"],
+                     f"end_{first}": schedule.assignment[f"end_{first}"]}, now=now)
+
+    # The rest of the protocol has not happened yet, so it ends after now
+    updated = monitor.schedule()
+    assert updated.assignment[f"end_{protocol}"] >= now
+    # An earlier current time does not move the schedule back
+    monitor.observe({f"start_{second}": now}, now=now - 50.0)
+    assert monitor.now == now
+    assert monitor.schedule().assignment[f"end_{protocol}"] >= now
@@ -0,0 +1,43 @@
+"""
+Joint minimization of protocol durations
+"""
+import pytest
+from labop_check.activity_graph import ActivityGraph
+
+
+@pytest.mark.parametrize("target", ["igem_ludox_time_draft.ttl", "igem_ludox_dual_time_draft.ttl"])
+def test_joint_minimum_duration(target, get_doc_for_target):
+    doc = get_doc_for_target(target)
+    graph = ActivityGraph(doc)
+    schedule, durations = graph.get_joint_minimum_duration()
+    assert schedule
+    problem = graph.compile()
+    assert set(durations) == set(problem.protocols)
+
+    # One schedule gives every protocol's duration, which is no shorter than
+    # the minimum found for that protocol alone
+    minimum = graph.get_minimum_duration()
+    for protocol_id, duration in durations.items():
+        assert duration == problem.get_duration(schedule.assignment, protocol_id)
+        assert duration >= minimum[protocol_id]["lower_bound"] - problem.epsilon
+
+
+@pytest.mark.parametrize("target", ["igem_ludox_time_draft.ttl", "igem_ludox_dual_time_draft.ttl"])
+def test_lexicographic_and_makespan(target, get_doc_for_target):
+    doc = get_doc_for_target(target)
+    graph = ActivityGraph(doc)
+    problem = graph.compile()
+    first = list(problem.protocols)[0]
+    _, durations = graph.get_joint_minimum_duration(order=[first])
+    minimum = graph.get_minimum_duration()
+    assert durations[first] == pytest.approx(minimum[first]["duration"], abs=0.2)
+
+    _, durations = graph.get_joint_minimum_duration(makespan=True)
+    _, weighted = graph.get_joint_minimum_duration()
+    assert max(durations.values()) <= max(weighted.values()) + problem.epsilon
+
+
+def test_unknown_protocol(get_doc_for_target):
+    doc = get_doc_for_target("igem_ludox_time_draft.ttl")
+    with pytest.raises(ValueError):
+        ActivityGraph(doc).get_joint_minimum_duration(order=["https://bbn.com/scratch/no_such_protocol"])
@@ -0,0 +1,40 @@
+"""
+Parallel k-ary search for the minimum duration of disjunctive problems
+"""
+import pytest
+import labop_check.labop_check as pc
+from labop_check.minimize_duration import ParallelMinimizeDuration
+from labop_check.solver import SolverLimits
+
+
+@pytest.mark.parametrize("width", [3, 4])
+def test_parallel_minimum_duration(width, disjunctive_problem):
+    problem = disjunctive_problem(width)
+    assert problem.is_disjunctive()
+    sequential = problem.get_minimum_duration()
+    rounds = []
+    parallel = problem.get_minimum_duration(processes=3, callback=lambda *args: rounds.append(args))
+    for protocol_id, minimum in sequential.items():
+        assert parallel[protocol_id]["converged"]
+        assert parallel[protocol_id]["duration"] == pytest.approx(minimum["duration"], abs=0.2)
+    # Three probes per round narrow the interval four times per round
+    assert len(rounds) <= len(sequential) * 12
+
+
+def test_probes_shrink_interval(disjunctive_problem):
+    problem = disjunctive_problem(3)
+    protocol_id = list(problem.protocols)[0]
+    with ParallelMinimizeDuration(problem, processes=2, k=2) as search:
+        steps = list(search.iter_minimize(protocol_id, 1000.0))
+    assert steps
+    for (supremum, infimum, result), (next_supremum, next_infimum, _) in zip(steps, steps[1:]):
+        assert next_supremum - next_infimum <= (supremum - infimum) / 3.0 + 1e-6
+        assert problem.get_duration(result, protocol_id) == supremum
+
+
+def test_cancelled_search(disjunctive_problem):
+    problem = disjunctive_problem(3)
+    limits = SolverLimits()
+    limits.cancel()
+    with pytest.raises(pc.SolverTimeout):
+        problem.get_minimum_duration(limits=limits, processes=2)
@@ -0,0 +1,50 @@
+"""
+Check compiled problems in private pysmt environments
+"""
+import gc
+import tracemalloc
+import pysmt.shortcuts
+import pytest
+import labop_check.labop_check as pc
+from labop_check.temporal_problem import TemporalProblem
+
+timed_targets = ["igem_ludox_time_draft.ttl", "igem_ludox_dual_time_draft.ttl"]
+untimed_targets = ["igem_ludox_draft.ttl", "igem_ludox_dual_draft.ttl"]
+all_targets = timed_targets + untimed_targets
+
+
+@pytest.mark.parametrize("target", all_targets)
+def test_check_doc_release(target, get_doc_for_target):
+    schedule, problem = pc.check_doc(get_doc_for_target(target), release=True)
+    assert isinstance(problem, TemporalProblem)
+    assert schedule
+
+    # Same verdict as the document based check
+    graph_schedule, _ = pc.check_doc(get_doc_for_target(target))
+    assert set(schedule.activities) == set(graph_schedule.activities)
+
+
+def test_check_problem_soak(get_doc_for_target):
+    problem = pc.compile_doc(get_doc_for_target(timed_targets[0]))
+    global_formulae = pysmt.shortcuts.get_env().formula_manager.formulae
+
+    # Warm up caches before measuring
+    for _ in range(20):
+        assert pc.check_problem(problem)
+    num_global_formulae = len(global_formulae)
+
+    tracemalloc.start()
+    try:
+        samples = []
+        for i in range(1000):
+            assert pc.check_problem(problem)
+            if (i + 1) % 250 == 0:
+                gc.collect()
+                samples.append(tracemalloc.get_traced_memory()[0])
+    finally:
+        tracemalloc.stop()
+
+    # Nothing is left behind in the global environment ...
+    assert len(global_formulae) == num_global_formulae
+    # ... and memory is flat after the first batch
+    assert samples[-1] - samples[0] < 256 * 1024
@@ -0,0 +1,41 @@
+"""
+Monte Carlo robustness of schedules to activity durations
+"""
+import numpy as np
+import pytest
+import labop_check.labop_check as pc
+from labop_check.robustness import robustness
+
+
+@pytest.mark.parametrize("target", ["igem_ludox_time_draft.ttl", "igem_ludox_dual_time_draft.ttl"])
+def test_robustness(target, get_doc_for_target):
+    doc = get_doc_for_target(target)
+    schedule, graph = pc.check_doc(doc)
+    assert schedule
+    activity = schedule.to_records()[0]["activity"]
+    planned = schedule.assignment[f"end_{activity}"] - schedule.assignment[f"start_{activity}"]
+
+    # The planned duration is always feasible
+    result = robustness(graph, {activity: planned}, samples=10, assignment=schedule.assignment)
+    assert result.samples == 10
+    assert result.success_probability == 1.0
+
+    result = robustness(graph, {activity: ("uniform", planned, planned + 60.0)}, samples=500, seed=0,
+                        assignment=schedule.assignment)
+    assert np.all(result.durations[activity] >= planned)
+    assert 0.0 <= result.success_probability <= 1.0
+    for protocol_id, percentiles in result.percentiles().items():
+        if result.success_probability > 0:
+            assert percentiles[50] <= percentiles[99]
+
+    # Samples are reproducible from the seed
+    again = robustness(graph, {activity: ("uniform", planned, planned + 60.0)}, samples=500, seed=0,
+                       assignment=schedule.assignment)
+    assert np.array_equal(again.feasible, result.feasible)
+
+
+def test_unknown_activity(get_doc_for_target):
+    doc = get_doc_for_target("igem_ludox_time_draft.ttl")
+    _, graph = pc.check_doc(doc)
+    with pytest.raises(ValueError):
+        robustness(graph, {"https://bbn.com/scratch/no_such_activity": 1.0})
@@ -0,0 +1,80 @@
+"""
+Persistent checking server and client
+"""
+import os
+import threading
+import pytest
+import labop_check.labop_check as pc
+from labop_check.server import CheckClient, CheckServer, RPCError, METHOD_NOT_FOUND
+
+timed_targets = ["igem_ludox_time_draft.ttl", "igem_ludox_dual_time_draft.ttl"]
+
+
+def get_path_for_target(target):
+    return os.path.join(os.getcwd(), "test/resources/labop", target)
+
+
+@pytest.fixture(scope="module")
+def socket_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("server") / "labop-check.sock")
+    server = CheckServer(path, workers=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield path
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("target", timed_targets)
+def test_check_doc(socket_path, target):
+    with CheckClient(socket_path) as client:
+        first = client.check_doc(get_path_for_target(target), include_model=True)
+        second = client.check_doc(get_path_for_target(target))
+    assert first["status"] == pc.CheckResult.SATISFIABLE
+    assert first["result"]
+    # The compiled document is reused for the second request
+    assert second["cached"]
+    assert second["document"] == first["document"]
+    assert second["status"] == first["status"]
+
+
+@pytest.mark.parametrize("target", timed_targets)
+def test_get_minimum_duration(socket_path, target, get_doc_for_target):
+    with CheckClient(socket_path) as client:
+        result = client.get_minimum_duration(get_path_for_target(target))
+    expected = pc.get_minimum_duration(get_doc_for_target(target))
+    assert result["status"] == pc.CheckResult.SATISFIABLE
+    assert {p: d["duration"] for p, d in result["durations"].items()} == \
+        {p: d["duration"] for p, d in expected.items()}
+
+
+@pytest.mark.parametrize("target", timed_targets)
+def test_export_schedule(socket_path, target):
+    with open(get_path_for_target(target), "r") as f:
+        document = f.read()
+    with CheckClient(socket_path) as client:
+        result = client.export_schedule(document=document)
+    schedule = result["schedule"]
+    assert schedule
+    assert all(record["start"] <= record["end"] for record in schedule)
+    assert [r["start"] for r in schedule] == sorted(r["start"] for r in schedule)
+
+
+def test_unknown_method(socket_path):
+    with CheckClient(socket_path) as client:
+        assert client.ping() == "pong"
+        with pytest.raises(RPCError) as e:
+            client.call("no_such_method")
+        assert e.value.code == METHOD_NOT_FOUND
+        assert client.stats()["workers"] == 2
+
+
+@pytest.mark.parametrize("target", timed_targets)
+def test_warm_start(socket_path, target):
+    with CheckClient(socket_path) as client:
+        first = client.check_doc(get_path_for_target(target), include_model=True)
+        warm_starts = client.stats()["counts"].get("warm_starts", 0)
+        second = client.check_doc(get_path_for_target(target), include_model=True)
+        # The second check starts from the model of the first
+        assert client.stats()["counts"]["warm_starts"] == warm_starts + 1
+    assert second["result"] == pytest.approx(first["result"])
@@ -0,0 +1,65 @@
+"""
+Checking one protocol and the sub-protocols it calls
+"""
+import labop
+import pytest
+import sbol3
+import labop_check.labop_check as pc
+from labop_check.activity_graph import ActivityGraph
+
+
+def _make_dummy_protocol(id, doc):
+    subprotocol = labop.Protocol(id, name=id)
+    doc.add(subprotocol)
+    action = labop.Primitive(f"action1_{id}")
+    doc.add(action)
+    subprotocol.primitive_step(f"action1_{id}")
+    return subprotocol
+
+
+def make_library():
+    doc = sbol3.Document()
+    sbol3.set_namespace("https://bbn.com/scratch/")
+    top = labop.Protocol("top_protocol")
+    doc.add(top)
+    subprotocol1 = _make_dummy_protocol("subprotocol1", doc)
+    top.primitive_step(subprotocol1)
+    subprotocol2 = _make_dummy_protocol("subprotocol2", doc)
+    subprotocol1.primitive_step(subprotocol2)
+    unrelated = _make_dummy_protocol("unrelated", doc)
+    return doc, top, subprotocol1, subprotocol2, unrelated
+
+
+def test_sub_protocol_closure():
+    doc, top, subprotocol1, subprotocol2, unrelated = make_library()
+    assert len(ActivityGraph(doc).protocols) == 4
+
+    graph = ActivityGraph(doc, roots=[top])
+    assert set(graph.protocols) == {top.identity, subprotocol1.identity, subprotocol2.identity}
+
+    graph = ActivityGraph(doc, roots=[subprotocol1.identity])
+    assert set(graph.protocols) == {subprotocol1.identity, subprotocol2.identity}
+
+    schedule, graph = pc.check_doc(doc, protocol=subprotocol2)
+    assert schedule
+    assert set(graph.protocols) == {subprotocol2.identity}
+
+
+def test_unknown_protocol():
+    doc, *_ = make_library()
+    with pytest.raises(ValueError):
+        pc.check_doc(doc, protocol="https://bbn.com/scratch/no_such_protocol")
+
+
+def test_slice_skips_shared_constraints(get_doc_for_target):
+    doc = get_doc_for_target("igem_ludox_dual_time_draft.ttl")
+    full = ActivityGraph(doc)
+    for protocol_id in full.protocols:
+        schedule, problem = pc.check_doc(doc, release=True, protocol=protocol_id)
+        assert schedule
+        assert list(problem.protocols) == [protocol_id]
+        # The time constraints refer to both protocols
+        assert problem.constraints == []
+
+    durations = pc.get_minimum_duration(doc, protocol=list(full.protocols))
+    assert set(durations) == set(full.protocols)
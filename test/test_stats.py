@@ -0,0 +1,32 @@
+"""
+Phase timing and counter instrumentation
+"""
+import pytest
+import labop_check.labop_check as pc
+
+targets = ["igem_ludox_draft.ttl", "igem_ludox_time_draft.ttl", "igem_ludox_dual_time_draft.ttl"]
+
+
+@pytest.mark.parametrize("target", targets)
+def test_check_doc_stats(target, get_doc_for_target):
+    ended = []
+    stats = pc.CheckStats(callback=lambda phase, seconds: ended.append(phase))
+    schedule, graph = pc.check_doc(get_doc_for_target(target), stats=stats)
+    assert schedule
+    for phase in ["clone", "build", "compile", "generate_constraints", "solve", "schedule"]:
+        assert stats.phases[phase] >= 0
+        assert phase in ended
+    assert stats.counts["protocols"] == len(graph.protocols)
+    assert stats.counts["timepoints"] == len(graph.compile().timepoints)
+    assert stats.counts["formula_dag_size"] > stats.counts["timepoints"]
+    assert stats.counts["solver_calls"] == 1
+    assert stats.solver_statistics
+
+
+@pytest.mark.parametrize("target", targets)
+def test_minimum_duration_stats(target, get_doc_for_target):
+    stats = pc.CheckStats()
+    pc.get_minimum_duration(get_doc_for_target(target), stats=stats)
+    assert stats.phases["minimize"] > 0
+    # One solver call finds the first schedule, the rest are the search
+    assert stats.counts["solver_calls"] == stats.counts.get("minimize_solver_calls", 0) + 1
@@ -0,0 +1,42 @@
+"""
+Sweeping candidate durations with solver assumptions
+"""
+import pytest
+import labop_check.labop_check as pc
+from labop_check.activity_graph import ActivityGraph
+from labop_check.sweep import sweep
+
+
+@pytest.mark.parametrize("target", ["igem_ludox_time_draft.ttl", "igem_ludox_dual_time_draft.ttl"])
+def test_sweep_activity(target, get_doc_for_target):
+    doc = get_doc_for_target(target)
+    schedule, graph = pc.check_doc(doc)
+    assert schedule
+    activity = schedule.to_records()[0]["activity"]
+    planned = schedule.assignment[f"end_{activity}"] - schedule.assignment[f"start_{activity}"]
+
+    results = sweep(graph, {activity: [(0.0, graph.infinity), planned]})
+    assert [result["values"] for result in results] == [((0.0, graph.infinity),), (planned,)]
+    assert all(result["feasible"] for result in results)
+
+    # An unconstrained parameter leaves the minimum durations unchanged
+    minimum = ActivityGraph(doc).get_minimum_duration()
+    for protocol_id, duration in results[0]["durations"].items():
+        assert duration == pytest.approx(minimum[protocol_id]["duration"], abs=0.2)
+
+
+def test_sweep_processes(get_doc_for_target):
+    doc = get_doc_for_target("igem_ludox_time_draft.ttl")
+    schedule, graph = pc.check_doc(doc)
+    first, second = [record["activity"] for record in schedule.to_records()[:2]]
+    parameters = {first: [(0.0, graph.infinity), (0.0, 1000.0)], second: [(0.0, graph.infinity), (0.0, 1000.0)]}
+    results = sweep(graph, parameters, minimize=False)
+    assert len(results) == 4
+    assert [r["feasible"] for r in sweep(graph, parameters, minimize=False, processes=2)] == \
+        [r["feasible"] for r in results]
+
+
+def test_unknown_parameter(get_doc_for_target):
+    doc = get_doc_for_target("igem_ludox_time_draft.ttl")
+    with pytest.raises(ValueError):
+        sweep(ActivityGraph(doc), {"https://bbn.com/scratch/no_such_constraint": [1.0]})
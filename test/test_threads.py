@@ -0,0 +1,64 @@
+"""
+Check documents concurrently from a thread pool
+"""
+from concurrent.futures import ThreadPoolExecutor
+import pysmt.environment
+import pysmt.shortcuts
+import pytest
+import sbol3
+import labop_check.labop_check as pc
+from labop_check.activity_graph import ActivityGraph
+
+timed_targets = ["igem_ludox_time_draft.ttl", "igem_ludox_dual_time_draft.ttl"]
+untimed_targets = ["igem_ludox_draft.ttl", "igem_ludox_dual_draft.ttl"]
+all_targets = timed_targets + untimed_targets
+
+
+def _check(doc):
+    schedule, _ = pc.check_doc(doc)
+    return schedule is not None
+
+
+def _minimum_durations(doc):
+    durations = pc.get_minimum_duration(doc)
+    return {p: d["duration"] for p, d in durations.items()}
+
+
+def test_check_doc_thread_pool(get_doc_for_target):
+    docs = [get_doc_for_target(target) for target in all_targets] * 4
+    serial = [_check(doc) for doc in docs]
+
+    sbol3.set_namespace("https://example.org/unrelated/")
+    global_formulae = pysmt.shortcuts.get_env().formula_manager.formulae
+    num_global_formulae = len(global_formulae)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        concurrent = list(executor.map(_check, docs))
+
+    assert concurrent == serial
+    assert all(concurrent)
+    # No global state was touched by the checks
+    assert sbol3.get_namespace() == "https://example.org/unrelated/"
+    assert len(global_formulae) == num_global_formulae
+
+
+def test_minimum_duration_thread_pool(get_doc_for_target):
+    docs = [get_doc_for_target(target) for target in timed_targets] * 4
+    serial = [_minimum_durations(doc) for doc in docs]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        concurrent = list(executor.map(_minimum_durations, docs))
+
+    assert concurrent == serial
+
+
+def test_time_variable_symbols(get_doc_for_target):
+    graph = ActivityGraph(get_doc_for_target(timed_targets[0]))
+    protocol = next(iter(graph.protocols.values()))
+    variable = protocol.time_variables.end
+    mgr = pysmt.environment.Environment().formula_manager
+    symbol = variable.to_symbol(mgr)
+    assert symbol.symbol_name() == variable.name
+    assert symbol in graph.compile().symbols(mgr)
+    with pytest.deprecated_call():
+        assert variable.symbol == variable.to_symbol()
@@ -0,0 +1,48 @@
+"""
+Validating logs of executed schedules
+"""
+import numpy as np
+import pytest
+import labop_check.labop_check as pc
+from labop_check.constraints import Conjunction, Difference, Disjunction, ExactlyOne
+from labop_check.temporal_problem import TemporalProblem
+from labop_check.validator import ScheduleValidator
+
+
+@pytest.mark.parametrize("target", ["igem_ludox_time_draft.ttl", "igem_ludox_dual_time_draft.ttl"])
+def test_validate_logs(target, get_doc_for_target):
+    doc = get_doc_for_target(target)
+    schedule, graph = pc.check_doc(doc)
+    assert schedule
+    validator = ScheduleValidator(graph)
+
+    # Running an activity backwards violates its duration
+    activity = schedule.to_records()[0]["activity"]
+    backwards = dict(schedule.assignment)
+    backwards[f"end_{activity}"] = backwards[f"start_{activity}"] - 10.0
+    # A log with only the activity times leaves the other constraints unchecked
+    partial = {name: schedule.assignment[name] for name in [f"start_{activity}", f"end_{activity}"]}
+
+    result = validator.validate([schedule, backwards, partial])
+    assert result.slack.shape == (3, len(result.labels))
+    assert list(result.violated_logs) == [False, True, False]
+    assert all(slack < 0 for _, slack in result.violations(1))
+    assert np.isnan(result.slack[2]).any()
+    assert result.violation_counts.sum() == len(result.violations(1))
+
+    # Arrays of times give the same result
+    times = validator.timestamps([schedule, backwards, partial])
+    assert np.array_equal(validator.validate(times).violated, result.violated)
+
+
+def test_empty_clauses():
+    problem = TemporalProblem("empty")
+    start, end = problem.add_timepoint("start"), problem.add_timepoint("end")
+    problem.edges.append((start, end, [[1.0, 10.0]]))
+    # A TimeConstraints without constraints compiles to an empty conjunction
+    problem.constraints += [("empty", Conjunction([])), ("none", Disjunction([])),
+                            ("no_alternative", ExactlyOne([])),
+                            ("nested", Conjunction([Conjunction([]), Difference("start", "end", [[0.0, 5.0]])]))]
+    result = ScheduleValidator(problem).validate([{"start": 0.0, "end": 2.0}])
+    assert list(result.slack[0]) == [1.0, np.inf, -np.inf, -np.inf, 2.0]
+    assert result.violations(0) == [(("constraint", "none"), -np.inf), (("constraint", "no_alternative"), -np.inf)]
@@ -0,0 +1,53 @@
+"""
+Warm-starting checks from previous models
+"""
+import collections
+import pytest
+import labop_check.labop_check as pc
+from labop_check.activity_graph import ActivityGraph
+from labop_check.benchmark import generate_document, measure
+
+
+@pytest.mark.parametrize("target", ["igem_ludox_time_draft.ttl", "igem_ludox_dual_time_draft.ttl"])
+def test_check_with_hint(target, get_doc_for_target):
+    doc = get_doc_for_target(target)
+    schedule, graph = pc.check_doc(doc)
+    assert schedule
+    # A model of the same problem is kept as it is
+    hinted, _ = pc.check_doc(doc, hint=schedule.assignment)
+    assert hinted.assignment == pytest.approx(schedule.assignment)
+
+
+@pytest.mark.parametrize("target", ["igem_ludox_time_draft.ttl", "igem_ludox_dual_time_draft.ttl"])
+def test_minimize_with_hint(target, get_doc_for_target):
+    doc = get_doc_for_target(target)
+    problem = ActivityGraph(doc).compile()
+
+    def calls(hint=None):
+        counts = collections.Counter()
+        durations = problem.get_minimum_duration(hint=hint,
+                                                 callback=lambda protocol_id, *_: counts.update([protocol_id]))
+        return durations, counts
+
+    cold, cold_calls = calls()
+    for protocol_id, minimum in cold.items():
+        warm, warm_calls = calls(hint=minimum["result"])
+        assert warm[protocol_id]["converged"]
+        assert warm[protocol_id]["duration"] == pytest.approx(minimum["duration"], abs=0.2)
+        # The hinted duration is confirmed, and checked to be minimal, rather than searched for
+        assert warm_calls[protocol_id] < cold_calls[protocol_id]
+
+
+def test_measure_warm_phases():
+    doc = generate_document(steps=6, width=3, duration_constraints=6, disjunctive_constraints=3)
+    timings, sizes = measure(doc)
+    assert sizes["satisfiable"]
+    assert {"resolve", "minimize", "reminimize"} <= set(timings)
+
+
+def test_module_minimize_with_hint(get_doc_for_target):
+    doc = get_doc_for_target("igem_ludox_time_draft.ttl")
+    cold = pc.get_minimum_duration(doc)
+    for protocol_id, minimum in cold.items():
+        warm = pc.get_minimum_duration(doc, hint=minimum["result"], processes=1)
+        assert warm[protocol_id]["duration"] == pytest.approx(minimum["duration"], abs=0.2)